@@ -4,20 +4,29 @@
 # the cursor is a box shape of 640x640 pixels
 # This application allows you to browse files in a specified folder and open images for editing.
 # Operations in File List window:
-#   double-click: Open the selected file in the Image Editor
+#   double-click or Return: Open the selected file in the Image Editor
 #   'r' : Refresh the file list
 # Operations in Image window:
 #   'q', 'a', 'o', 'p' :  Pan the image up/down/left/right
 #   'c' :  Display crop box (hold down and move mouse button). Release and press Return to accept, ESC to abort crop
 #   '1', '2' : Set bounding box corner 1 or 2 for labeling. Press Return to accept, ESC to abort labeling
 #   'r', 'R' : Resize the image smaller or larger
+#   'l' : Print the time taken by each kind of interaction (pan, resize, ...) to the console
+# Pans and resizes are composed from cached tiles of the image (see tile_pyramid.py),
+# the full quality resize is done in the background, and replaces the view when ready.
+# The files next to the selected one are decoded in the background (see image_prefetch.py),
+# as reduced JPEG previews, the full image is decoded in the background once it is opened.
 
 
 import os
 import sys
+import time
 import tkinter as tk
+from collections import deque
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk, ImageFilter, ImageDraw, ImageOps
+import tile_pyramid
+import image_prefetch
 
 # bounding box image full path and filename
 bbox_filename = "c:/development/bbox640.png"
@@ -28,6 +37,12 @@ label_folder = "../labels"
 geomX = 1420
 geomY = 800
 folder = '.'  # default folder to display files, can be overridden by command line argument
+tile_cache_bytes = 256 * 1024 * 1024  # memory for the cached image tiles, shared by all images
+print_latency = False  # if True, the time taken by every interaction is printed to the console
+prefetch_radius = 2  # files on each side of the selected one that are decoded in the background
+prefetch_workers = 2  # decoding threads
+prefetch_bytes = 256 * 1024 * 1024  # memory for the decoded previews
+image_extensions = ['jpg', 'jpeg', 'png', 'bmp']
 
 # Info Class that displays information about the image editor and file selector in a text widget in a separate window
 class Info(tk.Toplevel):
@@ -42,13 +57,14 @@ class Info(tk.Toplevel):
         info_text = """Image Editor and File Selector
 This application allows you to browse files in a specified folder and open images for editing.
 Operations in File List window:
-  double-click: Open the selected file in the Image Editor
+  double-click or Return: Open the selected file in the Image Editor
   'r' : Refresh the file list
 Operations in Image window:
   'q', 'a', 'o', 'p' :  Pan the image up/down/left/right
   'c' :  Display crop box (hold down and move mouse button). Release and press Return to accept, ESC to abort crop
   '1', '2' : Set bounding box corner 1 or 2 for labeling. Press Return to accept, ESC to abort labeling
   'r', 'R' : Resize the image smaller or larger
+  'l' : Print the time taken by each kind of interaction to the console
 For more information, please refer to the documentation."""
         self.text_widget = tk.Text(self, wrap="word")
         self.text_widget.insert(tk.END, info_text)
@@ -102,6 +118,9 @@ class FileSelector(tk.Toplevel):
 
         # bind double-click event to call open_file method
         self.file_listbox.bind("<Double-Button-1>", self.open_file)
+        self.file_listbox.bind("<Return>", self.open_file)
+        # decode the files around a new selection in the background
+        self.file_listbox.bind("<<ListboxSelect>>", self.prefetch_neighbours)
         
 
     def refresh_file_list(self, event=None):
@@ -127,6 +146,19 @@ class FileSelector(tk.Toplevel):
                 self.editor.open_image_filepath(selected_file)  # use the method to open image by file path
             except Exception as e:
                 messagebox.showerror("Error", f"Could not open file: {e}")
+            self.prefetch_neighbours()
+
+    # decode the selected file and the files next to it in the background, nearest first
+    def prefetch_neighbours(self, event=None):
+        selection = self.file_listbox.curselection()
+        if not self.editor or not selection:
+            return
+        files = self.file_listbox.get(0, tk.END)
+        index = selection[0]
+        order = [index] + [index + d for n in range(1, prefetch_radius + 1) for d in (n, -n)]
+        paths = [files[i] for i in order
+                 if 0 <= i < len(files) and files[i].rsplit('.', 1)[-1].lower() in image_extensions]
+        self.editor.prefetcher.prefetch(paths)
 
 
 # Image Editor Class
@@ -135,7 +167,8 @@ class ImageEditor:
         self.root = root
         self.root.title("Image Editor")
         self.file_path = None  # path to the currently opened image file
-        self.originalImage = None
+        self.pyramid = None  # tile_pyramid.TilePyramid of the opened image
+        self.scaledSize = (0, 0)  # size of the image at resize_factor
         self.image = None
         self.image_label = tk.Label(self.root)
         self.image_label.pack()
@@ -173,9 +206,16 @@ class ImageEditor:
         self.root.bind("<Key-2>", self.labelPos2_choose)
         self.root.bind("<r>", self.resize_smaller)
         self.root.bind("<R>", self.resize_larger)
+        self.root.bind("<l>", self.print_latency_summary)
+        self.latency = {}  # interaction name -> deque of recent times in seconds
+        self.full_quality_pending = False  # True while waiting for the background full quality resize
         
+        # background decoding of the files around the selection in the file selector
+        self.prefetcher = image_prefetch.Prefetcher(preview_size=(geomX, geomX), workers=prefetch_workers,
+                                                    max_bytes=prefetch_bytes)
         # file selector
         self.file_selector = FileSelector(self.root)
+        self.file_selector.editor = self
         # store the red crop overlay box image in self.overlayImage
         self.overlayImage = Image.open(bbox_filename)
         # create the Info window
@@ -186,9 +226,7 @@ class ImageEditor:
             return
         if self.tool == "crop":
             # get the original image at the current pan display position
-            self.image = self.originalImage.crop((self.displayPosition[0], self.displayPosition[1],
-                                                        min(self.originalImage.width, geomX + self.displayPosition[0]),
-                                                        min(self.originalImage.height, geomY + self.displayPosition[1])))
+            self.image = self.view_image()
             self.display_image()
             self.tool = "notool"
             return
@@ -197,9 +235,7 @@ class ImageEditor:
             self.labelPosition = (0, 0, 0, 0)  # reset label position
             self.labelBoxCandidate = ((self.crop_size[0] // 2)-10, (self.crop_size[1] // 2)-10, (self.crop_size[0] // 2)+10, (self.crop_size[1] // 2)+10)
             # get the original image at the current pan display position
-            self.image = self.originalImage.crop((self.displayPosition[0], self.displayPosition[1],
-                                                      min(self.originalImage.width, geomX + self.displayPosition[0]),
-                                                      min(self.originalImage.height, geomY + self.displayPosition[1])))
+            self.image = self.view_image()
             self.read_labelfile()  # read the label file if it exists, and set self.labelPosition
             self.display_image()  # refresh the image display
             self.tool = "notool"  # reset the tool after exiting
@@ -209,9 +245,11 @@ class ImageEditor:
             messagebox.showinfo("Info", "No tool selected, nothing to action.")
             return
         if self.tool == "crop":
-            self.image = self.originalImage.crop((self.displayPosition[0], self.displayPosition[1],
-                                                      min(self.originalImage.width, geomX + self.displayPosition[0]),
-                                                      min(self.originalImage.height, geomY + self.displayPosition[1])))
+            try:
+                self.image = self.view_image(full_quality=True)
+            except Exception as e:
+                messagebox.showerror("Error", f"Could not load the full image: {e}")
+                return
             # crop the image
             if self.crop_location[0] < 0 or self.crop_location[1] < 0:
                 messagebox.showwarning("Warning", "Crop location is out of bounds.")
@@ -274,11 +312,11 @@ class ImageEditor:
             self.tool = "notool"  # reset the tool after action
 
     def labelPos_choose(self, cornerNum = 0):
-        if not self.originalImage:
+        if not self.pyramid:
             messagebox.showwarning("Warning", "No image to label.")
             return
         # check the image size is equal to the crop size
-        if self.originalImage.width != self.crop_size[0] or self.originalImage.height != self.crop_size[1]:
+        if self.scaledSize[0] != self.crop_size[0] or self.scaledSize[1] != self.crop_size[1]:
             messagebox.showwarning("Warning", "Crop to the correct size first!")
             return
         if self.tool == "notool":
@@ -298,9 +336,7 @@ class ImageEditor:
             self.labelBoxCandidate = (self.labelBoxCandidate[0], self.labelBoxCandidate[1], x, y)  # update the opposite corner
         # print(f"labelBoxCandidate: {self.labelBoxCandidate}")
         # get the original image at the current pan display position
-        self.image = self.originalImage.crop((self.displayPosition[0], self.displayPosition[1],
-                                                      min(self.originalImage.width, geomX + self.displayPosition[0]),
-                                                      min(self.originalImage.height, geomY + self.displayPosition[1])))
+        self.image = self.view_image()
         
         width = abs(self.labelBoxCandidate[2] - self.labelBoxCandidate[0])  # width of the label box
         height = abs(self.labelBoxCandidate[3] - self.labelBoxCandidate[1])
@@ -316,7 +352,7 @@ class ImageEditor:
         self.labelPos_choose(2)
 
     def crop_choose(self, event=None):
-        if not self.originalImage:
+        if not self.pyramid:
             messagebox.showwarning("Warning", "No image to crop.")
             return
         if self.tool == "notool":
@@ -329,9 +365,7 @@ class ImageEditor:
         x -= self.root.winfo_rootx()
         y -= self.root.winfo_rooty()
         # get the original image at the current pan display position
-        self.image = self.originalImage.crop((self.displayPosition[0], self.displayPosition[1],
-                                                      min(self.originalImage.width, geomX + self.displayPosition[0]),
-                                                      min(self.originalImage.height, geomY + self.displayPosition[1])))
+        self.image = self.view_image()
         # overlay image at the mouse pointer position
         x -= self.crop_size[0] // 2
         y -= self.crop_size[1] // 2
@@ -346,7 +380,8 @@ class ImageEditor:
         self.handle_resize(1)
 
     def handle_resize(self, direction):
-        if not self.originalImage:
+        start = time.perf_counter()
+        if not self.pyramid:
             messagebox.showwarning("Warning", "No image to resize.")
             return
         if self.tool != "notool":
@@ -364,71 +399,72 @@ class ImageEditor:
             scale = 1.0  # reset to default scale
         
         # check that the new proposed resize scale is not too small
-        if scale * self.originalImage.width < self.crop_size[0]:
+        if self.pyramid.size(scale)[0] < self.crop_size[0]:
             messagebox.showwarning("Warning", "Image width is too small, cannot resize smaller.")
             return
-        if scale * self.originalImage.height < self.crop_size[1]:
+        if self.pyramid.size(scale)[1] < self.crop_size[1]:
             messagebox.showwarning("Warning", "Image height is too small, cannot resize smaller.")
             return
         
-        self.originalImage = Image.open(self.file_path) # work on file image for best quality
-        self.originalImage = ImageOps.exif_transpose(self.originalImage)  # handle EXIF orientation
-        self.originalImage = self.originalImage.resize((int(self.originalImage.width * scale),
-                                                       int(self.originalImage.height * scale)),
-                                                      Image.Resampling.LANCZOS)
+        # the view is composed from quick tiles at once, the full quality (LANCZOS) resize of the
+        # full size image is done in the background, and then replaces the view
         self.resize_factor = scale
+        self.scaledSize = self.pyramid.size(scale)
+        self.pyramid.request_full(scale)
         self.reset_position_vars()  # reset position variables
-        self.orig2croppedImage() # copy originalImage to self.image and crop it at displayPosition origin to fit window geometry
-        self.set_title(self.originalImage.width, self.originalImage.height)
+        self.orig2croppedImage() # crop the image at this scale at displayPosition origin to fit window geometry
+        self.set_title(self.scaledSize[0], self.scaledSize[1])
         self.read_labelfile()  # read the label file if it exists, and set self.labelPosition
         self.display_image()
+        self.record_latency("resize_larger" if direction == 1 else "resize_smaller", start)
+        self.wait_full_quality()
 
 
     def pan_left(self, event=None):
-        if self.originalImage:
+        start = time.perf_counter()
+        if self.pyramid:
             # move the displayPosition to the left by 100 pixels
             if self.displayPosition[0] >= 100:
                 self.displayPosition = (self.displayPosition[0] - 100, self.displayPosition[1])
-                self.image = self.originalImage.crop((self.displayPosition[0], self.displayPosition[1],
-                                                      min(self.originalImage.width, geomX + self.displayPosition[0]),
-                                                      min(self.originalImage.height, geomY + self.displayPosition[1])))
+                self.image = self.view_image()
                 self.display_image()
+                self.record_latency("pan_left", start)
             else:
                 # cannot pan left, already at the edge
                 pass
     def pan_right(self, event=None):
-        if self.originalImage:
+        start = time.perf_counter()
+        if self.pyramid:
             # move the displayPosition to the right by 100 pixels
-            if self.displayPosition[0] + geomX <= self.originalImage.width - 100:
+            if self.displayPosition[0] + geomX <= self.scaledSize[0] - 100:
                 self.displayPosition = (self.displayPosition[0] + 100, self.displayPosition[1])
-                self.image = self.originalImage.crop((self.displayPosition[0], self.displayPosition[1],
-                                                      min(self.originalImage.width, geomX + self.displayPosition[0]),
-                                                      min(self.originalImage.height, geomY + self.displayPosition[1])))
+                self.image = self.view_image()
                 self.display_image()
+                self.record_latency("pan_right", start)
             else:
                 # cannot pan right, already at the edge
                 pass
     def pan_up(self, event=None):
-        if self.originalImage:
+        start = time.perf_counter()
+        if self.pyramid:
             # move the displayPosition up by 100 pixels
             if self.displayPosition[1] >= 100:
                 self.displayPosition = (self.displayPosition[0], self.displayPosition[1] - 100)
-                self.image = self.originalImage.crop((self.displayPosition[0], self.displayPosition[1],
-                                                      min(self.originalImage.width, geomX + self.displayPosition[0]),
-                                                      min(self.originalImage.height, geomY + self.displayPosition[1])))
+                self.image = self.view_image()
                 self.display_image()
+                self.record_latency("pan_up", start)
             else:
                 # cannot pan up, already at the edge
                 pass
     def pan_down(self, event=None):
-        if self.originalImage:
+        start = time.perf_counter()
+        if self.pyramid:
             # move the displayPosition down by 100 pixels
-            if self.displayPosition[1] + geomY <= self.originalImage.height - 100:
+            if self.displayPosition[1] + geomY <= self.scaledSize[1] - 100:
                 self.displayPosition = (self.displayPosition[0], self.displayPosition[1] + 100)
-                self.image = self.originalImage.crop((self.displayPosition[0], self.displayPosition[1],
-                                                      min(self.originalImage.width, geomX + self.displayPosition[0]),
-                                                      min(self.originalImage.height, geomY + self.displayPosition[1])))
+                self.image = self.view_image()
                 self.display_image()
+                self.record_latency("pan_down", start)
             else:
                 # cannot pan down, already at the edge
                 pass
@@ -478,11 +514,56 @@ class ImageEditor:
             self.root.title(f"No image opened")
 
     def orig2croppedImage(self):
-        self.image = self.originalImage.copy()
-        if self.image.width > geomX or self.image.height > geomY:
-            self.image = self.image.crop((self.displayPosition[0], self.displayPosition[1],
-                                            min(self.image.width, geomX + self.displayPosition[0]),
-                                            min(self.image.height, geomY + self.displayPosition[1])))
+        self.image = self.view_image()
+
+    # the image at resize_factor, cropped at the current pan display position to fit the window
+    # composed from the cached tiles, or with full_quality=True from the full quality resize
+    # (made now if the background has not finished it), for cropping and saving
+    # raises the error of the background load if the full image could not be loaded
+    def view_image(self, full_quality=False):
+        x, y = self.displayPosition
+        if full_quality:
+            if self.pyramid.load_error() is not None:
+                raise self.pyramid.load_error()  # loading it again here would only fail again
+            full = self.pyramid.full_image(self.resize_factor)
+            return full.crop((x, y, min(full.width, geomX + x), min(full.height, geomY + y)))
+        return self.pyramid.view(self.resize_factor, x, y, geomX, geomY)
+
+    # shows the full quality view once the background resize has finished
+    def wait_full_quality(self):
+        if self.full_quality_pending:
+            return  # already polling
+        self.full_quality_pending = True
+        self.poll_full_quality()
+
+    def poll_full_quality(self):
+        if not self.pyramid or self.pyramid.load_error() is not None:
+            self.full_quality_pending = False  # if the full image could not be loaded, the preview stays
+            return
+        if not self.pyramid.full_ready(self.resize_factor):
+            self.root.after(50, self.poll_full_quality)
+            return
+        self.full_quality_pending = False
+        if self.tool == "notool":  # a tool draws on the current view, leave it alone
+            start = time.perf_counter()
+            self.image = self.view_image()
+            self.display_image()
+            self.record_latency("full_quality", start)
+
+    def record_latency(self, name, start):
+        elapsed = time.perf_counter() - start
+        self.latency.setdefault(name, deque(maxlen=1000)).append(elapsed)
+        if print_latency:
+            print(f"{name}: {elapsed * 1000:.1f} ms")
+
+    def print_latency_summary(self, event=None):
+        for name, times in sorted(self.latency.items()):
+            ordered = sorted(times)
+            p50 = ordered[len(ordered) // 2]
+            p99 = ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+            print(f"{name:<16} {len(ordered):5d} times  p50 {p50 * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms")
+        print(tile_pyramid.default_cache.stats())
+        print(self.prefetcher.stats())
     def reset_position_vars(self):
         self.displayPosition = (0, 0)  # reset display position
         self.labelPosition = (0, 0, 0, 0)  # reset label position
@@ -493,19 +574,28 @@ class ImageEditor:
         if not os.path.isfile(file_path):
             messagebox.showerror("Error", "File does not exist.")
             return
+        start = time.perf_counter()
         try:
             self.file_path = file_path  # store the file path
-            self.originalImage = Image.open(file_path)
+            # EXIF orientation applied, usually already decoded by the prefetcher, for a JPEG
+            # at a reduced size, the full image is then decoded by the pyramid in the background
+            preview, full_size = self.prefetcher.preview(file_path)
         except Exception as e:
             messagebox.showerror("Error", f"Could not open image: {e}")
             return
-        self.originalImage = ImageOps.exif_transpose(self.originalImage)  # handle EXIF orientation
+        if self.pyramid:
+            self.pyramid.close()  # frees the tiles of the previous image
+        self.pyramid = tile_pyramid.TilePyramid(preview, min_size=(geomX, geomY), full_size=full_size,
+                                                loader=lambda: image_prefetch.load_full(file_path))
         self.resize_factor = 1.0 # reset resize factor
+        self.scaledSize = self.pyramid.size(1.0)
         self.reset_position_vars()  # reset position variables
-        self.orig2croppedImage() # copy originalImage to self.image and crop it at displayPosition origin to fit window geometry
-        self.set_title(self.originalImage.width, self.originalImage.height)
+        self.orig2croppedImage() # crop the image at displayPosition origin to fit window geometry
+        self.set_title(self.scaledSize[0], self.scaledSize[1])
         self.read_labelfile()  # read the label file if it exists, and set self.labelPosition
         self.display_image()
+        self.record_latency("open", start)
+        self.wait_full_quality()  # shows the full image once it has been decoded
 
     def open_image(self):
         file_path = filedialog.askopenfilename(filetypes=[("Image files", "*.jpg *.jpeg *.png *.bmp")])
@@ -523,7 +613,9 @@ class ImageEditor:
                                                   filetypes=[("JPEG files", "*.jpg;*.jpeg"), ("PNG files", "*.png")])
         if file_path:
             try:
-                self.image.save(file_path)
+                # the view as shown, but from the full image (the display may still be a preview)
+                image = self.view_image(full_quality=True) if self.tool == "notool" else self.image
+                image.save(file_path)
                 messagebox.showinfo("Success", "Image saved successfully.")
             except Exception as e:
                 messagebox.showerror("Error", f"Could not save image: {e}")
@@ -532,6 +624,10 @@ class ImageEditor:
         if not self.image:
             return
         self.draw_label_box()  # draw the label box on the image if labelPosition is set
+        img_tk = self.image_label.image if hasattr(self.image_label, "image") else None
+        if img_tk is not None and (img_tk.width(), img_tk.height()) == self.image.size:
+            img_tk.paste(self.image)  # same size, so the existing Tk image is updated in place
+            return
         img_tk = ImageTk.PhotoImage(self.image)
         self.image_label.config(image=img_tk)
         self.image_label.image = img_tk
@@ -560,6 +656,7 @@ class ImageEditor:
 # image path is passed as a command line argument
 def main():
     global folder
+    tile_pyramid.default_cache.max_bytes = tile_cache_bytes
     # check that the labels folder exists
     if not os.path.exists(label_folder):
         print(f"Error: labels folder '{label_folder}' does not exist.")
@@ -0,0 +1,121 @@
+# Background decoding of the images next to the one selected in the file list
+# rev 1 - shabaz - August 2025
+
+# A thread pool decodes the neighbours of the selected file, so that opening the
+# next image does not wait for its decode. For the on-screen preview a JPEG is
+# decoded with Image.draft(), which lets libjpeg decode it at 1/2, 1/4 or 1/8 of
+# its size, the smallest that is still at least preview_size, and is several
+# times faster than a full decode. Other formats are decoded in full. The
+# previews are kept in an LRU cache bounded by bytes. The full size image is
+# only decoded for the image being worked on (load_full()), it is not cached.
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+
+EXIF_ORIENTATION = 0x0112
+
+
+# returns the preview image (EXIF orientation applied) and the size of the full image
+def decode_preview(path, preview_size):
+    im = Image.open(path)
+    full_size = im.size
+    if im.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+        full_size = (full_size[1], full_size[0])  # rotated by 90 degrees
+    if im.format == "JPEG":
+        im.draft(im.mode, preview_size)
+    im = ImageOps.exif_transpose(im)  # also loads the image
+    return im, full_size
+
+
+def load_full(path):
+    im = Image.open(path)
+    return ImageOps.exif_transpose(im)
+
+
+class Prefetcher:
+    # preview_size is the smallest size a preview is decoded at, a square of the window
+    # width so that it is also large enough for a rotated image
+    # max_bytes is the memory for the cached previews, the least recently used are dropped
+    def __init__(self, preview_size=(1420, 1420), workers=2, max_bytes=256 * 1024 * 1024):
+        self.preview_size = preview_size
+        self.max_bytes = max_bytes
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Prefetch")
+        self.previews = OrderedDict()  # path -> (preview, full_size, bytes)
+        self.futures = {}  # path -> Future of a decode that has not finished
+        self.bytes = 0
+        self.lock = threading.Lock()
+        # counters
+        self.hits = 0
+        self.waits = 0  # the preview was still being decoded
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+
+    # the preview image and the full size of path, decoded now unless it was prefetched
+    def preview(self, path):
+        with self.lock:
+            entry = self.previews.get(path)
+            if entry is not None:
+                self.previews.move_to_end(path)
+                self.hits += 1
+                return entry[0], entry[1]
+            future = self.futures.get(path)
+            if future is not None and future.cancel():
+                del self.futures[path]  # not started yet, it is decoded here instead
+                future = None
+            if future is not None:
+                self.waits += 1
+            else:
+                self.misses += 1
+        if future is not None:
+            try:
+                return future.result()
+            except Exception:
+                pass  # decoded again below, so that the error is raised to the caller
+        preview, full_size = decode_preview(path, self.preview_size)
+        self._put(path, preview, full_size)
+        return preview, full_size
+
+    # decodes the previews of paths in the background, in order
+    # decodes that were queued for other paths and have not started yet are cancelled
+    def prefetch(self, paths):
+        with self.lock:
+            for path, future in list(self.futures.items()):
+                if path not in paths and future.cancel():
+                    del self.futures[path]
+            for path in paths:
+                if path not in self.previews and path not in self.futures:
+                    self.futures[path] = self.pool.submit(self._decode, path)
+
+    def stats(self):
+        with self.lock:
+            return {"previews": len(self.previews), "bytes": self.bytes, "hits": self.hits, "waits": self.waits,
+                    "misses": self.misses, "evictions": self.evictions, "errors": self.errors,
+                    "queued": len(self.futures)}
+
+    def _decode(self, path):
+        try:
+            preview, full_size = decode_preview(path, self.preview_size)
+        except Exception:
+            with self.lock:
+                self.errors += 1  # e.g. not an image, the error is shown if it is opened
+                self.futures.pop(path, None)
+            raise
+        self._put(path, preview, full_size)
+        return preview, full_size
+
+    def _put(self, path, preview, full_size):
+        size = preview.width * preview.height * len(preview.getbands())
+        with self.lock:
+            self.futures.pop(path, None)
+            old = self.previews.pop(path, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self.previews[path] = (preview, full_size, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes and len(self.previews) > 1:
+                _, (_, _, dropped) = self.previews.popitem(last=False)
+                self.bytes -= dropped
+                self.evictions += 1
@@ -0,0 +1,290 @@
+# Tile pyramid for panning and zooming large images in the image editor
+# rev 1 - shabaz - August 2025
+# rev 2 - shabaz - August 2025 - can start from a reduced preview of the image
+# rev 3 - shabaz - August 2025 - one background thread for all pyramids
+
+# The image is kept as a pyramid of scale levels (1, 1/2, 1/4, ... made with
+# Image.reduce(), down to about the window size), and the view at any zoom scale
+# is composed of tile_size x tile_size tiles of the image at that scale. A tile
+# is made by resizing the matching region of the smallest level that is still
+# at least as large as the zoom scale (BILINEAR, so only the pixels of the tile
+# are resampled), and kept in a TileCache, an LRU cache bounded by bytes. So a
+# pan only makes the tiles that come into view, and going back to a zoom scale
+# reuses its tiles.
+# The full quality image at the zoom scale (a LANCZOS resize of the full size
+# image, as the editor did before) is made by a background thread, once it is
+# ready its tiles replace the quick ones. It is also what gets cropped and saved.
+# The pyramid can also be made from a reduced preview of the image (see
+# image_prefetch.py), with the size of the full image and a loader function that
+# returns the full image. The tiles are then made from the preview, and the
+# background thread first loads the full image, which then replaces the preview.
+# One background thread (FullQualityWorker) serves all the pyramids, the most
+# recently requested first, and skips the pyramids that have been closed, so
+# skipping through files does not stack up full size decodes. If the full image
+# cannot be loaded, load_error() tells why, and the preview is all there is.
+
+import itertools
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+
+# LRU cache of tiles, the least recently used are dropped once they take more than max_bytes
+class TileCache:
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.tiles = OrderedDict()  # key -> (tile, bytes)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.tiles.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.tiles.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, tile):
+        size = tile.width * tile.height * len(tile.getbands())
+        with self.lock:
+            old = self.tiles.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.tiles[key] = (tile, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes and len(self.tiles) > 1:
+                _, (_, dropped) = self.tiles.popitem(last=False)
+                self.bytes -= dropped
+                self.evictions += 1
+
+    # removes the tiles whose key starts with prefix
+    def drop(self, prefix):
+        n = len(prefix)
+        with self.lock:
+            for key in [k for k in self.tiles if k[:n] == prefix]:
+                self.bytes -= self.tiles.pop(key)[1]
+
+    def stats(self):
+        with self.lock:
+            return {"tiles": len(self.tiles), "bytes": self.bytes, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions}
+
+
+# the thread that loads the full images and makes the full quality images of the pyramids
+class FullQualityWorker:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.queue = []  # pyramids with work to do, the most recently requested last
+        self.thread = None
+
+    # pyramid has work to do, it goes ahead of the pyramids requested before
+    def request(self, pyramid):
+        with self.cond:
+            if pyramid in self.queue:
+                self.queue.remove(pyramid)
+            self.queue.append(pyramid)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="FullQuality", daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def cancel(self, pyramid):
+        with self.cond:
+            if pyramid in self.queue:
+                self.queue.remove(pyramid)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                pyramid = self.queue.pop()
+            pyramid._work()
+
+
+default_cache = TileCache()
+default_worker = FullQualityWorker()
+_pyramid_ids = itertools.count()
+
+
+# zoom scales are steps of 0.1, rounded so that 1.0 - 0.1 + 0.1 is the same scale as 1.0
+def scale_key(scale):
+    return round(scale, 2)
+
+
+class TilePyramid:
+    # levels are made down to about min_size (the window size)
+    # if image is a reduced preview, full_size is the size of the full image and loader() returns it
+    def __init__(self, image, cache=None, tile_size=256, min_size=(1420, 800), full_size=None, loader=None,
+                 worker=None):
+        self.cache = cache or default_cache
+        self.worker = worker or default_worker
+        self.tile_size = tile_size
+        self.min_size = min_size
+        self.id = next(_pyramid_ids)
+        self.full_size = full_size or image.size
+        self.loader = loader
+        self.image = None  # the full size image (L, RGB or RGBA, as the levels), None until loaded
+        self.levels = self._make_levels(image)
+        self.load_lock = threading.Lock()
+        self.full = None  # (scale_key, full quality image at that scale)
+        self.pending = None  # scale of the full quality image to make next
+        self.error = None  # the exception of the background load of the full image, if it failed
+        self.cond = threading.Condition()
+        self.running = True
+        if image.size == self.full_size:
+            self.image = self.levels[0]
+        elif loader is None:
+            raise ValueError("a loader is needed for a reduced preview")
+        else:
+            self.worker.request(self)
+
+    # the size of the image at scale, as the editor computed it for its LANCZOS resize
+    def size(self, scale):
+        return int(self.full_size[0] * scale), int(self.full_size[1] * scale)
+
+    # True once the full size image has been loaded
+    def loaded(self):
+        return self.image is not None
+
+    # the exception the background load of the full image failed with, None if it has not failed
+    def load_error(self):
+        return self.error
+
+    # the region (x, y, x + width, y + height) of the image at scale, clipped to the image,
+    # composed from the tiles (a new image, so it can be drawn on)
+    def view(self, scale, x, y, width, height):
+        w, h = self.size(scale)
+        x1, y1 = min(w, x + width), min(h, y + height)
+        t = self.tile_size
+        canvas = None
+        for ty in range(y // t, (y1 + t - 1) // t):
+            for tx in range(x // t, (x1 + t - 1) // t):
+                tile = self.tile(scale, tx, ty)
+                if canvas is None:
+                    canvas = Image.new(tile.mode, (max(0, x1 - x), max(0, y1 - y)))
+                canvas.paste(tile, (tx * t - x, ty * t - y))
+        return canvas if canvas is not None else Image.new(self.levels[0].mode, (max(0, x1 - x), max(0, y1 - y)))
+
+    # tile (tx, ty) of the image at scale
+    # the key says if it is a full quality tile, so a quick tile that is still being made when
+    # the full quality image becomes ready is never used in place of a full quality one
+    def tile(self, scale, tx, ty):
+        full = self.full
+        full = full[1] if full is not None and full[0] == scale_key(scale) else None
+        levels = self.levels
+        exact = full is not None or (scale_key(scale) == 1.0 and levels[0].size == self.full_size)
+        key = (self.id, scale_key(scale), exact, tx, ty)
+        tile = self.cache.get(key)
+        if tile is not None:
+            return tile
+        w, h = self.size(scale)
+        t = self.tile_size
+        box = (tx * t, ty * t, min(w, (tx + 1) * t), min(h, (ty + 1) * t))
+        if full is not None:
+            tile = full.crop(box)
+        elif exact:
+            tile = levels[0].crop(box)
+        else:
+            level = levels[0]  # enlarged if it is a preview smaller than the image at scale
+            for candidate in levels[1:]:
+                if candidate.width < w or candidate.height < h:
+                    break
+                level = candidate
+            fx, fy = level.width / w, level.height / h
+            tile = level.resize((box[2] - box[0], box[3] - box[1]), Image.Resampling.BILINEAR,
+                                box=(box[0] * fx, box[1] * fy, box[2] * fx, box[3] * fy))
+        self.cache.put(key, tile)
+        return tile
+
+    # start making the full quality image at scale in the background, a later request replaces this one
+    def request_full(self, scale):
+        with self.cond:
+            if self.full is not None and self.full[0] == scale_key(scale):
+                return
+            self.pending = scale
+        self.worker.request(self)
+
+    def full_ready(self, scale):
+        full = self.full
+        if scale_key(scale) == 1.0:
+            return self.loaded()
+        return full is not None and full[0] == scale_key(scale)
+
+    # the full quality image at scale, made now if the background thread has not made it yet
+    def full_image(self, scale):
+        self._load()
+        if scale_key(scale) == 1.0:
+            return self.image
+        full = self.full
+        if full is not None and full[0] == scale_key(scale):
+            return full[1]
+        with self.cond:
+            if self.pending is not None and scale_key(self.pending) == scale_key(scale):
+                self.pending = None
+        self._make_full(scale)
+        return self.full[1]
+
+    # drops the background work not started yet and removes the tiles from the cache
+    # (a load or resize already running finishes, its result is not kept)
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.pending = None
+        self.worker.cancel(self)
+        self.cache.drop((self.id,))
+        self.full = None
+
+    def _make_levels(self, image):
+        base = image if image.mode in ("L", "RGB", "RGBA") else image.convert("RGBA" if "A" in image.mode else "RGB")
+        levels = [base]
+        while levels[-1].width >= 2 * self.min_size[0] and levels[-1].height >= 2 * self.min_size[1]:
+            levels.append(levels[-1].reduce(2))
+        return levels
+
+    # loads the full size image if the pyramid was made from a preview, it replaces the preview
+    def _load(self):
+        with self.load_lock:
+            if self.image is not None:
+                return
+            image = self.loader()
+            levels = self._make_levels(image)
+            with self.cond:
+                if not self.running:
+                    return  # closed meanwhile
+                self.levels = levels
+                self.image = levels[0]
+            self.cache.drop((self.id,))  # the tiles made from the preview
+
+    def _make_full(self, scale):
+        self._load()
+        full = self.image.resize(self.size(scale), Image.Resampling.LANCZOS)
+        with self.cond:
+            if not self.running:
+                return
+            self.full = (scale_key(scale), full)
+        self.cache.drop((self.id, scale_key(scale), False))  # the quick tiles of this scale
+
+    # the background work, called from the worker thread
+    def _work(self):
+        if not self.running:
+            return
+        if self.image is None and self.error is None:
+            try:
+                self._load()
+            except Exception as e:
+                self.error = e
+                print(f"Could not load the full image: {e}")
+        with self.cond:
+            if not self.running or self.image is None:
+                return
+            scale, self.pending = self.pending, None
+        if scale is not None and scale_key(scale) != 1.0:
+            self._make_full(scale)
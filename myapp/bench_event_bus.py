@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# Throughput benchmark of the plate event bus
+# rev 0.1 - shabaz - August 2025
+
+# Publishes events with a JPEG-sized blob to a number of fast subscribers and
+# one slow one, and reports the publish rate, the events received by each
+# subscriber and the events dropped for subscribers that could not keep up.
+# example:
+#   python bench_event_bus.py --events 20000 --subscribers 3 --blob 8000
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import event_bus
+
+
+def subscribe(path, received, index, delay, ready):
+    sub = event_bus.Subscriber(path)
+    ready.release()
+    count = 0
+    for event, blob in sub:
+        if event.get("end"):
+            break
+        count += 1
+        if delay:
+            time.sleep(delay)
+    received[index] = count
+    sub.close()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Throughput of the plate event bus")
+    p.add_argument("--events", type=int, default=20000)
+    p.add_argument("--subscribers", type=int, default=2, help="fast subscribers")
+    p.add_argument("--slow-delay", type=float, default=0.005, help="seconds per event of the slow subscriber (0: none)")
+    p.add_argument("--blob", type=int, default=8000, help="bytes of inline JPEG per event")
+    p.add_argument("--rate", type=float, default=0, help="events per second to publish at (0: as fast as possible)")
+    p.add_argument("--buffer", type=int, default=256, help="events buffered per subscriber")
+    p.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = p.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.sock")
+    bus = event_bus.EventBus(path, buffer_events=args.buffer)
+    delays = [0.0] * args.subscribers + ([args.slow_delay] if args.slow_delay > 0 else [])
+    received = [0] * len(delays)
+    ready = threading.Semaphore(0)
+    threads = [threading.Thread(target=subscribe, args=(path, received, i, d, ready)) for i, d in enumerate(delays)]
+    for t in threads:
+        t.start()
+    for _ in threads:
+        ready.acquire()
+    while bus.stats()["subscribers"] < len(threads):
+        time.sleep(0.01)
+
+    blob = os.urandom(args.blob)
+    start = time.perf_counter()
+    spent = 0.0  # time inside publish()
+    for i in range(args.events):
+        if args.rate > 0:
+            delay = start + i / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        t = time.perf_counter()
+        bus.publish({"ts": time.time(), "stream_id": 0, "track_id": i, "box": [100, 200, 300, 260]}, blob)
+        spent += time.perf_counter() - t
+    publish_time = time.perf_counter() - start
+    # the end marker is re-sent until every subscriber has seen it (the slow one may drop it)
+    while any(t.is_alive() for t in threads):
+        bus.publish({"end": True})
+        time.sleep(0.05)
+    total_time = time.perf_counter() - start
+    stats = bus.stats()
+    bus.close()
+
+    result = {
+        "events": args.events,
+        "blob_bytes": args.blob,
+        "publish_per_sec": round(args.events / publish_time, 1),
+        "publish_us": round(spent / args.events * 1e6, 2),
+        "delivered_per_sec": round(sum(received[:args.subscribers]) / total_time, 1),
+        "received": received,
+        "dropped": stats["dropped"],
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"published {args.events} events of {args.blob} bytes at {result['publish_per_sec']}/s "
+          f"({result['publish_us']} us spent in each publish)")
+    for i, count in enumerate(received):
+        kind = "slow" if i >= args.subscribers else "fast"
+        print(f"  subscriber {i} ({kind}): received {count}")
+    print(f"  delivered to fast subscribers at {result['delivered_per_sec']}/s, dropped {stats['dropped']} in total")
+
+
+if __name__ == "__main__":
+    main()
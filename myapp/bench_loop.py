@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# Benchmark of the inference_loop post-processing without Metis hardware
+# rev 0.1 - shabaz - August 2025
+
+# Runs myapp.inference_loop (headless) on a synthetic stream, or on a recording
+# made with myapp.py --record, and reports frames/sec and per-stage latency.
+# With --display each run is done twice with a replay.OffscreenWindow as the
+# display, rendering every frame and then decimated (--display-every and/or
+# --display-fps), so the gain of the decimation can be compared.
+# example:
+#   python bench_loop.py --vehicles 1 5 20 50 --frames 600
+#   python bench_loop.py --replay run1.jsonl.gz
+#   python bench_loop.py --vehicles 5 --display --display-every 4
+
+import argparse
+import contextlib
+import json
+import os
+import tempfile
+import time
+import myapp
+import crop_encoder
+import replay
+import shm_pool
+import stage_metrics
+
+
+# display is None for a headless run, or (display_every, display_fps) to render to an OffscreenWindow
+def run(stream, crop_folder, verbose=False, lag_budget=0.0, motion_threshold=0.0, post_workers=0, display=None):
+    myapp.crop_folder = crop_folder
+    myapp.lag_budget = lag_budget
+    myapp.motion.threshold = motion_threshold
+    myapp.metrics = stage_metrics.Metrics()
+    if post_workers > 0:
+        myapp.post_pool = shm_pool.ShmPool(post_workers, queue_depth=myapp.encoder_queue_depth,
+                                           quality=myapp.crop_quality, metrics=myapp.metrics,
+                                           on_written=myapp.plate_written)
+        myapp.encoder = myapp.post_pool
+    else:
+        myapp.post_pool = None
+        myapp.encoder = crop_encoder.CropEncoder(myapp.encoder_queue_depth, myapp.encoder_workers,
+                                                 myapp.crop_quality, myapp.metrics, on_written=myapp.plate_written)
+    window = None
+    if display is not None:
+        myapp.display_every, myapp.display_fps = display
+        window = replay.OffscreenWindow()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(devnull)
+        with quiet:
+            myapp.inference_loop(window, stream, None)
+    elapsed = time.perf_counter() - start
+    myapp.encoder.close()
+    frames = sum(myapp.metrics.frame_totals.values())
+    stages = {}
+    for name, h in sorted(myapp.metrics.stages.items()):
+        stages[name] = {f"p{int(q * 100)}_ms": round(h.quantile(q) * 1000, 3) for q in stage_metrics.QUANTILES}
+        stages[name]["mean_ms"] = round(h.total / max(1, h.n) * 1000, 3)
+    return {
+        "frames": frames,
+        "seconds": round(elapsed, 3),
+        "fps": round(frames / elapsed, 1) if elapsed > 0 else 0.0,
+        "crops": myapp.encoder.stats(),
+        "skipped": sum(state.skipped for state in myapp.stream_states),
+        "suppressed": sum(state.suppressed for state in myapp.stream_states),
+        "shown": window.shown if window is not None else 0,
+        "stages": stages,
+    }
+
+
+def print_result(title, result):
+    shown = f", {result['shown']} shown" if result.get("display") else ""
+    print(f"{title}: {result['frames']} frames in {result['seconds']} s = {result['fps']} frames/sec{shown}")
+    for name, st in result["stages"].items():
+        print(f"  {name:8s} p50 {st['p50_ms']:8.3f} ms  p95 {st['p95_ms']:8.3f} ms  p99 {st['p99_ms']:8.3f} ms")
+    crops = result["crops"]
+    print(f"  crops queued {crops['queued']} dropped {crops['dropped']} written {crops['written']}, "
+          f"stale frames skipped {result['skipped']}, stationary crops suppressed {result['suppressed']}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark inference_loop with a synthetic or replayed stream")
+    p.add_argument("--vehicles", type=int, nargs="+", default=[1, 5, 20], help="vehicles in view, one run per value")
+    p.add_argument("--frames", type=int, default=600, help="frames per stream per run")
+    p.add_argument("--streams", type=int, default=1, help="number of synthetic cameras")
+    p.add_argument("--width", type=int, default=1920)
+    p.add_argument("--height", type=int, default=1080)
+    p.add_argument("--fps", type=float, default=0, help="pace the stream at this frame rate (0 for as fast as possible)")
+    p.add_argument("--lag-budget", type=float, default=0, help="ms, as myapp.py --lag-budget")
+    p.add_argument("--motion-threshold", type=float, default=0, help="pixels, as myapp.py --motion-threshold")
+    p.add_argument("--parked", type=float, default=0.0, help="fraction of synthetic vehicles that are parked")
+    p.add_argument("--post-workers", type=int, default=0, help="as myapp.py --post-workers")
+    p.add_argument("--replay", help="replay a recording made with myapp.py --record instead")
+    p.add_argument("--display", action="store_true",
+                   help="render to an offscreen window, every frame and then decimated, instead of headless")
+    p.add_argument("--display-every", type=int, default=4, help="with --display, the decimated run renders every Nth frame")
+    p.add_argument("--display-fps", type=float, default=0, help="with --display, the decimated run renders at most this rate")
+    p.add_argument("--json", action="store_true", help="print the results as JSON")
+    p.add_argument("--verbose", action="store_true", help="keep the loop console output")
+    args = p.parse_args()
+
+    displays = [("headless", None)]
+    if args.display:
+        decimated = f"display every {max(1, args.display_every)}" + (f" at {args.display_fps:g} fps" if args.display_fps else "")
+        displays = [("display every frame", (1, 0)), (decimated, (max(1, args.display_every), args.display_fps))]
+    results = []
+    with tempfile.TemporaryDirectory() as crop_folder:
+        if args.replay:
+            for name, display in displays:
+                title = f"replay {args.replay}, {name}"
+                stream = replay.ReplayStream(args.replay, args.fps)
+                result = run(stream, crop_folder, args.verbose, args.lag_budget / 1000, args.motion_threshold,
+                             args.post_workers, display)
+                results.append({"run": title, "display": name if display else None, **result})
+        else:
+            for vehicles in args.vehicles:
+                for name, display in displays:
+                    title = f"{vehicles} vehicles x {args.streams} streams, {name}"
+                    stream = replay.SyntheticStream(args.frames, vehicles, args.streams, args.width, args.height,
+                                                    fps=args.fps or 60, realtime=args.fps > 0, parked=args.parked)
+                    result = run(stream, crop_folder, args.verbose, args.lag_budget / 1000, args.motion_threshold,
+                                 args.post_workers, display)
+                    results.append({"run": title, "vehicles": vehicles, "display": name if display else None, **result})
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print_result(result["run"], result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# Benchmark of the multiprocess post-processing pool
+# rev 0.1 - shabaz - August 2025
+
+# Scores and encodes synthetic plate ROIs (or whole frames) in-process and
+# with shm_pool.ShmPool at several worker counts, and reports the throughput.
+# example:
+#   python bench_pool.py --workers 1 2 4 --jobs 2000
+#   python bench_pool.py --roi 1920x1080 --jobs 100
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import best_plate
+import crop_encoder
+import shm_pool
+
+
+def make_rois(count, width, height, variants=16):
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8) for _ in range(variants)]
+    return [frames[i % variants] for i in range(count)]
+
+
+# returns (score jobs per second, encode jobs per second)
+def run(workers, rois, folder, tracks, batch):
+    slot_bytes = rois[0].nbytes
+    start = time.perf_counter()
+    if workers == 0:
+        for r in rois:
+            best_plate.sharpness(r)
+        score_rate = len(rois) / (time.perf_counter() - start)
+        encoder = crop_encoder.CropEncoder(queue_depth=len(rois), workers=1)
+    else:
+        pool = shm_pool.ShmPool(workers, slots=max(2 * batch, 4 * workers), slot_bytes=slot_bytes,
+                                queue_depth=len(rois), inline_below=0)
+        start = time.perf_counter()
+        for i in range(0, len(rois), batch):
+            chunk = rois[i:i + batch]
+            pool.sharpness(chunk, [(0, (i + j) % tracks) for j in range(len(chunk))], [None] * len(chunk))
+            pool.scores(timeout=1.0)
+        score_rate = len(rois) / (time.perf_counter() - start)
+        encoder = pool
+    start = time.perf_counter()
+    for i, r in enumerate(rois):
+        encoder.submit(r, os.path.join(folder, f"plate_{i % tracks}.jpg"))
+    encoder.close()
+    encode_rate = encoder.stats()["written"] / (time.perf_counter() - start)
+    return score_rate, encode_rate
+
+
+def main():
+    p = argparse.ArgumentParser(description="Throughput of shm_pool.ShmPool against worker count")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts to run (0 = in-process is always run)")
+    p.add_argument("--jobs", type=int, default=1000, help="ROIs per run")
+    p.add_argument("--roi", default="200x60", help="ROI size WxH, use 1920x1080 for whole frames")
+    p.add_argument("--tracks", type=int, default=20, help="distinct tracks the jobs are spread over")
+    p.add_argument("--batch", type=int, default=20, help="ROIs scored per sharpness() call (top_k)")
+    p.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = p.parse_args()
+    width, height = (int(v) for v in args.roi.lower().split("x"))
+    rois = make_rois(args.jobs, width, height)
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for workers in [0] + [w for w in args.workers if w > 0]:
+            score_rate, encode_rate = run(workers, rois, folder, args.tracks, args.batch)
+            results.append({"workers": workers, "roi": args.roi,
+                            "score_per_sec": round(score_rate, 1), "encode_per_sec": round(encode_rate, 1)})
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    base = results[0]
+    for r in results:
+        name = "in-process" if r["workers"] == 0 else f"{r['workers']} workers"
+        print(f"{name:12s} score {r['score_per_sec']:9.1f}/s ({r['score_per_sec'] / base['score_per_sec']:.2f}x)  "
+              f"encode {r['encode_per_sec']:9.1f}/s ({r['encode_per_sec'] / base['encode_per_sec']:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# Benchmark of the plate event store
+# rev 0.1 - shabaz - August 2025
+
+# Adds events with a JPEG-sized crop to a PlateStore, and reports the time the
+# caller spends in add() (this is what the inference thread would see) and the
+# rate at which the writer thread commits them. For comparison it also stores
+# the same events with one transaction per event. Then it times some queries.
+# example:
+#   python bench_store.py --events 20000 --blob 8000
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import plate_store
+
+
+def make_event(i, streams):
+    return {"ts": time.time(), "stream_id": i % streams, "track_id": i, "box": [100, 200, 300, 260],
+            "sharpness": 123.4, "path": f"crops/plate_{i % streams}_{i}.jpg"}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def main():
+    p = argparse.ArgumentParser(description="Write and query rate of the plate event store")
+    p.add_argument("--events", type=int, default=20000)
+    p.add_argument("--streams", type=int, default=4)
+    p.add_argument("--blob", type=int, default=8000, help="bytes of JPEG per event")
+    p.add_argument("--batch", type=int, default=256, help="events per commit")
+    p.add_argument("--segment-mb", type=float, default=64)
+    p.add_argument("--single", type=int, default=1000, help="events for the one transaction per event comparison")
+    p.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = p.parse_args()
+    blob = os.urandom(args.blob)
+    result = {}
+    with tempfile.TemporaryDirectory() as folder:
+        store = plate_store.PlateStore(folder, batch_size=args.batch,
+                                       segment_bytes=int(args.segment_mb * (1 << 20)), queue_depth=args.events)
+        add_times = []
+        start = time.perf_counter()
+        for i in range(args.events):
+            t = time.perf_counter()
+            store.add(make_event(i, args.streams), blob)
+            add_times.append(time.perf_counter() - t)
+        added = time.perf_counter() - start
+        store.close(timeout=600)
+        elapsed = time.perf_counter() - start
+        stats = store.stats()
+        segments = len([f for f in os.listdir(folder) if f.endswith(".seg")])
+        result["batched"] = {
+            "events": args.events,
+            "add_p50_us": round(percentile(add_times, 0.5) * 1e6, 2),
+            "add_p99_us": round(percentile(add_times, 0.99) * 1e6, 2),
+            "add_per_sec": round(args.events / added, 1),
+            "stored_per_sec": round(stats["stored"] / elapsed, 1),
+            "batches": stats["batches"],
+            "dropped": stats["dropped"],
+            "segments": segments,
+        }
+
+        # queries
+        now = time.time()
+        timings = {}
+        t = time.perf_counter()
+        rows = plate_store.query(folder, stream_id=1, limit=100)
+        timings["stream_100_ms"] = (time.perf_counter() - t) * 1000
+        t = time.perf_counter()
+        rows = plate_store.query(folder, start=now - 1, end=now)
+        timings["last_second_ms"] = (time.perf_counter() - t) * 1000
+        t = time.perf_counter()
+        plate_store.query(folder, track_id=random.randrange(args.events))
+        timings["track_ms"] = (time.perf_counter() - t) * 1000
+        t = time.perf_counter()
+        crop = plate_store.read_crop(folder, rows[-1]) if rows else None
+        timings["read_crop_ms"] = (time.perf_counter() - t) * 1000
+        result["query"] = {k: round(v, 3) for k, v in timings.items()}
+        result["query"]["crop_ok"] = crop == blob
+
+    # the naive way, one transaction (and fsync) per event, from the caller's thread
+    with tempfile.TemporaryDirectory() as folder:
+        db = sqlite3.connect(os.path.join(folder, "single.db"))
+        db.executescript(plate_store.SCHEMA)
+        start = time.perf_counter()
+        for i in range(args.single):
+            e = make_event(i, args.streams)
+            with open(os.path.join(folder, f"{i}.jpg"), "wb") as f:
+                f.write(blob)
+            with db:
+                db.execute("INSERT INTO plates (ts, stream_id, track_id, path) VALUES (?, ?, ?, ?)",
+                           (e["ts"], e["stream_id"], e["track_id"], e["path"]))
+        elapsed = time.perf_counter() - start
+        db.close()
+        result["per_event"] = {"events": args.single, "per_sec": round(args.single / elapsed, 1),
+                               "caller_us": round(elapsed / args.single * 1e6, 2)}
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    b, q, s = result["batched"], result["query"], result["per_event"]
+    print(f"batched: {b['events']} events, add() p50 {b['add_p50_us']} us p99 {b['add_p99_us']} us, "
+          f"stored {b['stored_per_sec']}/s in {b['batches']} commits, {b['segments']} segments, {b['dropped']} dropped")
+    print(f"per event transaction: {s['per_sec']}/s, {s['caller_us']} us per event in the caller")
+    print(f"queries: {q}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# Per-track best plate selection
+# rev 0.1 - shabaz - August 2025
+
+# Rather than saving a plate crop on every frame, the best looking crop of each
+# track is kept, and it is emitted exactly once, when the track has not been
+# reported by the tracker for more than max_age frames (the tracker max_age, for
+# as long as the tracker can still report the same id again), or when it has
+# been followed for more than max_frames frames (e.g. a parked car). So a track
+# that the tracker loses for a while and then finds again is still one track,
+# and its crop is not emitted (and its file written) twice.
+# Crops are scored on size and sharpness (variance of the Laplacian).
+
+import math
+import numpy as np
+
+default_max_age = 50  # same as the oc-sort default in vehicles-then-plates.yaml
+default_max_frames = 1800  # 30 seconds at 60 fps, a track followed for longer is emitted
+area_weight = 1.0  # score weighting of log(box area)
+sharpness_weight = 1.0  # score weighting of log(1 + Laplacian variance)
+
+GRAY = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+# read the tracker max_age from the pipeline yaml file
+def read_max_age(yaml_path, default=default_max_age):
+    try:
+        import yaml
+        with open(yaml_path, "r") as f:
+            pipeline = yaml.safe_load(f).get("pipeline", [])
+        for task in pipeline:
+            tracking = task.get("tracking")
+            if not tracking:
+                continue
+            for proc in tracking.get("cv_process", []):
+                tracker = proc.get("tracker") if isinstance(proc, dict) else None
+                if tracker:
+                    return int(tracker.get("algo_params", {}).get("max_age", default))
+    except Exception as e:
+        print(f"Could not read max_age from {yaml_path} ({e}), using {default}")
+    return default
+
+
+# variance of the Laplacian of an (H, W, C) or (H, W) image, higher is sharper
+def sharpness(img):
+    a = np.asarray(img)
+    if a.ndim == 3:
+        g = a[..., :3].astype(np.float32) @ GRAY[:a.shape[2]]
+    else:
+        g = a.astype(np.float32)
+    if g.shape[0] < 3 or g.shape[1] < 3:
+        return 0.0
+    lap = (g[:-2, 1:-1] + g[2:, 1:-1] + g[1:-1, :-2] + g[1:-1, 2:]) - 4.0 * g[1:-1, 1:-1]
+    return float(lap.var())
+
+
+def score(box, sharp):
+    area = max(1, (box[2] - box[0]) * (box[3] - box[1]))
+    return area_weight * math.log(area) + sharpness_weight * math.log1p(sharp)
+
+
+class Plate:
+    def __init__(self, track_id, first_frame):
+        self.track_id = track_id
+        self.first_frame = first_frame
+        self.last_frame = first_frame
+        self.crop = None  # best crop so far, an RGB array owning its pixels
+        self.box = None
+        self.score = -math.inf
+        self.sharpness = 0.0
+        self.emitted = False
+
+
+class BestPlateTracker:
+    # max_age is the number of frames a track can be missing before it has ended
+    def __init__(self, max_age=default_max_age, max_frames=default_max_frames):
+        self.max_age = max_age
+        self.max_frames = max_frames
+        self.tracks = {}  # track_id -> Plate
+        self.emitted = 0
+
+    # candidates is a list of (track_id, box, roi) for the current frame, roi is a
+    # view into the frame (or None), and is only copied if it is the best so far
+    # a fourth element can give the sharpness of the roi if it was already computed
+    # returns a list of Plate objects that are complete
+    def update(self, frame_index, candidates):
+        done = []
+        for track_id, box, view, *known in candidates:
+            plate = self.tracks.get(track_id)
+            if plate is None:
+                plate = Plate(track_id, frame_index)
+                self.tracks[track_id] = plate
+            plate.last_frame = frame_index
+            if plate.emitted:
+                continue  # already sent, wait for the track to end
+            if view is not None:
+                self._offer(plate, box, view, known[0] if known and known[0] is not None else sharpness(view))
+            if frame_index - plate.first_frame >= self.max_frames:
+                self._emit(plate, done)
+        # tracks that have not been reported for more than max_age frames have ended
+        for track_id in [t for t, p in self.tracks.items() if frame_index - p.last_frame > self.max_age]:
+            self._emit(self.tracks.pop(track_id), done)
+        return done
+
+    # a crop of an open track that was scored later than the frame it is from (shm_pool.ShmPool.scores()),
+    # it is kept if it is the best so far
+    def offer(self, track_id, box, view, sharp):
+        plate = self.tracks.get(track_id)
+        if plate is not None and not plate.emitted:
+            self._offer(plate, box, view, sharp)
+
+    # True if the track already has a crop with at least min_sharpness
+    def captured(self, track_id, min_sharpness=0.0):
+        plate = self.tracks.get(track_id)
+        return plate is not None and plate.crop is not None and plate.sharpness >= min_sharpness
+
+    # emit every track that has not been emitted yet, e.g. at the end of the stream
+    def flush(self):
+        done = []
+        for plate in self.tracks.values():
+            self._emit(plate, done)
+        self.tracks.clear()
+        return done
+
+    def _offer(self, plate, box, view, sharp):
+        s = score(box, sharp)
+        if s > plate.score:
+            plate.crop = np.ascontiguousarray(view)
+            plate.box = tuple(int(v) for v in box)
+            plate.score = s
+            plate.sharpness = sharp
+
+    def _emit(self, plate, done):
+        if plate.emitted or plate.crop is None:
+            return
+        plate.emitted = True
+        self.emitted += 1
+        done.append(plate)
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# Camera registry, with capability probing, a disk cache and hotplug updates
+# requirement: pip install pyudev
+# rev 0.1 - shabaz - August 2025
+
+# find_camera.py walks the video4linux devices again on each call, and can only
+# tell from the udev properties whether a node captures video. The registry
+# lists the matching /dev/video nodes once, and asks each node what it can do
+# with the V4L2 ioctls QUERYCAP (capture or not, e.g. the metadata nodes of UVC
+# cameras do not), ENUM_FMT (pixel formats) and ENUM_FRAMESIZES (resolutions).
+# Opening a camera to probe it can take a while (it may have to power up), so
+# the results are kept in a JSON file, keyed by the serial number and USB bus
+# path of the camera and the index of the node, and a camera that was seen
+# before is not opened again at startup. A pyudev.Monitor thread keeps the
+# registry current when cameras are plugged in or removed.
+#
+# The devices come from a source object with list_devices() and monitor(), and
+# the capabilities from a prober object with probe(node): UdevSource and
+# V4L2Prober, or MockUdevSource and MockProber for testing without cameras.
+#
+#   python camera_registry.py                   lists the cameras and their formats
+#   python camera_registry.py --watch           also follows the add and remove events
+#   python camera_registry.py --refresh         probes every camera again
+
+import argparse
+import errno
+import json
+import os
+import struct
+import threading
+import time
+
+try:
+    import pyudev
+except ImportError:
+    pyudev = None
+
+cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+default_cache_path = os.path.join(cache_dir, "anpr4all", "cameras.json")
+
+
+# V4L2 ioctls, from linux/videodev2.h
+def _ioc(direction, nr, size):
+    return (direction << 30) | (size << 16) | (ord("V") << 8) | nr
+
+
+V4L2_CAPABILITY = struct.Struct("16s32s32sIII12x")  # driver, card, bus_info, version, capabilities, device_caps
+V4L2_FMTDESC = struct.Struct("III32sII12x")  # index, type, flags, description, pixelformat, mbus_code
+V4L2_FRMSIZEENUM = struct.Struct("III6I8x")  # index, pixel_format, type, discrete or stepwise sizes
+VIDIOC_QUERYCAP = _ioc(2, 0, V4L2_CAPABILITY.size)
+VIDIOC_ENUM_FMT = _ioc(3, 2, V4L2_FMTDESC.size)
+VIDIOC_ENUM_FRAMESIZES = _ioc(3, 74, V4L2_FRMSIZEENUM.size)
+V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+V4L2_CAP_DEVICE_CAPS = 0x80000000
+V4L2_BUF_TYPE_VIDEO_CAPTURE = 1
+V4L2_FMT_FLAG_COMPRESSED = 0x0001
+V4L2_FRMSIZE_TYPE_DISCRETE = 1
+
+
+# a device is a dict: node (e.g. /dev/video0), number, key, name, serial, path, index, udev_capture
+# key is None if the camera has no serial number or bus path, then it is not cached
+def device_info(node, name="", serial=None, path=None, index=0, udev_capture=True):
+    key = f"{serial or '-'}@{path or '-'}:{index}" if (serial or path) else None
+    return {"node": node, "number": int(node.replace("/dev/video", "")), "key": key, "name": name or "",
+            "serial": serial, "path": path, "index": index, "udev_capture": udev_capture}
+
+
+# the capabilities are a dict: driver, card, bus_info, capture, formats
+# formats is a list of dicts: fourcc, description, compressed, sizes ([width, height] pairs)
+def caps_info(driver="", card="", bus_info="", capture=True, formats=()):
+    return {"driver": driver, "card": card, "bus_info": bus_info, "capture": capture, "formats": list(formats)}
+
+
+def fourcc(pixelformat):
+    return "".join(chr((pixelformat >> (8 * i)) & 0xff) for i in range(4)).strip()
+
+
+def _text(raw):
+    return raw.split(b"\0", 1)[0].decode("utf-8", "replace")
+
+
+class V4L2Prober:
+    def __init__(self):
+        import fcntl
+        self.ioctl = fcntl.ioctl
+
+    # the capabilities of the node, raises OSError if it cannot be opened or queried
+    def probe(self, node):
+        fd = os.open(node, os.O_RDWR | os.O_NONBLOCK)
+        try:
+            buf = bytearray(V4L2_CAPABILITY.size)
+            self.ioctl(fd, VIDIOC_QUERYCAP, buf)
+            driver, card, bus_info, _, capabilities, device_caps = V4L2_CAPABILITY.unpack(buf)
+            if capabilities & V4L2_CAP_DEVICE_CAPS:
+                capabilities = device_caps  # the capabilities of this node, not of the whole device
+            capture = bool(capabilities & V4L2_CAP_VIDEO_CAPTURE)
+            formats = self._formats(fd) if capture else []
+        finally:
+            os.close(fd)
+        return caps_info(_text(driver), _text(card), _text(bus_info), capture, formats)
+
+    # calls the ENUM ioctl with index 0, 1, ... until the driver returns EINVAL
+    def _enumerate(self, fd, request, layout, *fields):
+        index = 0
+        while True:
+            buf = bytearray(layout.pack(index, *fields))
+            try:
+                self.ioctl(fd, request, buf)
+            except OSError as e:
+                if e.errno == errno.EINVAL:
+                    return
+                raise
+            yield layout.unpack(buf)
+            index += 1
+
+    def _formats(self, fd):
+        formats = []
+        for _, _, flags, description, pixelformat, _ in self._enumerate(
+                fd, VIDIOC_ENUM_FMT, V4L2_FMTDESC, V4L2_BUF_TYPE_VIDEO_CAPTURE, 0, b"", 0, 0):
+            formats.append({"fourcc": fourcc(pixelformat), "description": _text(description),
+                            "compressed": bool(flags & V4L2_FMT_FLAG_COMPRESSED),
+                            "sizes": self._sizes(fd, pixelformat)})
+        return formats
+
+    def _sizes(self, fd, pixelformat):
+        sizes = []
+        for _, _, size_type, *s in self._enumerate(fd, VIDIOC_ENUM_FRAMESIZES, V4L2_FRMSIZEENUM,
+                                                   pixelformat, 0, 0, 0, 0, 0, 0, 0):
+            if size_type == V4L2_FRMSIZE_TYPE_DISCRETE:
+                sizes.append([s[0], s[1]])
+            else:
+                sizes.append([s[1], s[4]])  # stepwise or continuous, only the largest size is kept
+                break
+        return sizes
+
+
+# a stand-in for V4L2Prober, returns the capabilities given for each node
+class MockProber:
+    def __init__(self, caps=None):
+        self.caps = dict(caps or {})  # node -> capabilities
+        self.probes = []  # the nodes probed, in order
+
+    def probe(self, node):
+        self.probes.append(node)
+        if node not in self.caps:
+            raise OSError(errno.ENOENT, "no such device", node)
+        return self.caps[node]
+
+
+class UdevSource:
+    def __init__(self):
+        if pyudev is None:
+            raise RuntimeError("camera_registry needs the pyudev module (pip install pyudev)")
+        self.context = pyudev.Context()
+
+    def list_devices(self):
+        return [self._info(dev) for dev in self.context.list_devices(subsystem="video4linux") if dev.device_node]
+
+    # calls on_event(action, info) from a background thread for each video4linux add/remove
+    def monitor(self, on_event):
+        monitor = pyudev.Monitor.from_netlink(self.context)
+        monitor.filter_by("video4linux")
+        monitor.start()
+
+        def run():
+            while True:
+                dev = monitor.poll(timeout=None)
+                if dev is not None and dev.device_node and dev.action in ("add", "remove"):
+                    on_event(dev.action, self._info(dev))
+
+        threading.Thread(target=run, name="CameraMonitor", daemon=True).start()
+
+    def _info(self, dev):
+        props = dev.properties
+        name = props.get("ID_V4L_PRODUCT") or props.get("NAME") or ""
+        caps = props.get("ID_V4L_CAPABILITIES")
+        try:
+            index = int(dev.attributes.asstring("index"))
+        except (KeyError, ValueError):
+            index = 0
+        return device_info(dev.device_node, name, props.get("ID_SERIAL_SHORT") or props.get("ID_SERIAL"),
+                           props.get("ID_PATH"), index, caps is None or ":capture:" in caps)
+
+
+# a stand-in for udev, devices are added and removed by calling add() and remove()
+class MockUdevSource:
+    def __init__(self, devices=()):
+        self.devices = {d["node"]: d for d in devices}
+        self.on_event = None
+
+    def list_devices(self):
+        return list(self.devices.values())
+
+    def monitor(self, on_event):
+        self.on_event = on_event
+
+    def add(self, info):
+        self.devices[info["node"]] = info
+        if self.on_event:
+            self.on_event("add", info)
+
+    def remove(self, node):
+        info = self.devices.pop(node)
+        if self.on_event:
+            self.on_event("remove", info)
+
+
+# the largest frame size of a camera, in pixels
+def largest_size(camera):
+    caps = camera.get("caps")
+    return max((w * h for f in caps["formats"] for w, h in f["sizes"]), default=0) if caps else 0
+
+
+# cameras are compared by: capture node, largest frame size, a compressed format (MJPG needs
+# less USB bandwidth), then the lowest node number
+def score(camera):
+    caps = camera.get("caps")
+    capture = caps["capture"] if caps else camera["udev_capture"]
+    compressed = any(f["compressed"] for f in caps["formats"]) if caps else False
+    return capture, largest_size(camera), compressed, -camera["number"]
+
+
+# a short description of the best format of a camera, e.g. "MJPG 1920x1080"
+def describe(camera):
+    caps = camera.get("caps")
+    if not caps:
+        return "not probed"
+    if not caps["capture"]:
+        return "no capture"
+    best = None
+    for f in caps["formats"]:
+        for w, h in f["sizes"]:
+            if best is None or (w * h, f["compressed"]) > (best[1] * best[2], best[3]):
+                best = (f["fourcc"], w, h, f["compressed"])
+    return f"{best[0]} {best[1]}x{best[2]}" if best else "no formats"
+
+
+class CameraRegistry:
+    # source defaults to UdevSource, prober to V4L2Prober
+    # cache_path is the JSON file of the probed capabilities, None to disable the cache
+    # with refresh=True every camera is probed again (and the cache rewritten)
+    def __init__(self, source=None, prober=None, cache_path=default_cache_path, monitor=True, refresh=False):
+        self.source = source or UdevSource()
+        self.prober = prober or V4L2Prober()
+        self.cache_path = cache_path
+        self.cache = {} if refresh else self._load_cache()  # key -> {"name": ..., "caps": ...}
+        self.devices = {}  # node -> device info, with "caps" (None if it could not be probed)
+        self.cond = threading.Condition()
+        self.events = 0
+        self.probes = 0
+        self.cache_hits = 0
+        self.hotplug = False
+        if monitor:
+            try:
+                self.source.monitor(self._on_event)  # before the scan, so that no event is missed
+                self.hotplug = True
+            except Exception as e:
+                print(f"Camera registry: no hotplug monitoring ({e})")
+        self.rescan()
+
+    def rescan(self):
+        devices = {info["node"]: self._with_caps(info) for info in self.source.list_devices()}
+        with self.cond:
+            self.devices = devices
+            self.cond.notify_all()
+        self._save_cache()
+
+    # the capture nodes whose name contains search_term, by node number
+    def cameras(self, search_term=""):
+        with self.cond:
+            return self._matching(search_term)
+
+    # the best capture node whose name contains search_term (see score()), or None
+    # waits up to timeout seconds for a matching camera to be added
+    def best(self, search_term="", timeout=0.0):
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while True:
+                cameras = self._matching(search_term)
+                remaining = deadline - time.monotonic()
+                if cameras or not self.hotplug or remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+        return max(cameras, key=score) if cameras else None
+
+    # every video4linux node, including the ones that cannot capture
+    def list_devices(self):
+        with self.cond:
+            return sorted(self.devices.values(), key=lambda d: d["number"])
+
+    def stats(self):
+        with self.cond:
+            return {"devices": len(self.devices), "probes": self.probes, "cache_hits": self.cache_hits,
+                    "events": self.events, "hotplug": self.hotplug}
+
+    # called with self.cond held
+    def _matching(self, search_term):
+        cameras = [d for d in self.devices.values() if (not search_term or search_term in d["name"]) and score(d)[0]]
+        return sorted(cameras, key=lambda d: d["number"])
+
+    # the device info with its capabilities, from the cache if the camera was seen before
+    def _with_caps(self, info):
+        info = dict(info)
+        entry = self.cache.get(info["key"]) if info["key"] else None
+        if entry and entry["name"] == info["name"]:
+            self.cache_hits += 1
+            info["caps"] = entry["caps"]
+            return info
+        self.probes += 1
+        try:
+            info["caps"] = self.prober.probe(info["node"])
+        except OSError as e:
+            print(f"Camera registry: cannot probe {info['node']} ({e})")
+            info["caps"] = None  # fall back to the udev properties, and try again next time
+            return info
+        if info["key"]:
+            self.cache[info["key"]] = {"name": info["name"], "caps": info["caps"]}
+        return info
+
+    def _load_cache(self):
+        if not self.cache_path:
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    # written to a temporary file first, so that a reader never sees a partial file
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        with self.cond:
+            data = json.dumps(self.cache, indent=1, sort_keys=True)
+        tmp_filename = f"{self.cache_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            with open(tmp_filename, "w") as f:
+                f.write(data)
+            os.replace(tmp_filename, self.cache_path)
+        except OSError as e:
+            print(f"Camera registry: cannot write {self.cache_path} ({e})")
+
+    def _on_event(self, action, info):
+        if action == "add":
+            info = self._with_caps(info)  # probed outside the lock, lookups carry on meanwhile
+        with self.cond:
+            self.events += 1
+            if action == "add":
+                self.devices[info["node"]] = info
+            else:
+                self.devices.pop(info["node"], None)
+            self.cond.notify_all()
+        if action == "add":
+            self._save_cache()
+
+
+def main():
+    p = argparse.ArgumentParser(description="List the cameras and their capabilities, and optionally watch for changes.")
+    p.add_argument("--searchname", default="", help="only the cameras whose name contains this, e.g. 'HD Pro'")
+    p.add_argument("--all", action="store_true", help="also list the nodes that cannot capture")
+    p.add_argument("--watch", action="store_true", help="print the cameras whenever one is added or removed")
+    p.add_argument("--refresh", action="store_true", help="probe every camera again instead of using the cache")
+    p.add_argument("--cache", default=default_cache_path, help="capabilities cache file")
+    p.add_argument("--json", action="store_true", help="print the devices and their capabilities as JSON")
+    args = p.parse_args()
+    start = time.perf_counter()
+    registry = CameraRegistry(cache_path=args.cache, monitor=args.watch, refresh=args.refresh)
+    elapsed = time.perf_counter() - start
+    last = None
+    while True:
+        devices = registry.list_devices() if args.all else registry.cameras(args.searchname)
+        if devices != last:
+            if args.json:
+                print(json.dumps(devices, indent=2))
+            else:
+                best = registry.best(args.searchname)
+                for d in devices:
+                    mark = "*" if best and d["node"] == best["node"] else " "
+                    print(f"{mark} {d['node']:<13} {d['name']:<32} {describe(d):<16} {d['key'] or ''}")
+                if not devices:
+                    print("no cameras")
+            last = devices
+        if not args.watch:
+            break
+        with registry.cond:
+            registry.cond.wait(1.0)
+    if not args.json:
+        print(f"({elapsed * 1000:.1f} ms, {registry.probes} probed, {registry.cache_hits} from the cache)")
+
+
+if __name__ == "__main__":
+    main()
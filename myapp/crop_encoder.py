@@ -0,0 +1,180 @@
+# Background JPEG encoder for plate crops
+# rev 0.1 - shabaz - August 2025
+
+# The inference thread only hands a crop over with submit() and carries on,
+# the JPEG encode and the disk write are done by a small pool of worker threads.
+# The queue is bounded, when it is full the oldest pending crop is discarded
+# (a newer crop of the same scene is more useful than an old one). Crops that
+# must not be lost (e.g. the only crop of a track) are submitted with keep=True,
+# a full queue then drops its oldest crop that was not kept instead, and if all
+# of them were kept, the kept crops have keep_depth more places. submit() never
+# waits either way.
+# An optional on_written callback is called from the worker after each file is
+# written, e.g. to publish an event once the crop is on disk.
+
+import io
+import os
+import threading
+from collections import deque
+
+
+class CropEncoder:
+    # on_written is called as on_written(filename, tag, info, jpeg_bytes)
+    def __init__(self, queue_depth=4, workers=1, quality=95, metrics=None, on_written=None, keep_depth=256):
+        self.queue_depth = max(1, queue_depth)
+        self.keep_depth = keep_depth
+        self.on_written = on_written
+        self.quality = quality
+        self.metrics = metrics  # optional stage_metrics.Metrics, for encode/save timing
+        self.pending = deque()
+        self.cond = threading.Condition()
+        self.running = True
+        # counters
+        self.queued = 0
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0
+        self.by_tag = {}  # tag (e.g. stream_id) -> {"queued": n, "dropped": n, "written": n}
+        self.threads = []
+        for i in range(max(1, workers)):
+            t = threading.Thread(target=self._worker, name=f"CropEncoder-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    # queue a crop for writing, never blocks
+    # image is a PIL image or an RGB NumPy array, filename is the destination file
+    # tag is optional, the counters are also kept per tag (e.g. per stream_id)
+    # info is optional, it is passed on to the on_written callback
+    # keep=True for a crop that must not be lost, see queue_crop()
+    def submit(self, image, filename, tag=None, info=None, keep=False):
+        with self.cond:
+            if not self.running:
+                return False
+            self.queued += 1
+            self._count(tag, "queued")
+            dropped = queue_crop(self.pending, (image, filename, tag, info, keep), self.queue_depth, self.keep_depth)
+            if dropped is not None:
+                self.dropped += 1
+                self._count(dropped[2], "dropped")
+            self.cond.notify()
+        return True
+
+    def depth(self):
+        with self.cond:
+            return len(self.pending)
+
+    # counters of one tag, or of all tags as a dict if tag is not given
+    def tag_stats(self, tag=None):
+        with self.cond:
+            if tag is None:
+                return {t: dict(c) for t, c in self.by_tag.items()}
+            return dict(self.by_tag.get(tag, {"queued": 0, "dropped": 0, "written": 0}))
+
+    def stats(self):
+        with self.cond:
+            return {
+                "queued": self.queued,
+                "dropped": self.dropped,
+                "written": self.written,
+                "errors": self.errors,
+                "depth": len(self.pending),
+            }
+
+    # stop the workers, by default anything still queued is written first
+    def close(self, drain=True, timeout=5.0):
+        with self.cond:
+            self.running = False
+            if not drain:
+                self.dropped += len(self.pending)
+                for _, _, tag, _, _ in self.pending:
+                    self._count(tag, "dropped")
+                self.pending.clear()
+            self.cond.notify_all()
+        for t in self.threads:
+            t.join(timeout)
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.pending:
+                    return  # closed and drained
+                image, filename, tag, info, _ = self.pending.popleft()
+            try:
+                data = self._write(image, filename)
+                with self.cond:
+                    self.written += 1
+                    self._count(tag, "written")
+            except Exception as e:
+                with self.cond:
+                    self.errors += 1
+                print(f"Crop encoder error writing {filename}: {e}")
+                continue
+            if self.on_written:
+                try:
+                    self.on_written(filename, tag, info, data)
+                except Exception as e:
+                    print(f"Crop encoder callback error for {filename}: {e}")
+
+    # called with self.cond held
+    def _count(self, tag, counter):
+        if tag is None:
+            return
+        counts = self.by_tag.get(tag)
+        if counts is None:
+            counts = {"queued": 0, "dropped": 0, "written": 0}
+            self.by_tag[tag] = counts
+        counts[counter] += 1
+
+    def _write(self, image, filename):
+        t = self.metrics.clock() if self.metrics else 0.0
+        data = encode_jpeg(image, self.quality)
+        if self.metrics:
+            t = self.metrics.stage("encode", t)
+        write_file(data, filename)
+        if self.metrics:
+            self.metrics.stage("save", t)
+        return data
+
+
+# append entry (image, filename, tag, info, keep) to the pending deque of crops
+# if the queue is full, its oldest crop that was not kept is dropped, and if all of
+# them were kept, the new crop is dropped unless it is kept too, kept crops are
+# only dropped (the oldest first) once keep_depth of them wait beyond queue_depth
+# returns the dropped crop (possibly entry itself), or None
+def queue_crop(pending, entry, queue_depth, keep_depth):
+    if len(pending) >= queue_depth:
+        for i, old in enumerate(pending):
+            if not old[4]:
+                del pending[i]
+                pending.append(entry)
+                return old
+        if not entry[4]:
+            return entry
+        if len(pending) >= queue_depth + keep_depth:
+            old = pending.popleft()
+            pending.append(entry)
+            return old
+    pending.append(entry)
+    return None
+
+
+# JPEG encode a PIL image or an RGB NumPy array, returns the JPEG bytes
+# PIL is imported on first use, so that it does not slow down the start of myapp
+def encode_jpeg(image, quality=95):
+    if not hasattr(image, "save"):
+        from PIL import Image
+        image = Image.fromarray(image)
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+# write to a temporary file and rename, so that readers of the file
+# never see a half written JPEG
+def write_file(data, filename):
+    tmp_filename = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_filename, "wb") as f:
+        f.write(data)
+    os.replace(tmp_filename, filename)
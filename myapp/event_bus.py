@@ -0,0 +1,203 @@
+# Local publish/subscribe plate event bus over a Unix domain socket
+# rev 0.1 - shabaz - August 2025
+
+# Other processes on the box (gate controller, logger, dashboard) connect to
+# the socket and receive every plate event, instead of polling the filesystem.
+#
+# Framing: each event is sent as
+#   4 bytes big-endian header length, 4 bytes big-endian blob length,
+#   the header (UTF-8 JSON), the blob (e.g. the JPEG bytes of the crop, can be empty)
+#
+# Each subscriber has its own bounded buffer and writer thread, pending frames
+# are written in batches. When a subscriber is too slow and its buffer is full,
+# its oldest events are dropped, publish() itself never blocks.
+
+import json
+import os
+import socket
+import stat
+import struct
+import threading
+from collections import deque
+
+HEADER = struct.Struct(">II")
+default_path = "/tmp/anpr-events.sock"
+
+
+def encode_frame(event, blob=b""):
+    header = json.dumps(event, separators=(",", ":")).encode("utf-8")
+    return HEADER.pack(len(header), len(blob)) + header + blob
+
+
+class _Subscriber:
+    def __init__(self, bus, conn, buffer_events, batch_bytes):
+        self.bus = bus
+        self.conn = conn
+        self.buffer_events = buffer_events
+        self.batch_bytes = batch_bytes
+        self.frames = deque()
+        self.cond = threading.Condition()
+        self.running = True
+        self.sent = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name="EventBusWriter", daemon=True)
+        self.thread.start()
+
+    def push(self, frame):
+        with self.cond:
+            if len(self.frames) >= self.buffer_events:
+                self.frames.popleft()  # slow subscriber, lose its oldest event
+                self.dropped += 1
+            self.frames.append(frame)
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def _run(self):
+        try:
+            while True:
+                with self.cond:
+                    while self.running and not self.frames:
+                        self.cond.wait()
+                    if not self.running:
+                        return
+                    batch, size = [], 0
+                    while self.frames and (not batch or size + len(self.frames[0]) <= self.batch_bytes):
+                        frame = self.frames.popleft()
+                        batch.append(frame)
+                        size += len(frame)
+                self.conn.sendall(b"".join(batch))
+                with self.cond:
+                    self.sent += len(batch)
+        except OSError:
+            pass  # subscriber went away
+        finally:
+            self.conn.close()
+            self.bus._remove(self)
+
+
+class EventBus:
+    # buffer_events is the number of events buffered per subscriber
+    # batch_bytes is the most that is written to a subscriber in one go
+    def __init__(self, path=default_path, buffer_events=256, batch_bytes=256 * 1024):
+        self.path = path
+        self.buffer_events = buffer_events
+        self.batch_bytes = batch_bytes
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0  # of subscribers that have gone
+        self.sent = 0  # of subscribers that have gone
+        _remove_stale_socket(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(16)
+        self.running = True
+        self.thread = threading.Thread(target=self._accept, name="EventBusAccept", daemon=True)
+        self.thread.start()
+
+    # publish an event (a JSON-serializable dict) with an optional binary blob, never blocks
+    def publish(self, event, blob=b""):
+        frame = encode_frame(event, blob)
+        with self.lock:
+            subscribers = list(self.subscribers)
+            self.published += 1
+        for sub in subscribers:
+            sub.push(frame)
+
+    def stats(self):
+        with self.lock:
+            subscribers = list(self.subscribers)
+            dropped, sent = self.dropped, self.sent
+        return {
+            "published": self.published,
+            "subscribers": len(subscribers),
+            "sent": sent + sum(s.sent for s in subscribers),
+            "dropped": dropped + sum(s.dropped for s in subscribers),
+        }
+
+    def close(self):
+        self.running = False
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.server.close()
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for sub in subscribers:
+            sub.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _accept(self):
+        while self.running:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            try:
+                conn.shutdown(socket.SHUT_RD)  # subscribers only receive
+            except OSError:
+                conn.close()  # it has already gone
+                continue
+            sub = _Subscriber(self, conn, self.buffer_events, self.batch_bytes)
+            with self.lock:
+                self.subscribers.append(sub)
+
+    def _remove(self, sub):
+        with self.lock:
+            if sub in self.subscribers:
+                self.subscribers.remove(sub)
+                self.dropped += sub.dropped + len(sub.frames)
+                self.sent += sub.sent
+
+
+# removes the socket left at path by a bus that did not close (e.g. it was killed)
+# raises RuntimeError if another bus is listening on it, or if path is not a socket
+def _remove_stale_socket(path):
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise RuntimeError(f"{path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)  # nobody is listening, it is stale
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"another event bus is running on {path}")
+
+
+# client side, yields (event, blob) for each event published on the bus
+class Subscriber:
+    def __init__(self, path=default_path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.file = self.sock.makefile("rb", buffering=256 * 1024)
+
+    def __iter__(self):
+        return self.events()
+
+    def events(self):
+        while True:
+            head = self.file.read(HEADER.size)
+            if len(head) < HEADER.size:
+                return  # publisher closed
+            header_len, blob_len = HEADER.unpack(head)
+            header = self.file.read(header_len)
+            blob = self.file.read(blob_len) if blob_len else b""
+            if len(header) < header_len or len(blob) < blob_len:
+                return
+            yield json.loads(header), blob
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
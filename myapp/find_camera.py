@@ -14,25 +14,43 @@ except ImportError:
     print("pip install pyudev")
     exit(1)
 
-def find_camera(searchname="HD Pro"):
-    nodelist = [] 
+# returns a sorted list of the video node numbers of all matching cameras
+# nodes that cannot capture (e.g. the metadata nodes of UVC cameras) are skipped
+def find_cameras(searchname="HD Pro"):
+    camlist = []
     ctx = pyudev.Context()
     for dev in ctx.list_devices(subsystem="video4linux"):
         node = dev.device_node  # e.g., /dev/video0
         name = dev.properties.get("ID_V4L_PRODUCT") or dev.properties.get("NAME") or ""
         if searchname and searchname not in name:
             continue
-        nodelist.append(node)
-    if len(nodelist) == 0:
+        caps = dev.properties.get("ID_V4L_CAPABILITIES")
+        if caps is not None and ":capture:" not in caps:
+            continue
+        camlist.append(int(node.replace("/dev/video", "")))
+    return sorted(camlist)
+
+# returns the video node number of the first matching capture device, or -1
+# see camera_registry.py for a choice by the formats and resolutions of each node
+def find_camera(searchname="HD Pro"):
+    camlist = find_cameras(searchname)
+    if len(camlist) == 0:
         return -1
-    # return the number after "/dev/video" for the first found device
-    return int(nodelist[0].replace("/dev/video", ""))
+    return camlist[0]
 
 def main():
     p = argparse.ArgumentParser()
     p.add_argument("--searchname", help="e.g. 'HD Pro'")
+    p.add_argument("--all", action="store_true", help="list all matching capture devices")
     args = p.parse_args()
     searchname = args.searchname if args.searchname else "HD Pro"
+    if args.all:
+        camlist = find_cameras(searchname)
+        if len(camlist) == 0:
+            print(f"Camera with name containing '{searchname}' not found")
+        for camnum in camlist:
+            print(f"Camera '{searchname}' found at /dev/video{camnum}")
+        return
     camnum = find_camera(searchname)
     if camnum < 0:
         print(f"Camera with name containing '{searchname}' not found")
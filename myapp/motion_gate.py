@@ -0,0 +1,39 @@
+# Motion gating of the plate work
+# rev 0.1 - shabaz - August 2025
+
+# In car parks most of the tracked vehicles are parked. Once a track has a good
+# plate crop and it is not moving, cropping and scoring its plate again on every
+# frame is wasted work. A track counts as stationary when the center of its box
+# has moved less than threshold pixels over the last window history entries,
+# its plate work resumes as soon as it moves again.
+
+import numpy as np
+
+
+# distance in pixels between the centers of two sets of (x1, y1, x2, y2) boxes
+def displacement(boxes, past_boxes):
+    b = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    p = np.asarray(past_boxes, dtype=np.float32).reshape(-1, 4)
+    d = (b[:, :2] + b[:, 2:]) * 0.5 - (p[:, :2] + p[:, 2:]) * 0.5
+    return np.hypot(d[:, 0], d[:, 1])
+
+
+class MotionGate:
+    # threshold is in pixels over window history entries, 0 disables the gate
+    # min_sharpness is the sharpness a capture needs before its track can be gated
+    def __init__(self, threshold=0.0, window=10, min_sharpness=0.0):
+        self.threshold = threshold
+        self.window = window
+        self.min_sharpness = min_sharpness
+
+    # returns a boolean array, True for the tracks that still need plate work
+    # plates is the BestPlateTracker of the stream
+    def select(self, plates, track_ids, boxes, past_boxes):
+        work = np.ones(len(track_ids), dtype=bool)
+        if self.threshold <= 0 or len(track_ids) == 0:
+            return work
+        stationary = displacement(boxes, past_boxes) < self.threshold
+        for i in np.flatnonzero(stationary).tolist():
+            if plates.captured(track_ids[i], self.min_sharpness):
+                work[i] = False
+        return work
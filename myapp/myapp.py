@@ -5,38 +5,91 @@
 # ANPR app for Metis M.2 AI Module on
 # Aetina RK3588 platform
 
+import time
+startup_t0 = time.perf_counter()  # start of the startup timing breakdown
 import os
 import pwd
 import sys
-import time
-import cv2
-import find_camera
+import argparse
+import threading
+import crop_encoder
+import roi
+import best_plate
+import track_arrays
+import stage_metrics
+import stream_state
+import motion_gate
+import event_bus
+# the optional features (shm_pool, plate_sink, plate_store, replay) are imported
+# in main() only when they are used, to keep the startup fast
+startup_imported = time.perf_counter()
 
 # globals
 camera_search_term = "HD Pro"  # part of the camera name to search for
 input_source_name = ""  # this will be set later to (say) "usb:20"
+input_source_names = []  # all of the matching cameras, used with --all-cameras
+cameras = None  # camera_registry.CameraRegistry, set by the camera discovery
+camera_cache = True  # use the camera capabilities cached by camera_registry, --refresh-cameras to probe again
 stream = None  # the inference stream object
+encoder = None  # background JPEG writer for the plate crops
+stream_states = None  # per-camera state of the running inference_loop
+crop_folder = "crops"  # one plate crop is saved here per track
+pipeline_yaml = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vehicles-then-plates.yaml")
+crop_quality = 95
+encoder_queue_depth = 4  # crops waiting to be written, the plate crops are submitted with keep=True
+encoder_workers = 1  # number of encoder threads
+post_workers = 0  # if non-zero, plate scoring and encoding run in this many worker processes
+post_pool = None  # shm_pool.ShmPool when post_workers is non-zero, also used as the encoder
+headless = False  # run without creating the display app
+display_every = 1  # render at most every Nth frame of each stream
+display_fps = 0  # if non-zero, render each stream at no more than this rate
+metrics = stage_metrics.Metrics(enabled=False)  # replaced in main() unless --no-metrics
+metrics_port = 9108  # Prometheus text at http://127.0.0.1:9108/metrics, 0 to disable
+recorder = None  # replay.MetadataRecorder when --record is used
+lag_budget = 0.0  # seconds, frames older than this skip post-processing (0 to disable)
+# clock of the frame timestamps, used unless the stream has a timestamp_clock attribute:
+# "wall" (time.time()) or "monotonic" (time.monotonic())
+timestamp_clock = "wall"
+motion = motion_gate.MotionGate()  # threshold 0: no gating, set from the command line
+dedup_distance = 6  # bits, crops within this dHash distance of a recent crop are not saved (-1 to disable)
+dedup_ttl = 300.0  # seconds a plate hash is remembered
+dedup_size = 256  # plate hashes remembered per stream
+lcd_sink = None  # plate_sink.LatestSender for the Pico LCD, with --lcd
+lcd_interval = 0.5  # seconds, minimum time between LCD messages
+events = None  # event_bus.EventBus, plate events for other local processes, with --events
+events_inline = False  # send the JPEG bytes with each event, instead of only the file path
+store = None  # plate_store.PlateStore, the queryable plate history, with --store
+startup_times = {}  # startup phase -> (seconds taken, seconds since startup_t0 at its end)
+startup_last = startup_imported  # end of the last sequential startup phase
+startup_report = False  # if True, inference_loop prints the startup times on the first frame
 
 # terminal colors
 RESET = "\033[0m"
 BOLD = "\033[1m"
 RED = "\033[31m"
 
-user = pwd.getpwuid(os.getuid()).pw_name
-print(f"Running as user: {user}")
+# set by load_axelera()
+config = None
+display = None
+create_inference_stream = None
 
-if not os.environ.get('AXELERA_FRAMEWORK'):
-    print(f"{BOLD}{RED}Please activate the Axelera environment! Type:{RESET}")
-    print("source /axelera/voyager-sdk/venv/bin/activate")
-    print("and run again")
-    sys.exit(1)
+# checks the Axelera environment and imports the SDK, exits if it is not activated
+# this is done from main(), so that inference_loop can also be imported and run
+# without the SDK, with a stand-in stream from replay.py (see bench_loop.py)
+def load_axelera():
+    global config, display, create_inference_stream
+    if not os.environ.get('AXELERA_FRAMEWORK'):
+        print(f"{BOLD}{RED}Please activate the Axelera environment! Type:{RESET}")
+        print("source /axelera/voyager-sdk/venv/bin/activate")
+        print("and run again")
+        sys.exit(1)
 
-# add the voyager-sdk path to sys.path
-project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "/axelera/voyager-sdk"))
-sys.path.append(project_root)
+    # add the voyager-sdk path to sys.path
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "/axelera/voyager-sdk"))
+    sys.path.append(project_root)
 
-from axelera.app import config, display
-from axelera.app.stream import create_inference_stream
+    from axelera.app import config, display
+    from axelera.app.stream import create_inference_stream
 
 # banner title
 def print_banner():
@@ -52,93 +105,413 @@ def print_banner():
     print(f"{time.strftime('%Y-%m-%d %H:%M:%S')}")
     print("\n")
 
+# the camera registry, the capabilities of cameras seen before come from its cache,
+# so no camera has to be opened to choose the capture node
+def camera_registry_instance():
+    global cameras
+    if cameras is None:
+        import camera_registry  # needs pyudev
+        cameras = camera_registry.CameraRegistry(refresh=not camera_cache)
+    return cameras
+
 # returns True if camera found
-# sets input_source_name to a value like "usb:20"
+# sets input_source_name to a value like "usb:20", for the best capture node (see camera_registry.score())
 def locate_camera():
     global input_source_name
-    camera_id = find_camera.find_camera(camera_search_term)
-    if camera_id < 0:
+    import camera_registry
+    camera = camera_registry_instance().best(camera_search_term)
+    if camera is None:
         return False
     else:
-        input_source_name = f"usb:{camera_id}"
-        print(f"Camera '{camera_search_term}' found as {input_source_name} (/dev/video{camera_id})")
+        input_source_name = f"usb:{camera['number']}"
+        print(f"Camera '{camera_search_term}' found as {input_source_name} ({camera['node']}, {camera_registry.describe(camera)})")
         return True
-    
+
+# returns True if one or more cameras found
+# sets input_source_names to a list like ["usb:20", "usb:22"]
+def locate_cameras():
+    global input_source_names
+    import camera_registry
+    found = camera_registry_instance().cameras(camera_search_term)
+    input_source_names = [f"usb:{camera['number']}" for camera in found]
+    for name, camera in zip(input_source_names, found):
+        print(f"Camera '{camera_search_term}' found as {name} ({camera['node']}, {camera_registry.describe(camera)})")
+    return len(input_source_names) > 0
+
+# camera discovery, run in a thread while the SDK is loaded and the stream is created
+# sets result["found"] to True if a camera was found, or result["error"] to the exception
+# it failed with, for the main thread to report (see discovery_failed())
+def discover_cameras(all_cameras, result, parallel=True):
+    start = time.perf_counter()
+    try:
+        result["found"] = locate_cameras() if all_cameras else locate_camera()
+    except Exception as e:
+        result["error"] = e
+    startup_mark("camera discovery", start if parallel else None)
+
+# reports the error of the camera discovery and exits, the same way as find_camera.py if pyudev is missing
+def discovery_failed(error):
+    import camera_registry
+    if camera_registry.pyudev is None:
+        print(f"{BOLD}{RED}*** This script requires the pyudev module. ***{RESET}")
+        print("Type:")
+        print("source /axelera/voyager-sdk/venv/bin/activate")
+        print("and then rerun. If it still fails, install pyudev with:")
+        print("pip install pyudev")
+    else:
+        print(f"{BOLD}{RED}Camera discovery failed: {error}{RESET}")
+    sys.exit(1)
+
+# record the end of a startup phase, sequential phases start where the previous one ended,
+# a phase that runs in parallel (camera discovery) passes its own start time
+def startup_mark(phase, start=None):
+    global startup_last
+    now = time.perf_counter()
+    startup_times[phase] = (now - (startup_last if start is None else start), now - startup_t0)
+    if start is None:
+        startup_last = now
+
+def print_startup_times():
+    print("Startup timing (from the start of the imports):")
+    for phase, (took, at) in startup_times.items():
+        print(f"  {phase:<20} {took * 1000:9.1f} ms, done at {at * 1000:9.1f} ms")
+
+# returns True if a frame should be rendered, given the display decimation settings
+# frames is the number of frames since the last render (including this one)
+def display_due(frames, last_show, now):
+    if frames < display_every:
+        return False
+    if display_fps > 0 and now - last_show < 1.0 / display_fps:
+        return False
+    return True
+
+# returns the seconds between the capture of a frame and now, or None if not known
+# clock is the timestamp_clock of the stream
+def frame_lag(frame_result, clock):
+    ts = getattr(frame_result, "src_timestamp", None) or getattr(frame_result, "timestamp", None)
+    if not ts:
+        return None
+    now = time.time() if clock == "wall" else time.monotonic()
+    return now - ts
+
+# hand a completed plate over to the background encoder,
+# unless the same plate was saved recently on this stream
+# it is the only crop of its track, so it is submitted with keep=True, a full encoder
+# queue then does not drop it, and this still returns at once
+def save_plate(plate, state):
+    stream_id = state.stream_id
+    if state.dedup.seen(plate.crop):
+        print(f"stream {stream_id} track {plate.track_id}: duplicate of a recent plate, not saved")
+        return
+    filename = os.path.join(crop_folder, f"plate_{stream_id}_{plate.track_id}.jpg")
+    print(f"stream {stream_id} track {plate.track_id}: plate {plate.box} sharpness {plate.sharpness:.1f} -> {filename}")
+    info = {"ts": time.time(), "stream_id": stream_id, "track_id": plate.track_id,
+            "box": [int(v) for v in plate.box], "sharpness": round(float(plate.sharpness), 2)}
+    encoder.submit(plate.crop, filename, stream_id, info, keep=True)
+    if lcd_sink:
+        lcd_sink.offer(f"Plate s{stream_id} t{plate.track_id}")  # only the newest is shown
+
+# hand the ROIs scored in the worker processes to the tracker of their stream
+def offer_scores(states, scores):
+    for (stream_id, track_id), box, view, sharp in scores:
+        states.get(stream_id).plates.offer(track_id, box, view, sharp)
+
+# called by the crop encoder once a crop is on disk, publishes and stores the plate event
+# data is the JPEG bytes, or None when the crop was written in a worker process
+def plate_written(filename, tag, info, data):
+    if info is None or (events is None and store is None):
+        return
+    if data is None and (events_inline or store):
+        with open(filename, "rb") as f:
+            data = f.read()
+    event = dict(info, path=os.path.abspath(filename))
+    if events:
+        events.publish(event, data if events_inline else b"")
+    if store:
+        store.add(event, data)
+
+# print the frame rate and crop counters of each stream
+def print_stream_stats(states):
+    for state in states:
+        sid = state.stream_id
+        crops = encoder.tag_stats(sid)
+        print(f"stream {sid}: {state.frame_index} frames, {metrics.fps(sid):.1f} fps, "
+              f"{state.plates.emitted} plates, {state.skipped} stale frames skipped, "
+              f"{state.suppressed} stationary crops suppressed, {state.dedup.hits} duplicates, "
+              f"crops written {crops['written']} dropped {crops['dropped']}")
+
 #########################################################
 # inference loop
 #########################################################
 def inference_loop(window, stream, app):
-    window.options(0, title="Vehicles View")  # window #0
+    # window is None in headless mode
+    if window is not None:
+        window.options(0, title="Vehicles View")  # window #0
     VEHICLE = ('car', 'truck', 'motorcycle')
     PLATES = ('licenseplate',)  
     center = lambda box: ((box[0] + box[2]) // 2, (box[1] + box[3]) // 2)
 
-    for frame_result in stream:
-        boxlist = []  # list of all of the boxes in this frame
-        window.show(frame_result.image, frame_result.meta, frame_result.stream_id)
-        # for veh in frame_result.tracking:
-        # for veh in frame_result["plate-detections"]:
-        for veh in getattr(frame_result, "tracking"):
-            if veh.label.name not in PLATES:
-                continue
-            if len(veh.history) < 2:
-                continue
-            boxlist.append(veh.history[0])
-            # print(f"{veh.label.name} {veh.track_id}: {center(veh.history[0])} → {center(veh.history[-1])} @ stream {frame_result.stream_id}")
-        # find the top three largest boxes
-        boxlist = sorted(boxlist, key=lambda b: (b[2] - b[0]) * (b[3] - b[1]), reverse=True)[:3]
-        for b in boxlist:
-            print(f"box: {b} center: {center(b)}")
-        # if there is one or more boxes, crop the largest one and save it to out.jpg
-        if len(boxlist) > 0:
-            box = boxlist[0]
-            # x1, y1, x2, y2 = box
-            pil_img = frame_result.image.aspil()
-            crop = pil_img.crop(box)
-            crop.save("output_crop.jpg", format="JPEG", quality=95)
+    global stream_states, startup_report
+    # crop and display state is kept separately for each camera
+    states = stream_state.StreamStates(best_plate.read_max_age(pipeline_yaml),
+                                       {"capacity": dedup_size, "ttl": dedup_ttl, "max_distance": dedup_distance})
+    stream_states = states
+    os.makedirs(crop_folder, exist_ok=True)
+    metrics.gauge("stream_frames_skipped_total", "Stale frames that skipped post-processing",
+                  lambda: {st.stream_id: st.skipped for st in states}, kind="counter", label="stream_id")
+    metrics.gauge("dedup_total", "Plate de-duplication cache lookups and evictions",
+                  lambda: {k: sum(st.dedup.stats()[k] for st in states) for k in ("hit", "miss", "eviction")},
+                  kind="counter", label="outcome")
+    metrics.gauge("stream_crops_suppressed_total", "Plate crops skipped because the track was stationary",
+                  lambda: {st.stream_id: st.suppressed for st in states}, kind="counter", label="stream_id")
 
+    clock = getattr(stream, "timestamp_clock", timestamp_clock)
+    t = metrics.clock()
+    for frame_result in stream:
+        t = metrics.stage("wait", t)  # time blocked on the stream iterator
+        metrics.frame(frame_result.stream_id)
+        state = states.get(frame_result.stream_id)
+        state.frame_index += 1
+        if recorder:
+            recorder.record(frame_result)
         image, meta = frame_result.image, frame_result.meta
         if image is None and meta is None:
-            if window.is_closed:
+            if window is not None and window.is_closed:
                 break
+            t = metrics.clock()
             continue
+        if startup_report:
+            startup_report = False
+            startup_mark("first frame")
+            print_startup_times()
 
-        if image:
-            window.show(image, meta, frame_result.stream_id)
+        # latest frame wins: if this frame is already older than the lag budget,
+        # only the track state is updated, the rendering and crop work is skipped
+        lag = frame_lag(frame_result, clock)
+        stale = lag_budget > 0 and lag is not None and lag > lag_budget
+        if stale:
+            state.skipped += 1
+        if lag is not None:
+            metrics.observe("lag", lag)
+
+        # render at most every Nth frame and/or at the target display FPS
+        if window is not None and image and not stale:
+            state.frames_since_show += 1
+            now = time.monotonic()
+            if display_due(state.frames_since_show, state.last_show, now):
+                window.show(image, meta, frame_result.stream_id)
+                state.frames_since_show, state.last_show = 0, now
+            t = metrics.stage("show", t)
+        # for veh in frame_result.tracking:
+        # for veh in frame_result["plate-detections"]:
+        # read the tracked objects into arrays, then filter and rank them in one go
+        snap = track_arrays.snapshot(getattr(frame_result, "tracking"), motion.window)
+        is_plate = track_arrays.label_mask(snap, PLATES) & (snap.history_len >= 2)
+        # find the top three largest boxes
+        if not stale:
+            boxlist = snap.first_boxes[track_arrays.top_k(snap.first_boxes, 3, is_plate)]
+            for b in boxlist.tolist():
+                print(f"box: {b} center: {center(b)}")
+        t = metrics.stage("filter", t)
+        # keep the best plate crop of each track, and save it once when the track ends
+        track_ids = snap.track_ids[is_plate].tolist()
+        boxes = snap.boxes[is_plate]  # most recent box of each plate
+        rois = [None] * len(track_ids)  # no crop, but the tracks are still kept alive
+        if len(track_ids) > 0 and image is not None and not stale:
+            # stationary tracks that already have a good crop need no more plate work
+            work = motion.select(state.plates, track_ids, boxes, snap.past_boxes[is_plate])
+            state.suppressed += len(track_ids) - int(work.sum())
+            if work.any():
+                # slice the boxes out of the frame buffer as views, no full frame conversion
+                frame_arr, bgr = roi.frame_array(image)
+                work_idx = work.nonzero()[0].tolist()
+                for i, r in zip(work_idx, roi.extract_rois(frame_arr, boxes[work], bgr)):
+                    rois[i] = r
+        sharps = [None] * len(track_ids)
+        if post_pool is not None:
+            offer_scores(states, post_pool.scores())  # ROIs of earlier frames scored in the workers
+            if any(r is not None for r in rois):
+                # large ROIs are scored in the workers, they come back with a later frame,
+                # until then they are not candidates
+                sharps = post_pool.sharpness(rois, [(state.stream_id, tid) for tid in track_ids], boxes.tolist())
+                rois = [r if s is not None else None for r, s in zip(rois, sharps)]
+        candidates = list(zip(track_ids, boxes.tolist(), rois, sharps))
+        for plate in state.plates.update(state.frame_index, candidates):
+            save_plate(plate, state)
+        t = metrics.stage("crop", t)
+        if lag is not None:
+            metrics.observe("latency", frame_lag(frame_result, clock))  # capture to end of processing
 
-        if window.is_closed:
+        if window is not None and window.is_closed:
             break
-    if stream.is_single_image():  # and args.display:
+        t = metrics.clock()
+    # the plates of the tracks still open, all of them are written before the encoder is closed
+    if post_pool is not None:
+        offer_scores(states, post_pool.scores(timeout=1.0))
+    for state in states:
+        for plate in state.plates.flush():
+            save_plate(plate, state)
+    print_stream_stats(states)
+    if stream.is_single_image() and window is not None:
         print("stream has a single frame, close the window or press Q to exit...")
         window.wait_for_close()
 
+# wait for the camera discovery thread (unless it already ran), exits if no camera was found
+def wait_for_discovery(thread, result):
+    if thread.ident is not None:
+        thread.join()
+        startup_mark("discovery wait")
+    if "error" in result:
+        discovery_failed(result["error"])
+    if not result.get("found"):
+        print(f"{BOLD}{RED}Camera with name containing '{camera_search_term}' not found!{RESET}")
+        sys.exit(1)
+    print_banner()
+
 #########################################################
 # main function
 #########################################################
 def main():
-    global stream
-    if not locate_camera():
-        print(f"{BOLD}{RED}Camera with name containing '{camera_search_term}' not found!{RESET}")
-        sys.exit(1)
-    print_banner()
+    global stream, encoder, metrics, headless, display_every, display_fps, recorder, lag_budget, timestamp_clock
+    global post_workers, post_pool, dedup_distance, dedup_ttl, lcd_sink, events, events_inline, store
+    global startup_report, camera_cache
+    parser = argparse.ArgumentParser(description="ANPR app for the Metis M.2 AI module")
+    parser.add_argument("--no-metrics", action="store_true", help="disable the loop instrumentation entirely")
+    parser.add_argument("--metrics-port", type=int, default=metrics_port, help="local HTTP port for the Prometheus metrics, 0 to disable")
+    parser.add_argument("--metrics-file", help="periodically rewrite the Prometheus metrics to this file")
+    parser.add_argument("--all-cameras", action="store_true", help="use every matching camera as a source of one inference stream")
+    parser.add_argument("--headless", action="store_true", help="run without a display (no monitor attached)")
+    parser.add_argument("--display-every", type=int, default=display_every, help="render only every Nth frame")
+    parser.add_argument("--display-fps", type=float, default=display_fps, help="render at no more than this frame rate")
+    parser.add_argument("--lag-budget", type=float, default=lag_budget * 1000,
+                        help="ms, skip post-processing of frames that are older than this (0 to disable)")
+    parser.add_argument("--timestamp-clock", choices=("wall", "monotonic"), default=timestamp_clock,
+                        help="clock of the frame timestamps, for the lag budget and the latency metric")
+    parser.add_argument("--motion-threshold", type=float, default=motion.threshold,
+                        help="pixels, tracks that moved less than this are not cropped again once captured (0 to disable)")
+    parser.add_argument("--motion-window", type=int, default=motion.window, help="history entries used for the motion gate")
+    parser.add_argument("--motion-min-sharpness", type=float, default=motion.min_sharpness,
+                        help="sharpness a capture needs before its track can be gated")
+    parser.add_argument("--dedup-distance", type=int, default=dedup_distance,
+                        help="bits, skip crops this close to a recently saved plate (-1 to disable)")
+    parser.add_argument("--dedup-ttl", type=float, default=dedup_ttl, help="seconds a saved plate is remembered")
+    parser.add_argument("--lcd", action="store_true", help="show plate events on the Pico LCD through SerialComms")
+    parser.add_argument("--lcd-interval", type=float, default=lcd_interval, help="seconds, minimum time between LCD messages")
+    parser.add_argument("--events", nargs="?", const=event_bus.default_path,
+                        help=f"publish plate events on this Unix socket (default {event_bus.default_path})")
+    parser.add_argument("--events-inline", action="store_true", help="with --events, also send the JPEG bytes of each crop")
+    parser.add_argument("--store", help="keep the plate events and crops in a plate_store folder")
+    parser.add_argument("--post-workers", type=int, default=post_workers,
+                        help="score and encode the plates in this many worker processes (0 for in-process)")
+    parser.add_argument("--serial-startup", action="store_true",
+                        help="find the camera before loading the SDK, instead of at the same time")
+    parser.add_argument("--refresh-cameras", action="store_true",
+                        help="probe the camera capabilities again instead of using the cached ones")
+    parser.add_argument("--record", help="record the tracking metadata to this file, for replay.ReplayStream")
+    parser.add_argument("--record-frames", type=int, default=0, help="with --record, also save every Nth frame image")
+    args = parser.parse_args()
+    startup_times["imports"] = (startup_imported - startup_t0, startup_imported - startup_t0)
+    startup_report = True
+    camera_cache = not args.refresh_cameras
+    user = pwd.getpwuid(os.getuid()).pw_name
+    print(f"Running as user: {user}")
+    # the camera discovery (pyudev) runs while the SDK is imported and the network is loaded
+    discovery = {}
+    discovery_thread = threading.Thread(target=discover_cameras, args=(args.all_cameras, discovery),
+                                        name="CameraDiscovery", daemon=True)
+    if args.serial_startup:
+        discover_cameras(args.all_cameras, discovery, parallel=False)
+        if "error" in discovery:
+            discovery_failed(discovery["error"])
+    else:
+        discovery_thread.start()
+    load_axelera()
+    startup_mark("SDK import")
+    headless = args.headless
+    display_every = max(1, args.display_every)
+    display_fps = max(0.0, args.display_fps)
+    lag_budget = max(0.0, args.lag_budget) / 1000
+    timestamp_clock = args.timestamp_clock
+    post_workers = max(0, args.post_workers)
+    events_inline = args.events_inline
+    dedup_distance = args.dedup_distance
+    dedup_ttl = args.dedup_ttl
+    motion.threshold = args.motion_threshold
+    motion.window = max(1, args.motion_window)
+    motion.min_sharpness = args.motion_min_sharpness
 
-    
     # was network="yolov5m-v7-coco-tracker",
     # replaced with
     # network="vehicles-then-plates",
+    sources = [
+        # str(input_source_name),
+        "/axelera/voyager-sdk/media/test_traffic_h264_1080p60.mp4",
+    ]
     try:
+        if not args.no_metrics:
+            metrics = stage_metrics.Metrics()
+            if args.metrics_port:
+                metrics.serve_http(args.metrics_port)
+            if args.metrics_file:
+                metrics.write_file(args.metrics_file)
+        if args.events:
+            events = event_bus.EventBus(args.events)
+            print(f"Publishing plate events on {args.events}")
+            metrics.gauge("events_total", "Plate events on the event bus by outcome",
+                          lambda: {k: v for k, v in events.stats().items() if k != "subscribers"},
+                          kind="counter", label="outcome")
+            metrics.gauge("event_subscribers", "Processes subscribed to the event bus",
+                          lambda: events.stats()["subscribers"])
+        if args.store:
+            import plate_store
+            store = plate_store.PlateStore(args.store)
+            print(f"Storing plate events in {args.store}")
+            metrics.gauge("store_events_total", "Plate events of the event store by outcome",
+                          lambda: {k: v for k, v in store.stats().items() if k != "batches"},
+                          kind="counter", label="outcome")
+        if post_workers > 0:
+            import shm_pool
+            post_pool = shm_pool.ShmPool(post_workers, queue_depth=encoder_queue_depth, quality=crop_quality,
+                                         metrics=metrics, on_written=plate_written)
+            encoder = post_pool
+        else:
+            encoder = crop_encoder.CropEncoder(encoder_queue_depth, encoder_workers, crop_quality, metrics,
+                                               on_written=plate_written)
+        metrics.gauge("encoder_queue_depth", "Crops waiting to be encoded", encoder.depth)
+        metrics.gauge("crops_total", "Plate crops by outcome",
+                      lambda: {k: v for k, v in encoder.stats().items() if k != "depth"}, kind="counter", label="outcome")
+        for outcome in ("written", "dropped"):
+            metrics.gauge(f"stream_crops_{outcome}_total", f"Plate crops {outcome} per stream",
+                          lambda o=outcome: {sid: c[o] for sid, c in encoder.tag_stats().items()},
+                          kind="counter", label="stream_id")
+        if args.lcd:
+            import plate_sink
+            lcd_sink = plate_sink.LatestSender(min_interval=args.lcd_interval)
+            metrics.gauge("lcd_messages_total", "Plate messages for the Pico LCD by outcome", lcd_sink.stats,
+                          kind="counter", label="outcome")
+        if args.record:
+            import replay
+            recorder = replay.MetadataRecorder(args.record, args.record_frames)
+        startup_mark("setup")
+        if args.all_cameras:
+            # the cameras are the sources, so this waits for the discovery
+            wait_for_discovery(discovery_thread, discovery)
+            sources = list(input_source_names)  # one inference stream, several cameras
         stream = create_inference_stream(
             network="vehicle-plates-reference-design",
-            sources=[
-                # str(input_source_name),
-                "/axelera/voyager-sdk/media/test_traffic_h264_1080p60.mp4",
-            ],
+            sources=sources,
         )
+        startup_mark("stream creation")
+        if not args.all_cameras:
+            wait_for_discovery(discovery_thread, discovery)
 
-        with display.App(visible=True) as app:
-            wnd = app.create_window("Graphic Window", (900, 600))
-            app.start_thread(inference_loop, (wnd, stream, app), name='InferenceThread')
-            app.run()
+        if headless:
+            inference_loop(None, stream, None)
+        else:
+            with display.App(visible=True) as app:
+                wnd = app.create_window("Graphic Window", (900, 600))
+                app.start_thread(inference_loop, (wnd, stream, app), name='InferenceThread')
+                app.run()
     except KeyboardInterrupt:
         print("Interrupted by user")
     except Exception as e:
@@ -146,6 +519,24 @@ def main():
     finally:
         if stream:
             stream.stop()
+        if encoder:
+            encoder.close()
+            print(f"Crops: {encoder.stats()}")
+        if lcd_sink:
+            lcd_sink.close()
+            print(f"LCD messages: {lcd_sink.stats()}")
+        if events:
+            print(f"Plate events: {events.stats()}")
+            events.close()
+        if store:
+            store.close()
+            print(f"Plate store: {store.stats()}")
+        metrics.close()
+        if recorder:
+            recorder.close()
+            print(f"Recorded {recorder.count} frames to {args.record}")
+            if recorder.frame_stats():
+                print(f"Frame images: {recorder.frame_stats()}")
         print("Exiting")
 
 
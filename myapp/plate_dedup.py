@@ -0,0 +1,84 @@
+# Perceptual hash de-duplication of plate crops
+# rev 0.1 - shabaz - August 2025
+
+# The same plate can be emitted several times, when the tracker drops and
+# re-acquires a vehicle under a new track id, or when a vehicle loops around a
+# car park. Each crop gets a 64 bit difference hash (dHash), and it is skipped if
+# a hash within max_distance bits was seen less than ttl seconds ago. Crops
+# too small to hash are never treated as duplicates.
+# The recent hashes are kept in a bounded LRU cache.
+
+import time
+from collections import OrderedDict
+import numpy as np
+
+GRAY = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+# 64 bit difference hash of an (H, W, C) or (H, W) image, as an int
+# the image is area-averaged down to 9x8 and adjacent columns are compared
+# returns None if the image is smaller than that
+def dhash(img, size=8):
+    a = np.asarray(img)
+    g = a[..., :3].astype(np.float32) @ GRAY[:a.shape[2]] if a.ndim == 3 else a.astype(np.float32)
+    h, w = g.shape
+    if h < size or w < size + 1:
+        return None
+    rows = np.linspace(0, h, size + 1).astype(np.intp)[:-1]
+    cols = np.linspace(0, w, size + 2).astype(np.intp)[:-1]
+    small = np.add.reduceat(np.add.reduceat(g, rows, axis=0), cols, axis=1)
+    small /= np.outer(np.diff(np.append(rows, h)), np.diff(np.append(cols, w)))
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class PlateDedup:
+    # max_distance is in bits of the 64 bit hash, a negative value disables the de-duplication
+    def __init__(self, capacity=256, ttl=300.0, max_distance=6):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.cache = OrderedDict()  # hash -> time last seen, least recently seen first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # returns True if a similar crop was seen recently (and the crop should be skipped)
+    # the crop's hash is remembered either way, a crop too small to hash is never skipped
+    def seen(self, crop, now=None):
+        if self.max_distance < 0:
+            return False
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        h = dhash(crop)
+        if h is None:
+            self.misses += 1
+            return False
+        match = None
+        for cached in self.cache:
+            if (cached ^ h).bit_count() <= self.max_distance:
+                match = cached
+                break
+        if match is not None:
+            self.hits += 1
+            self.cache[match] = now
+            self.cache.move_to_end(match)
+            return True
+        self.misses += 1
+        self.cache[h] = now
+        self.cache.move_to_end(h)
+        while len(self.cache) > self.capacity:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+        return False
+
+    def stats(self):
+        return {"hit": self.hits, "miss": self.misses, "eviction": self.evictions}
+
+    def _expire(self, now):
+        while self.cache:
+            h, last_seen = next(iter(self.cache.items()))
+            if now - last_seen <= self.ttl:
+                break
+            del self.cache[h]
+            self.evictions += 1
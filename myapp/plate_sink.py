@@ -0,0 +1,100 @@
+# Non-blocking plate event sink for the Pico LCD
+# rev 0.1 - shabaz - August 2025
+
+# SerialComms.send() takes around 10 ms per character, far too slow to call
+# from the inference thread. Events are handed to a
+# background sender instead. The 16x2 LCD only shows the latest message, so
+# only the newest pending message is kept: a message that has not been sent
+# yet is replaced (coalesced) by the next one. Messages are sent at most once
+# every min_interval seconds.
+
+import os
+import sys
+import threading
+import time
+
+LCD_WIDTH = 16
+
+
+# import SerialComms from this folder, or from the serial_comms_interface folder of the repo
+def _serial_comms_class():
+    try:
+        from SerialComms import SerialComms
+    except ImportError:
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "serial_comms_interface"))
+        from SerialComms import SerialComms
+    return SerialComms
+
+
+class LatestSender:
+    # send is called with each message from the sender thread, by default a
+    # persistent SerialComms connection is opened (in the sender thread) and its send() is used
+    def __init__(self, send=None, min_interval=0.5, width=LCD_WIDTH):
+        self.send_fn = send
+        self.comms = None  # the SerialComms connection, when send is not given
+        self.min_interval = min_interval
+        self.width = width
+        self.message = None  # newest message not sent yet
+        self.cond = threading.Condition()
+        self.running = True
+        # counters
+        self.offered = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.thread = threading.Thread(target=self._run, name="PlateSink", daemon=True)
+        self.thread.start()
+
+    # hand a message to the sender, never blocks
+    def offer(self, message):
+        with self.cond:
+            if not self.running:
+                return
+            if self.message is not None:
+                self.coalesced += 1
+            self.message = message[:self.width] if self.width else message
+            self.offered += 1
+            self.cond.notify()
+
+    def stats(self):
+        with self.cond:
+            return {"offered": self.offered, "sent": self.sent, "coalesced": self.coalesced, "errors": self.errors}
+
+    # stop the sender, the pending message (if any) is sent first
+    def close(self, timeout=5.0):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join(timeout)
+        if self.comms:
+            self.comms.close()
+
+    def _run(self):
+        last_send = 0.0
+        while True:
+            with self.cond:
+                while self.running and self.message is None:
+                    self.cond.wait()
+                if self.message is None:
+                    return  # closed and nothing pending
+            # rate limit, newer messages can still replace the pending one meanwhile
+            delay = last_send + self.min_interval - time.monotonic()
+            if delay > 0:
+                with self.cond:
+                    self.cond.wait_for(lambda: not self.running, delay)
+            with self.cond:
+                message, self.message = self.message, None
+            if message is None:
+                continue
+            try:
+                if self.send_fn is None:
+                    self.comms = _serial_comms_class()(persistent=True)
+                    self.send_fn = self.comms.send
+                self.send_fn(message)
+                with self.cond:
+                    self.sent += 1
+            except Exception as e:
+                with self.cond:
+                    self.errors += 1
+                print(f"Plate sink error: {e}")
+            last_send = time.monotonic()
@@ -0,0 +1,279 @@
+# Append-only plate event store
+# rev 0.1 - shabaz - August 2025
+
+# A queryable history of the plate sightings. The events go into an SQLite
+# database in WAL mode, with indexes on the time, stream_id and track_id. The
+# crop JPEGs are appended to segment files (crops-000001.seg, ...), a new segment
+# is started when the current one reaches segment_bytes, and each event row
+# records the segment, offset and length of its crop.
+#
+# add() only appends to a bounded queue and never blocks, a writer thread
+# commits the events in batches, once batch_size events are pending or after
+# batch_interval seconds, so there is one transaction per batch and not per event.
+#
+# Query from the command line, e.g.
+#   python plate_store.py plates --since 1h --stream 0
+#   python plate_store.py plates --from 2025-08-01T08:00 --to 2025-08-01T09:00 --export out
+#   python plate_store.py plates --summary
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+DB_NAME = "events.db"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plates (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    stream_id INTEGER,
+    track_id INTEGER,
+    x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
+    sharpness REAL,
+    path TEXT,
+    segment INTEGER,
+    offset INTEGER,
+    length INTEGER
+);
+CREATE INDEX IF NOT EXISTS plates_ts ON plates (ts);
+CREATE INDEX IF NOT EXISTS plates_stream_ts ON plates (stream_id, ts);
+CREATE INDEX IF NOT EXISTS plates_track ON plates (track_id);
+"""
+COLUMNS = ("id", "ts", "stream_id", "track_id", "x1", "y1", "x2", "y2", "sharpness", "path", "segment", "offset", "length")
+
+
+def connect(folder, readonly=False):
+    path = os.path.join(folder, DB_NAME)
+    if readonly:
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    else:
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")  # safe with WAL, no fsync per commit
+        db.executescript(SCHEMA)
+    return db
+
+
+def segment_path(folder, segment):
+    return os.path.join(folder, f"crops-{segment:06d}.seg")
+
+
+class PlateStore:
+    # queue_depth bounds the events waiting for the writer, the oldest are dropped when full
+    # segment_bytes is the size at which a new crop segment file is started
+    def __init__(self, folder, batch_size=256, batch_interval=1.0, queue_depth=10000, segment_bytes=64 << 20):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.batch_size = max(1, batch_size)
+        self.batch_interval = batch_interval
+        self.queue_depth = max(1, queue_depth)
+        self.segment_bytes = segment_bytes
+        self.db = connect(folder)
+        last = self.db.execute("SELECT MAX(segment) FROM plates").fetchone()[0]
+        self.segment = last or 1
+        self.segment_file = None
+        self.pending = deque()
+        self.cond = threading.Condition()
+        self.running = True
+        # counters
+        self.added = 0
+        self.dropped = 0
+        self.stored = 0
+        self.batches = 0
+        self.errors = 0
+        self.thread = threading.Thread(target=self._run, name="PlateStore", daemon=True)
+        self.thread.start()
+
+    # queue an event for storing, never blocks
+    # event is a dict with ts, stream_id, track_id, box, sharpness and path (as the
+    # event bus events), jpeg is the crop as JPEG bytes (optional)
+    def add(self, event, jpeg=None):
+        with self.cond:
+            if not self.running:
+                return False
+            if len(self.pending) >= self.queue_depth:
+                self.pending.popleft()
+                self.dropped += 1
+            self.pending.append((event, jpeg))
+            self.added += 1
+            if len(self.pending) >= self.batch_size:
+                self.cond.notify()
+        return True
+
+    def depth(self):
+        with self.cond:
+            return len(self.pending)
+
+    def stats(self):
+        with self.cond:
+            return {"added": self.added, "stored": self.stored, "dropped": self.dropped,
+                    "errors": self.errors, "batches": self.batches}
+
+    # stop the writer, anything still queued is stored first
+    def close(self, timeout=10.0):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join(timeout)
+        if self.segment_file:
+            self.segment_file.close()
+        self.db.close()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                deadline = time.monotonic() + self.batch_interval
+                while self.running and len(self.pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                batch = [self.pending.popleft() for _ in range(min(len(self.pending), self.batch_size))]
+                if not batch and not self.running:
+                    return  # closed and drained
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+                with self.cond:
+                    self.stored += len(batch)
+                    self.batches += 1
+            except Exception as e:
+                with self.cond:
+                    self.errors += len(batch)
+                print(f"Plate store error: {e}")
+
+    # append the crops to the current segment, then insert the rows in one transaction
+    def _write(self, batch):
+        rows = []
+        for event, jpeg in batch:
+            segment = offset = length = None
+            if jpeg:
+                f = self._segment_for(len(jpeg))
+                offset = f.tell()
+                f.write(jpeg)
+                segment, length = self.segment, len(jpeg)
+            box = event.get("box") or (None, None, None, None)
+            rows.append((event.get("ts", time.time()), event.get("stream_id"), event.get("track_id"),
+                         *box[:4], event.get("sharpness"), event.get("path"), segment, offset, length))
+        if self.segment_file:
+            self.segment_file.flush()  # the crops are readable before their rows are
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO plates (ts, stream_id, track_id, x1, y1, x2, y2, sharpness, path, segment, offset, length)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _segment_for(self, size):
+        if self.segment_file is None:
+            self.segment_file = open(segment_path(self.folder, self.segment), "ab")
+        if self.segment_file.tell() > 0 and self.segment_file.tell() + size > self.segment_bytes:
+            self.segment_file.close()
+            self.segment += 1
+            self.segment_file = open(segment_path(self.folder, self.segment), "ab")
+        return self.segment_file
+
+
+# query the store, returns a list of row dicts, oldest first
+# start and end are epoch seconds, the other filters are skipped when None
+def query(folder, start=None, end=None, stream_id=None, track_id=None, limit=None):
+    where, args = [], []
+    for clause, value in (("ts >= ?", start), ("ts < ?", end), ("stream_id = ?", stream_id),
+                          ("track_id = ?", track_id)):
+        if value is not None:
+            where.append(clause)
+            args.append(value)
+    sql = f"SELECT {', '.join(COLUMNS)} FROM plates"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY ts"
+    if limit:
+        sql += " LIMIT ?"
+        args.append(limit)
+    db = connect(folder, readonly=True)
+    try:
+        return [dict(zip(COLUMNS, row)) for row in db.execute(sql, args)]
+    finally:
+        db.close()
+
+
+# number of plates and time range of each stream
+def summary(folder):
+    db = connect(folder, readonly=True)
+    try:
+        rows = db.execute("SELECT stream_id, COUNT(*), MIN(ts), MAX(ts) FROM plates GROUP BY stream_id ORDER BY stream_id")
+        return [{"stream_id": r[0], "plates": r[1], "first": r[2], "last": r[3]} for r in rows]
+    finally:
+        db.close()
+
+
+# the JPEG bytes of the crop of a row, or None if it was stored without one
+def read_crop(folder, row):
+    if row["segment"] is None:
+        return None
+    with open(segment_path(folder, row["segment"]), "rb") as f:
+        f.seek(row["offset"])
+        return f.read(row["length"])
+
+
+# a time on the command line: epoch seconds, an ISO date/time, or a duration ago (30s, 10m, 2h, 1d)
+def parse_time(text):
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if text[-1:] in units and text[:-1].replace(".", "", 1).isdigit():
+        return time.time() - float(text[:-1]) * units[text[-1]]
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+def format_time(ts):
+    return datetime.fromtimestamp(ts).isoformat(sep=" ", timespec="milliseconds")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the plate event store")
+    parser.add_argument("folder", help="store folder (the --store folder of myapp)")
+    parser.add_argument("--since", "--from", dest="start", help="start time: epoch, ISO time, or ago e.g. 10m")
+    parser.add_argument("--until", "--to", dest="end", help="end time: epoch, ISO time, or ago e.g. 5m")
+    parser.add_argument("--stream", type=int, help="only this stream_id (camera)")
+    parser.add_argument("--track", type=int, help="only this track_id")
+    parser.add_argument("--limit", type=int, help="at most this many plates")
+    parser.add_argument("--summary", action="store_true", help="count the plates of each camera")
+    parser.add_argument("--export", help="write the crops of the matching plates to this folder")
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    args = parser.parse_args()
+    if not os.path.exists(os.path.join(args.folder, DB_NAME)):
+        parser.error(f"no plate store in {args.folder}")
+    if args.summary:
+        for s in summary(args.folder):
+            if args.json:
+                print(json.dumps(s))
+            else:
+                print(f"stream {s['stream_id']}: {s['plates']} plates, {format_time(s['first'])} .. {format_time(s['last'])}")
+        return
+    start = parse_time(args.start) if args.start else None
+    end = parse_time(args.end) if args.end else None
+    rows = query(args.folder, start, end, args.stream, args.track, args.limit)
+    if args.export:
+        os.makedirs(args.export, exist_ok=True)
+    for row in rows:
+        if args.export:
+            data = read_crop(args.folder, row)
+            if data:
+                with open(os.path.join(args.export, f"plate_{row['id']}_{row['stream_id']}_{row['track_id']}.jpg"), "wb") as f:
+                    f.write(data)
+        if args.json:
+            print(json.dumps(row))
+        else:
+            print(f"{format_time(row['ts'])} stream {row['stream_id']} track {row['track_id']} "
+                  f"box {[row['x1'], row['y1'], row['x2'], row['y2']]} sharpness {row['sharpness']} {row['path'] or ''}")
+    if not args.json:
+        print(f"{len(rows)} plates")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# Example subscriber of the plate event bus
+# rev 0.1 - shabaz - August 2025
+
+# Prints each plate event published by myapp.py --events as a line of JSON,
+# and optionally saves the inline JPEG crops.
+# example:
+#   python plate_subscriber.py --path /tmp/anpr-events.sock --save-dir plates
+
+import argparse
+import json
+import os
+import event_bus
+
+
+def main():
+    p = argparse.ArgumentParser(description="Print the plate events published by myapp.py --events")
+    p.add_argument("--path", default=event_bus.default_path, help="Unix domain socket of the event bus")
+    p.add_argument("--save-dir", help="save inline JPEG crops to this folder")
+    args = p.parse_args()
+    if args.save_dir:
+        os.makedirs(args.save_dir, exist_ok=True)
+    sub = event_bus.Subscriber(args.path)
+    try:
+        for event, blob in sub:
+            if blob and args.save_dir:
+                filename = os.path.join(args.save_dir, f"plate_{event.get('stream_id')}_{event.get('track_id')}.jpg")
+                with open(filename, "wb") as f:
+                    f.write(blob)
+                event["saved"] = filename
+            print(json.dumps(event), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sub.close()
+
+
+if __name__ == "__main__":
+    main()
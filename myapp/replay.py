@@ -0,0 +1,284 @@
+# Stand-in inference streams for running inference_loop without Metis hardware
+# rev 0.1 - shabaz - August 2025
+
+# SyntheticStream generates frames with moving vehicles and their plates,
+# ReplayStream plays back tracking metadata captured from a live run with
+# MetadataRecorder. OffscreenWindow stands in for the display window, so the
+# cost of rendering can be measured without a screen. The streams expose the part of the Axelera stream that myapp uses:
+# iteration over frame results with .image (aspil(), asarray()), .meta,
+# .stream_id and .tracking (label, track_id, history), plus is_single_image()
+# and stop().
+#
+# The recording is a gzip file with one JSON line per frame:
+#   {"t": timestamp, "s": stream_id, "w": width, "h": height,
+#    "o": [[track_id, label_name, label_value, [x1, y1, x2, y2, x1, y1, ...]], ...]}
+# history boxes are flattened, oldest first.
+
+import gzip
+import json
+import os
+import random
+import time
+from collections import deque
+import numpy as np
+import crop_encoder
+
+HISTORY_LENGTH = 30  # same as the tracker history_length in vehicles-then-plates.yaml
+
+
+class Label:
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+class TrackedObject:
+    def __init__(self, track_id, label, history):
+        self.track_id = track_id
+        self.label = label
+        self.history = history  # list of (x1, y1, x2, y2), oldest first
+
+
+class Image:
+    def __init__(self, array):
+        self.array = array
+        self.color_format = "RGB"
+
+    def asarray(self):
+        return self.array
+
+    def aspil(self):
+        from PIL import Image as PILImage
+        return PILImage.fromarray(self.array)
+
+    @property
+    def size(self):
+        return self.array.shape[1], self.array.shape[0]
+
+
+class FrameResult:
+    def __init__(self, image, tracking, stream_id=0, meta=None, src_timestamp=None):
+        self.image = image
+        self.meta = meta if meta is not None else {}
+        self.stream_id = stream_id
+        self.tracking = tracking
+        self.src_timestamp = src_timestamp if src_timestamp is not None else time.time()
+
+
+# stand-in for the window of the display app, each frame shown is converted and scaled
+# to the window size, as the display does before drawing it, but nothing is drawn on screen
+class OffscreenWindow:
+    def __init__(self, size=(900, 600)):
+        self.size = size
+        self.is_closed = False
+        self.shown = 0
+        self.last = None  # the last rendered frame, a PIL image
+
+    def options(self, *args, **kwargs):
+        pass
+
+    def show(self, image, meta=None, stream_id=0):
+        from PIL import Image as PILImage
+        self.last = image.aspil().resize(self.size, PILImage.Resampling.BILINEAR)
+        self.shown += 1
+
+    def wait_for_close(self):
+        pass
+
+
+# a frame sized buffer of noise, so that crops have some texture to encode and score
+def noise_frame(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+
+class _Stream:
+    timestamp_clock = "wall"  # src_timestamp is a time.time(), see myapp.frame_lag()
+
+    def __iter__(self):
+        return self.frames()
+
+    def is_single_image(self):
+        return False
+
+    def stop(self):
+        self.stopped = True
+
+
+class SyntheticStream(_Stream):
+    LABELS = {"car": Label("car", 2), "licenseplate": Label("licenseplate", 0)}
+
+    # vehicles is the number of vehicles in view at any time on each stream
+    # fps paces the frames in real time if realtime is True, otherwise frames are produced as fast as possible
+    # parked is the fraction of the vehicles that do not move (car park scenes)
+    def __init__(self, frames=600, vehicles=10, streams=1, width=1920, height=1080,
+                 fps=60, realtime=False, seed=1, parked=0.0):
+        self.num_frames = frames
+        self.vehicles = vehicles
+        self.streams = streams
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.realtime = realtime
+        self.parked = parked
+        self.rng = random.Random(seed)
+        self.stopped = False
+        self.next_track_id = 1
+        self.buffers = [Image(noise_frame(width, height, seed + s)) for s in range(streams)]
+        self.scenes = [[] for _ in range(streams)]
+
+    def _spawn(self):
+        # a car moving horizontally across the frame, with its plate
+        w = self.rng.randint(250, 600)
+        h = int(w * 0.6)
+        y = self.rng.randint(0, max(1, self.height - h))
+        vx = self.rng.choice((-1, 1)) * self.rng.uniform(4, 25)
+        x = -w if vx > 0 else self.width
+        if self.rng.random() < self.parked:
+            vx, x = 0.0, self.rng.randint(0, max(0, self.width - w))
+        car_id, plate_id = self.next_track_id, self.next_track_id + 1
+        self.next_track_id += 2
+        return {"x": float(x), "y": y, "w": w, "h": h, "vx": vx,
+                "car": TrackedObject(car_id, self.LABELS["car"], deque(maxlen=HISTORY_LENGTH)),
+                "plate": TrackedObject(plate_id, self.LABELS["licenseplate"], deque(maxlen=HISTORY_LENGTH))}
+
+    def _step(self, scene):
+        while len(scene) < self.vehicles:
+            scene.append(self._spawn())
+        for v in scene:
+            v["x"] += v["vx"]
+            x1, y1 = int(v["x"]), v["y"]
+            v["car"].history.append((x1, y1, x1 + v["w"], y1 + v["h"]))
+            pw, ph = v["w"] // 3, v["h"] // 6
+            px, py = x1 + (v["w"] - pw) // 2, y1 + v["h"] - ph - v["h"] // 10
+            v["plate"].history.append((px, py, px + pw, py + ph))
+        scene[:] = [v for v in scene if -v["w"] <= v["x"] <= self.width]
+
+    def frames(self):
+        start = time.monotonic()
+        wall_start = time.time()
+        for n in range(self.num_frames):
+            if self.stopped:
+                return
+            # in real time the frame is captured on schedule, even if the consumer is late
+            captured = wall_start + n / self.fps if self.realtime else None
+            for s in range(self.streams):
+                scene = self.scenes[s]
+                self._step(scene)
+                tracking = []
+                for v in scene:
+                    for obj in (v["car"], v["plate"]):
+                        tracking.append(TrackedObject(obj.track_id, obj.label, list(obj.history)))
+                yield FrameResult(self.buffers[s], tracking, stream_id=s, src_timestamp=captured)
+            if self.realtime:
+                delay = start + (n + 1) / self.fps - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+
+class ReplayStream(_Stream):
+    # path is a recording made by MetadataRecorder
+    # if frames were recorded (frames_dir exists), they are used as the images
+    def __init__(self, path, fps=0, loop=1):
+        self.path = path
+        self.fps = fps  # 0 to replay as fast as possible
+        self.loop = loop
+        self.stopped = False
+        self.frames_dir = MetadataRecorder.frames_dir_for(path)
+        self.labels = {}
+        self.buffers = {}
+
+    def _image(self, index, record):
+        filename = os.path.join(self.frames_dir, f"frame_{index:06d}.jpg")
+        if os.path.isfile(filename):
+            from PIL import Image as PILImage
+            with PILImage.open(filename) as im:
+                return Image(np.asarray(im.convert("RGB")))
+        size = (record["w"], record["h"])
+        if size not in self.buffers:
+            self.buffers[size] = Image(noise_frame(*size))
+        return self.buffers[size]
+
+    def _label(self, name, value):
+        key = (name, value)
+        if key not in self.labels:
+            self.labels[key] = Label(name, value)
+        return self.labels[key]
+
+    def frames(self):
+        start = time.monotonic()
+        wall_start = time.time()
+        n = 0
+        for _ in range(self.loop):
+            with gzip.open(self.path, "rt") as f:
+                for index, line in enumerate(f):
+                    if self.stopped:
+                        return
+                    record = json.loads(line)
+                    tracking = []
+                    for track_id, name, value, flat in record["o"]:
+                        history = [tuple(flat[i:i + 4]) for i in range(0, len(flat), 4)]
+                        tracking.append(TrackedObject(track_id, self._label(name, value), history))
+                    captured = wall_start + n / self.fps if self.fps > 0 else None
+                    yield FrameResult(self._image(index, record), tracking, stream_id=record["s"],
+                                      src_timestamp=captured)
+                    n += 1
+                    if self.fps > 0:
+                        delay = start + n / self.fps - time.monotonic()
+                        if delay > 0:
+                            time.sleep(delay)
+
+
+class MetadataRecorder:
+    # every_nth_frame > 0 also saves every Nth frame image as a JPEG, for replay with pixels
+    # the frames are encoded and written by a crop_encoder.CropEncoder thread, not by the caller,
+    # if more than queue_depth are waiting the oldest is dropped (and counted in frame_stats())
+    def __init__(self, path, every_nth_frame=0, queue_depth=8):
+        self.path = path
+        self.every_nth_frame = every_nth_frame
+        self.file = gzip.open(path, "wt", compresslevel=6)
+        self.count = 0
+        self.encoder = None
+        if every_nth_frame > 0:
+            os.makedirs(self.frames_dir_for(path), exist_ok=True)
+            self.encoder = crop_encoder.CropEncoder(queue_depth, workers=1, quality=90)
+
+    @staticmethod
+    def frames_dir_for(path):
+        return f"{path}.frames"
+
+    def record(self, frame_result):
+        objects = []
+        for obj in getattr(frame_result, "tracking", None) or []:
+            value = getattr(obj.label, "value", -1)
+            flat = [int(v) for box in obj.history for v in list(box)[:4]]
+            objects.append([int(obj.track_id), obj.label.name, value if isinstance(value, int) else -1, flat])
+        image = frame_result.image
+        width, height = _image_size(image)
+        record = {"t": round(getattr(frame_result, "src_timestamp", None) or time.time(), 4),
+                  "s": frame_result.stream_id, "w": width, "h": height, "o": objects}
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        if self.every_nth_frame > 0 and image is not None and self.count % self.every_nth_frame == 0:
+            filename = os.path.join(self.frames_dir_for(self.path), f"frame_{self.count:06d}.jpg")
+            self.encoder.submit(image.aspil(), filename)
+        self.count += 1
+
+    # the CropEncoder counters of the saved frames, None if no frames are saved
+    def frame_stats(self):
+        return self.encoder.stats() if self.encoder else None
+
+    # the frames still queued are written first
+    def close(self):
+        if self.encoder:
+            self.encoder.close()
+        self.file.close()
+
+
+def _image_size(image):
+    if image is None:
+        return 0, 0
+    size = getattr(image, "size", None)
+    if size is not None:
+        return int(size[0]), int(size[1])
+    arr = image.asarray()
+    return arr.shape[1], arr.shape[0]
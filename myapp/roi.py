@@ -0,0 +1,57 @@
+# Region-of-interest extraction straight from the frame buffer
+# rev 0.1 - shabaz - August 2025
+
+# Converting a full 1920x1080 frame with aspil() just to cut out a small plate
+# costs a full frame allocation and copy. Instead, the frame is viewed as a
+# NumPy array (no copy) and the plate boxes are sliced out as views.
+# The ROI pixels are only copied when they are handed over to the encoder.
+
+import numpy as np
+
+
+# returns an (H, W, C) array for the frame image, sharing its memory when possible
+# along with True if the channels are in BGR (or BGRA) order
+def frame_array(image):
+    bgr = False
+    if hasattr(image, "asarray"):
+        arr = image.asarray()  # native color format, no conversion
+        fmt = getattr(image, "color_format", None)
+        bgr = getattr(fmt, "name", str(fmt)).upper().startswith("BGR")
+    else:
+        arr = np.asarray(image.aspil())  # fallback, full frame conversion
+    return arr, bgr
+
+
+# clip a batch of (x1, y1, x2, y2) boxes to the frame size, as integers
+# boxes with no area left after clipping have x2 <= x1 or y2 <= y1
+def clip_boxes(boxes, width, height):
+    b = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+    if b.size == 0:
+        return b
+    b = b.copy()
+    np.clip(b[:, 0::2], 0, width, out=b[:, 0::2])
+    np.clip(b[:, 1::2], 0, height, out=b[:, 1::2])
+    return b
+
+
+# slice all of the boxes out of the frame array in one pass
+# returns a list of views into arr (empty boxes are returned as None)
+def extract_rois(arr, boxes, bgr=False):
+    b = clip_boxes(boxes, arr.shape[1], arr.shape[0])
+    rois = []
+    for x1, y1, x2, y2 in b.tolist():
+        if x2 <= x1 or y2 <= y1:
+            rois.append(None)
+            continue
+        view = arr[y1:y2, x1:x2]
+        if view.ndim == 3 and view.shape[2] == 4:
+            view = view[..., :3]  # drop the alpha channel
+        if bgr:
+            view = view[..., ::-1]  # still a view, reordered when copied
+        rois.append(view)
+    return rois
+
+
+# copy a ROI view into its own contiguous RGB buffer, ready to be handed off
+def detach(roi):
+    return np.ascontiguousarray(roi)
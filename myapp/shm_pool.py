@@ -0,0 +1,319 @@
+# Multiprocess post-processing with shared memory frame hand-off
+# rev 0.1 - shabaz - August 2025
+
+# The plate scoring and JPEG encoding can be moved off the inference thread
+# (and out of the GIL) to a pool of worker processes. The pixels are not
+# pickled, they are copied into a slot of one shared memory block and the
+# worker is only sent the slot number, shape and dtype. The workers send back
+# small result records (a sharpness value, or the size of the written file).
+#
+# Jobs are routed to a worker by key (e.g. the crop filename, one per track),
+# and each worker handles its jobs in order, so the results of a track are
+# always returned in the order they were submitted.
+#
+# ShmPool has the same submit()/stats()/close() interface as CropEncoder, so it
+# can be used as the crop encoder of myapp, and sharpness() scores a batch of
+# ROIs. The on_written callback is called from the collector thread, without
+# the JPEG bytes (they stay in the worker).
+# A plate ROI is scored inline by default, it takes about 0.1 ms, less than the
+# hand-off to a worker. Only ROIs of at least inline_below pixels are scored in
+# the workers, sharpness() does not wait for them, their scores are collected
+# with scores() on a later frame, so the inference thread is never held up.
+
+import itertools
+import multiprocessing as mp
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+import numpy as np
+import best_plate
+import crop_encoder
+
+_FAILED = object()  # a score job that failed in the worker, scored inline instead
+
+
+def _worker(shm_name, slot_bytes, jobs, results, quality):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        seq, kind, slot, shape, dtype, key, tag, filename, payload = job
+        arr = None
+        try:
+            if slot >= 0:
+                arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=slot * slot_bytes)
+            else:
+                arr = payload  # did not fit in a slot, sent pickled
+            timings = {}
+            if kind == "score":
+                out = best_plate.sharpness(arr)
+            else:
+                t = time.perf_counter()
+                data = crop_encoder.encode_jpeg(arr, quality)
+                arr = None  # the slot is no longer needed
+                timings["encode"] = time.perf_counter() - t
+                t = time.perf_counter()
+                crop_encoder.write_file(data, filename)
+                timings["save"] = time.perf_counter() - t
+                out = len(data)
+            arr = None
+            results.put((seq, kind, slot, key, tag, out, timings, None))
+        except Exception as e:
+            arr = None
+            results.put((seq, kind, slot, key, tag, None, {}, f"{filename or kind}: {e}"))
+    shm.close()
+
+
+class ShmPool:
+    # slot_bytes must hold the largest ROI (or frame) that is handed over,
+    # anything larger is sent pickled instead
+    # ROIs with fewer than inline_below pixels are scored in-process, since for them
+    # the hand-off costs more than the scoring (bench_pool.py)
+    def __init__(self, workers=2, slots=32, slot_bytes=1 << 20, queue_depth=16, quality=95, metrics=None,
+                 inline_below=50000, on_written=None, keep_depth=256):
+        ctx = mp.get_context("spawn")  # the parent has threads, so do not fork it
+        self.workers = max(1, workers)
+        self.slot_bytes = slot_bytes
+        self.queue_depth = max(1, queue_depth)
+        self.keep_depth = keep_depth
+        self.metrics = metrics
+        self.inline_below = inline_below
+        self.on_written = on_written
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.free = deque(range(slots))
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.pending = deque()  # crops waiting for a free slot, see crop_encoder.queue_crop()
+        self.in_flight = 0
+        self.scoring = 0  # score jobs handed to the workers and not back yet
+        self.scored = []  # (key, info, result) of the score jobs that are back, for scores()
+        self.info = {}  # seq -> info of submit() or sharpness(), for the on_written callback or scores()
+        self.records = deque(maxlen=1024)  # completed encode results, oldest first
+        self.running = True
+        # counters, as CropEncoder
+        self.queued = 0
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0
+        self.pickled = 0  # jobs too large for a slot
+        self.scored_inline = 0  # large ROIs that were not handed over (no free slot), or failed in a worker
+        self.by_tag = {}
+        self.jobs = [ctx.Queue() for _ in range(self.workers)]
+        self.results = ctx.Queue()
+        self.procs = []
+        for i in range(self.workers):
+            p = ctx.Process(target=_worker, name=f"PostWorker-{i}", daemon=True,
+                            args=(self.shm.name, slot_bytes, self.jobs[i], self.results, quality))
+            p.start()
+            self.procs.append(p)
+        self.collector = threading.Thread(target=self._collect, name="ShmPoolCollector", daemon=True)
+        self.collector.start()
+        self.dispatcher = threading.Thread(target=self._dispatch, name="ShmPoolDispatcher", daemon=True)
+        self.dispatcher.start()
+
+    # queue a crop for encoding and writing in a worker, never blocks
+    # the same interface as CropEncoder.submit(), crops of the same filename stay in order
+    def submit(self, image, filename, tag=None, info=None, keep=False):
+        arr = np.asarray(image)
+        with self.cond:
+            if not self.running:
+                return False
+            self.queued += 1
+            self._count(tag, "queued")
+            dropped = crop_encoder.queue_crop(self.pending, (arr, filename, tag, info, keep), self.queue_depth,
+                                              self.keep_depth)
+            if dropped is not None:
+                self.dropped += 1
+                self._count(dropped[2], "dropped")
+            self.cond.notify_all()
+        return True
+
+    # score a batch of ROIs (None entries are skipped), returns a list of sharpness values,
+    # None for the skipped entries and for the ROIs handed to the workers
+    # an ROI of at least inline_below pixels is handed to the worker of its key if there is a
+    # free slot, its score is returned by scores() with a copy of the ROI and its box,
+    # all the other ROIs are scored inline, this never waits
+    def sharpness(self, rois, keys, boxes):
+        out = [None] * len(rois)
+        for i, (view, key, box) in enumerate(zip(rois, keys, boxes)):
+            if view is None:
+                continue
+            if view.shape[0] * view.shape[1] >= self.inline_below:
+                # the frame buffer the view is into is reused, the tracker gets a copy
+                if self._send("score", key, None, None, view, timeout=0, info=(box, np.array(view)),
+                              pickle=False) is not None:
+                    continue
+                with self.cond:
+                    self.scored_inline += 1
+            out[i] = best_plate.sharpness(view)
+        return out
+
+    # the scores of the ROIs handed to the workers by sharpness() that are back since the last
+    # call, a list of (key, box, roi, sharpness), a job that failed in the worker is scored here
+    # timeout waits up to that long for all of them, e.g. at the end of the stream
+    def scores(self, timeout=0):
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.scoring > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            scored, self.scored = self.scored, []
+        out = []
+        for key, (box, view), value in scored:
+            if value is _FAILED:
+                value = best_plate.sharpness(view)
+                with self.cond:
+                    self.scored_inline += 1
+            out.append((key, box, view, value))
+        return out
+
+    # completed encode records (filename, tag, bytes written or None, error) since the last call
+    def results_since(self):
+        with self.cond:
+            records = list(self.records)
+            self.records.clear()
+        return records
+
+    def depth(self):
+        with self.cond:
+            return len(self.pending) + self.in_flight
+
+    def tag_stats(self, tag=None):
+        with self.cond:
+            if tag is None:
+                return {t: dict(c) for t, c in self.by_tag.items()}
+            return dict(self.by_tag.get(tag, {"queued": 0, "dropped": 0, "written": 0}))
+
+    def stats(self):
+        with self.cond:
+            return {
+                "queued": self.queued,
+                "dropped": self.dropped,
+                "written": self.written,
+                "errors": self.errors,
+                "pickled": self.pickled,
+                "scored_inline": self.scored_inline,
+                "depth": len(self.pending) + self.in_flight,
+            }
+
+    # stop the pool, by default the queued crops are written first
+    def close(self, drain=True, timeout=5.0):
+        with self.cond:
+            self.running = False
+            if not drain:
+                self.dropped += len(self.pending)
+                for _, _, tag, _, _ in self.pending:
+                    self._count(tag, "dropped")
+                self.pending.clear()
+            self.cond.notify_all()
+        self.dispatcher.join(timeout)
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.in_flight > 0 and time.monotonic() < deadline:
+                self.cond.wait(0.1)
+        for q in self.jobs:
+            q.put(None)
+        for p in self.procs:
+            p.join(timeout)
+            if p.is_alive():
+                p.terminate()
+        self.results.put(None)
+        self.collector.join(timeout)
+        self.shm.close()
+        self.shm.unlink()
+
+    # copy the array into a free slot (waiting up to timeout for one) and send the job
+    # to the worker of this key, returns the job sequence number
+    # without a slot the array is sent pickled, or if pickle is False the job is not sent and None is returned
+    def _send(self, kind, key, tag, filename, arr, timeout=None, info=None, pickle=True):
+        arr = np.asarray(arr)
+        slot = -1
+        with self.cond:
+            if arr.nbytes <= self.slot_bytes:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while not self.free:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                if self.free:
+                    slot = self.free.popleft()
+            if slot < 0:
+                if not pickle:
+                    return None
+                self.pickled += 1
+            seq = next(self.seq)
+            self.in_flight += 1
+            if kind == "score":
+                self.scoring += 1
+            if info is not None:
+                self.info[seq] = info
+        payload = None
+        if slot >= 0:
+            view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+            view[...] = arr
+            del view
+        else:
+            payload = np.ascontiguousarray(arr)
+        self.jobs[hash(key) % self.workers].put(
+            (seq, kind, slot, arr.shape, arr.dtype.str, key, tag, filename, payload))
+        return seq
+
+    def _dispatch(self):
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.pending:
+                    return  # closed and drained
+                arr, filename, tag, info, _ = self.pending.popleft()
+            self._send("encode", filename, tag, filename, arr, info=info)
+
+    def _collect(self):
+        while True:
+            record = self.results.get()
+            if record is None:
+                return
+            seq, kind, slot, key, tag, out, timings, error = record
+            if self.metrics:
+                for stage, seconds in timings.items():
+                    self.metrics.observe(stage, seconds)
+            written = False
+            with self.cond:
+                info = self.info.pop(seq, None)
+                if slot >= 0:
+                    self.free.append(slot)
+                self.in_flight -= 1
+                if kind == "score":
+                    self.scoring -= 1
+                    self.scored.append((key, info, out if error is None else _FAILED))
+                elif error is None:
+                    self.written += 1
+                    self._count(tag, "written")
+                    self.records.append((key, tag, out, None))
+                    written = True
+                else:
+                    self.errors += 1
+                    self.records.append((key, tag, None, error))
+                self.cond.notify_all()
+            if error is not None:
+                print(f"Post-processing worker error: {error}")
+            if written and self.on_written:
+                try:
+                    self.on_written(key, tag, info, None)
+                except Exception as e:
+                    print(f"Post-processing callback error for {key}: {e}")
+
+    # called with self.cond held
+    def _count(self, tag, counter):
+        if tag is None:
+            return
+        counts = self.by_tag.get(tag)
+        if counts is None:
+            counts = {"queued": 0, "dropped": 0, "written": 0}
+            self.by_tag[tag] = counts
+        counts[counter] += 1
@@ -0,0 +1,204 @@
+# Low overhead hot-path instrumentation for the ANPR loop
+# rev 0.1 - shabaz - August 2025
+
+# Per-stage latency histograms (p50/p95/p99), rolling FPS per stream and
+# any other values registered as gauges (e.g. queue depths), exported in the
+# Prometheus text format on a local HTTP endpoint and/or to a file that is
+# rewritten periodically.
+#
+# Usage in the loop:
+#   t = metrics.clock()
+#   ... work ...
+#   t = metrics.stage("filter", t)  # records the time since t, returns the new time
+# When the metrics are disabled clock() and stage() return immediately.
+
+import bisect
+import os
+import threading
+import time
+from collections import deque
+
+PREFIX = "anpr"
+QUANTILES = (0.5, 0.95, 0.99)
+FPS_WINDOW = 5.0  # seconds of frame timestamps used for the rolling FPS
+
+# histogram bucket upper bounds in seconds, log spaced from 20 us to about 10 s
+BUCKETS = [20e-6 * (1.25 ** i) for i in range(60)]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.n = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.counts[i] += 1
+            self.total += seconds
+            self.n += 1
+
+    # estimate a quantile from the buckets (upper bound of the bucket it falls in)
+    def quantile(self, q):
+        with self.lock:
+            counts, n = list(self.counts), self.n
+        if n == 0:
+            return 0.0
+        rank = q * n
+        acc = 0
+        for i, c in enumerate(counts):
+            acc += c
+            if acc >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+        return BUCKETS[-1]
+
+
+class Metrics:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = {}  # stage name -> Histogram
+        self.frames = {}  # stream_id -> deque of frame timestamps
+        self.frame_totals = {}  # stream_id -> frame count
+        self.gauges = []  # (name, help, kind, fn, label)
+        self.lock = threading.Lock()
+        self.server = None
+        self.writer = None
+        self.stop_event = threading.Event()
+
+    def clock(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    # record the time spent in a stage since t, returns the current time
+    def stage(self, name, t):
+        if not self.enabled:
+            return 0.0
+        now = time.perf_counter()
+        self.observe(name, now - t)
+        return now
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        h = self.stages.get(name)
+        if h is None:
+            with self.lock:
+                h = self.stages.setdefault(name, Histogram())
+        h.observe(seconds)
+
+    # count a frame for the rolling FPS of a stream
+    def frame(self, stream_id):
+        if not self.enabled:
+            return
+        q = self.frames.get(stream_id)
+        if q is None:
+            with self.lock:
+                q = self.frames.setdefault(stream_id, deque(maxlen=4096))
+                self.frame_totals.setdefault(stream_id, 0)
+        q.append(time.monotonic())
+        self.frame_totals[stream_id] += 1
+
+    def fps(self, stream_id):
+        q = self.frames.get(stream_id)
+        if not q:
+            return 0.0
+        now = time.monotonic()
+        stamps = [t for t in list(q) if now - t <= FPS_WINDOW]
+        if len(stamps) < 2:
+            return 0.0
+        return (len(stamps) - 1) / max(1e-9, stamps[-1] - stamps[0])
+
+    # register a value that is read when the metrics are exported
+    # fn returns a number, or a dict of {label_value: number} exported with the label name label
+    def gauge(self, name, help_text, fn, kind="gauge", label=None):
+        with self.lock:
+            self.gauges.append((name, help_text, kind, fn, label))
+
+    def render(self):
+        lines = []
+        with self.lock:
+            stages = dict(self.stages)
+            streams = list(self.frames.keys())
+            gauges = list(self.gauges)
+        if stages:
+            lines.append(f"# HELP {PREFIX}_stage_seconds Time spent in each stage of the inference loop")
+            lines.append(f"# TYPE {PREFIX}_stage_seconds summary")
+            for name, h in sorted(stages.items()):
+                for q in QUANTILES:
+                    lines.append(f'{PREFIX}_stage_seconds{{stage="{name}",quantile="{q}"}} {h.quantile(q):.6f}')
+                lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{name}"}} {h.total:.6f}')
+                lines.append(f'{PREFIX}_stage_seconds_count{{stage="{name}"}} {h.n}')
+        if streams:
+            lines.append(f"# HELP {PREFIX}_stream_fps Rolling frames per second of each stream")
+            lines.append(f"# TYPE {PREFIX}_stream_fps gauge")
+            for sid in sorted(streams, key=str):
+                lines.append(f'{PREFIX}_stream_fps{{stream_id="{sid}"}} {self.fps(sid):.2f}')
+            lines.append(f"# HELP {PREFIX}_stream_frames_total Frames processed from each stream")
+            lines.append(f"# TYPE {PREFIX}_stream_frames_total counter")
+            for sid in sorted(streams, key=str):
+                lines.append(f'{PREFIX}_stream_frames_total{{stream_id="{sid}"}} {self.frame_totals.get(sid, 0)}')
+        for name, help_text, kind, fn, label in gauges:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            if isinstance(value, dict):
+                for k, v in sorted(value.items(), key=lambda kv: str(kv[0])):
+                    lines.append(f'{PREFIX}_{name}{{{label or "key"}="{k}"}} {v}')
+            else:
+                lines.append(f"{PREFIX}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    # serve the metrics at http://<host>:<port>/metrics from a background thread
+    def serve_http(self, port, host="127.0.0.1"):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # only loaded when serving
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # no console output per request
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="MetricsHTTP", daemon=True).start()
+
+    # rewrite the metrics to filename every interval seconds from a background thread
+    def write_file(self, filename, interval=5.0):
+        def writer():
+            while not self.stop_event.wait(interval):
+                self._write(filename)
+            self._write(filename)
+
+        self.writer = threading.Thread(target=writer, name="MetricsFile", daemon=True)
+        self.writer.start()
+
+    def _write(self, filename):
+        tmp_filename = f"{filename}.tmp"
+        try:
+            with open(tmp_filename, "w") as f:
+                f.write(self.render())
+            os.replace(tmp_filename, filename)
+        except OSError as e:
+            print(f"Could not write metrics to {filename}: {e}")
+
+    def close(self):
+        self.stop_event.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.writer:
+            self.writer.join(2.0)
@@ -0,0 +1,40 @@
+# Per-stream state for the ANPR loop
+# rev 0.1 - shabaz - August 2025
+
+# When several cameras are served by one inference stream, the frames of all
+# of them arrive interleaved in the same loop. Everything that depends on the
+# history of a camera (track ages, best plates, dedup cache, display decimation) is kept
+# separately for each frame_result.stream_id.
+
+import best_plate
+import plate_dedup
+
+
+class StreamState:
+    # dedup holds the keyword arguments of plate_dedup.PlateDedup
+    def __init__(self, stream_id, max_age, dedup=None):
+        self.stream_id = stream_id
+        self.plates = best_plate.BestPlateTracker(max_age)
+        self.dedup = plate_dedup.PlateDedup(**(dedup or {}))
+        self.frame_index = 0  # frames seen on this stream
+        self.frames_since_show = 0
+        self.last_show = 0.0
+        self.skipped = 0  # stale frames that skipped post-processing
+        self.suppressed = 0  # plate crops skipped because the track was stationary
+
+
+class StreamStates:
+    def __init__(self, max_age, dedup=None):
+        self.max_age = max_age
+        self.dedup = dedup
+        self.streams = {}  # stream_id -> StreamState
+
+    def get(self, stream_id):
+        state = self.streams.get(stream_id)
+        if state is None:
+            state = StreamState(stream_id, self.max_age, self.dedup)
+            self.streams[stream_id] = state
+        return state
+
+    def __iter__(self):
+        return iter(list(self.streams.values()))
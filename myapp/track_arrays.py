@@ -0,0 +1,79 @@
+# Struct-of-arrays view of the tracking results of a frame
+# rev 0.1 - shabaz - August 2025
+
+# The tracked objects are read once into compact NumPy arrays, after that the
+# label filtering, box areas and top-k ranking are all done with array operations
+# instead of per-object Python code.
+
+from collections import namedtuple
+import numpy as np
+
+TrackArrays = namedtuple("TrackArrays", [
+    "track_ids",    # (N,) int64
+    "label_ids",    # (N,) int32
+    "boxes",        # (N, 4) int32, most recent history box (x1, y1, x2, y2)
+    "first_boxes",  # (N, 4) int32, oldest history box
+    "history_len",  # (N,) int32
+    "past_boxes",   # (N, 4) int32, history box `window` entries before the most recent one
+    "label_names",  # dict of label id -> label name, for the labels in this frame
+])
+
+
+_name_ids = {}  # label name -> id, in the order the names were first seen
+
+
+# the id is keyed on the label name, the enum value is not used, since the labels of
+# different models (e.g. the vehicle and the plate detector) are different enums whose
+# values overlap
+def _label_id(label):
+    return _name_ids.setdefault(label.name, len(_name_ids))
+
+
+# read the tracked objects of a frame (e.g. frame_result.tracking) into arrays
+# window selects the past_boxes entry, clamped to the oldest box of short histories
+def snapshot(tracking, window=0):
+    objs = list(tracking) if tracking is not None else []
+    n = len(objs)
+    track_ids = np.empty(n, dtype=np.int64)
+    label_ids = np.empty(n, dtype=np.int32)
+    boxes = np.zeros((n, 4), dtype=np.int32)
+    first_boxes = np.zeros((n, 4), dtype=np.int32)
+    history_len = np.empty(n, dtype=np.int32)
+    past_boxes = np.zeros((n, 4), dtype=np.int32)
+    label_names = {}
+    for i, obj in enumerate(objs):
+        track_ids[i] = obj.track_id
+        lid = _label_id(obj.label)
+        label_ids[i] = lid
+        if lid not in label_names:
+            label_names[lid] = obj.label.name
+        history = obj.history
+        history_len[i] = len(history)
+        if len(history) > 0:
+            first_boxes[i] = history[0]
+            boxes[i] = history[-1]
+            past_boxes[i] = history[max(0, len(history) - 1 - window)]
+    return TrackArrays(track_ids, label_ids, boxes, first_boxes, history_len, past_boxes, label_names)
+
+
+# boolean mask of the objects that have one of the given label names
+def label_mask(snap, names):
+    ids = [lid for lid, name in snap.label_names.items() if name in names]
+    return np.isin(snap.label_ids, ids)
+
+
+def box_areas(boxes):
+    b = boxes.astype(np.int64)
+    return (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+
+
+# indices of the k largest boxes (optionally only where mask is True), largest first
+def top_k(boxes, k, mask=None):
+    idx = np.arange(len(boxes)) if mask is None else np.flatnonzero(mask)
+    if k <= 0 or idx.size == 0:
+        return idx[:0]
+    areas = box_areas(boxes[idx])
+    if idx.size > k:
+        part = np.argpartition(-areas, k - 1)[:k]
+        idx, areas = idx[part], areas[part]
+    return idx[np.argsort(-areas, kind="stable")]
@@ -1,6 +1,7 @@
 // ****************************************************************
 // *  main.cpp for Axelera demo
-// *  rev 1 - shabaz - July 2025
+// *  rev 2 - shabaz - August 2025
+// *  rev 2: messages of the framed mode are taken from the receive queue
 // ****************************************************************
 
 #include <stdio.h>
@@ -35,8 +36,20 @@ void board_init(void) {
     lcd_print("Axelera ANPR4All");
 }
 
+void handle_message(const char* msg) {
+    printf("Received: %s\n", msg);
+    if (strncmp(msg, "LED_ON", 6) == 0) {
+        BOARD_LED_ON; // turn on the board LED
+    } else if (strncmp(msg, "LED_OFF", 7) == 0) {
+        BOARD_LED_OFF; // turn off the board LED
+    }
+    lcd_clear_line(LINE_1);
+    lcd_print(msg); // display the received message on LCD
+}
+
 int main(void)
 {
+    uint8_t frame_msg[UART_IN_BUF_SIZE];
     board_init();
     uart_int_start(); // start UART interrupt handler
 
@@ -44,16 +57,15 @@ int main(void)
         // rx_complete_length is non-zero only if
         // a \n terminated string is received over UART
         if (rx_complete_length > 0) {
-            printf("Received: %s\n", uart_buffer);
-            if (strncmp((const char*)uart_buffer, "LED_ON", 6) == 0) {
-                BOARD_LED_ON; // turn on the board LED
-            } else if (strncmp((const char*)uart_buffer, "LED_OFF", 7) == 0) {
-                BOARD_LED_OFF; // turn off the board LED
-            }
-            lcd_clear_line(LINE_1);
-            lcd_print((const char*)uart_buffer); // display the received message on LCD
+            handle_message((const char*)uart_buffer);
             uart_clear_rx_buffer(); // clear the message from the buffer
         }
+        // messages of the framed mode wait in a queue, the interrupt handler
+        // keeps receiving (and acknowledging) frames while one is handled
+        if (uart_queue_pop(frame_msg) >= 0) {
+            handle_message((const char*)frame_msg);
+            continue; // more may be queued
+        }
         sleep_ms(10);
     }
 
@@ -1,6 +1,9 @@
 /******************************************
  * uart_handler.cpp
- * rev 1 - shabaz - July 2025
+ * rev 2 - shabaz - August 2025
+ * rev 2: framed mode with a receive queue, alongside the '\r' terminated messages
+ * rev 3: the rest of a bad frame is dropped, and so is a partial frame after a pause
+ * rev 4: the frame replies carry the free queue slots, for the credit based flow control
  * ****************************************/
 
 #include <stdio.h>
@@ -10,10 +13,12 @@
 #include "hardware/gpio.h"
 #include "hardware/uart.h"
 #include "hardware/irq.h"
+#include "hardware/sync.h"
 #include "uart_handler.h"
 
 // defines
 #define UART_TICK_PERIOD_US 100000
+#define FRAME_INTERBYTE_TIMEOUT_US 10000 // a partial frame, the host writes each frame at once
 
 //************* global variables *************
 uint8_t uart_buffer[UART_IN_BUF_SIZE+5];
@@ -22,6 +27,21 @@ uint8_t do_echo;
 repeating_timer_t uart_tick_timer;
 uint16_t rx_complete_length;
 int uart_irq;
+// framed mode
+uint8_t frame_buffer[FRAME_MAX_PAYLOAD+4]; // the frame being received, from its SOH/STX byte
+uint16_t frame_index; // 0 when no frame is being received
+uint8_t frame_discard; // the rest of a bad frame is dropped, until the next SOH/STX
+uint8_t expected_seq;
+uint8_t rx_queue[RX_QUEUE_LEN][UART_IN_BUF_SIZE];
+uint8_t rx_queue_length[RX_QUEUE_LEN];
+volatile uint8_t rx_queue_head; // written by the interrupt handler only
+volatile uint8_t rx_queue_tail; // written by the main loop only
+volatile uint8_t credit_blocked; // the last reply had no free slots
+uint32_t frames_accepted;
+uint32_t frames_rejected;
+uint32_t frames_bad;
+uint32_t messages_bad;
+uint32_t last_char_time;
 
 // ******** function prototypes ********
 void on_uart_rx(void);
@@ -37,16 +57,153 @@ init_uart(void) {
     uart_set_baudrate(UART_ID, BAUD_RATE);
     uart_set_hw_flow(UART_ID, false, false);
     uart_set_format(UART_ID, DATA_BITS, STOP_BITS, PARITY);
-    uart_set_fifo_enabled(UART_ID, false); // so we can process char-by-char
+    // the FIFO is enabled so that no character is lost while the interrupt handler
+    // writes a reply, on_uart_rx still handles the characters one at a time
+    uart_set_fifo_enabled(UART_ID, true);
     uart_irq = UART_ID == uart0 ? UART0_IRQ : UART1_IRQ;
     irq_set_exclusive_handler(uart_irq, on_uart_rx);
     uart_buffer_index = 0;
     rx_complete_length = 0;
+    frame_index = 0;
+    frame_discard = 0;
+    expected_seq = 0;
+    rx_queue_head = 0;
+    rx_queue_tail = 0;
+    credit_blocked = 0;
+}
+
+// CRC-8, polynomial 0x07, the same as crc8() in FramedComms.py
+uint8_t
+crc8_update(uint8_t crc, uint8_t c) {
+    crc ^= c;
+    for (int i = 0; i < 8; i++) {
+        crc = (crc & 0x80) ? (uint8_t)((crc << 1) ^ 0x07) : (uint8_t)(crc << 1);
+    }
+    return crc;
+}
+
+// the reply tells the host how many messages it can send before the queue is full
+void
+send_frame_reply(uint8_t kind, uint8_t seq) {
+    uint8_t free = (RX_QUEUE_LEN - 1) - (uint8_t)((rx_queue_head + RX_QUEUE_LEN - rx_queue_tail) % RX_QUEUE_LEN);
+    uint8_t crc = crc8_update(crc8_update(crc8_update(0, kind), seq), free);
+    credit_blocked = (free == 0);
+    uart_putc_raw(UART_ID, kind);
+    uart_putc_raw(UART_ID, seq);
+    uart_putc_raw(UART_ID, free);
+    uart_putc_raw(UART_ID, crc);
+}
+
+// a frame with a correct CRC has been received
+void
+frame_complete(uint8_t sync, uint8_t seq, uint8_t* payload, uint8_t len) {
+    uint8_t next_head;
+    if (sync) {
+        expected_seq = seq;
+    }
+    if (seq != expected_seq) {
+        if ((uint8_t)(expected_seq - seq) <= 2 * RX_QUEUE_LEN) {
+            send_frame_reply(FRAME_ACK, seq); // a retransmit, its ACK was lost
+        } else {
+            send_frame_reply(FRAME_NAK, expected_seq); // an earlier frame was lost
+        }
+        frames_rejected++;
+        return;
+    }
+    next_head = (rx_queue_head + 1) % RX_QUEUE_LEN;
+    if (next_head == rx_queue_tail) {
+        send_frame_reply(FRAME_BSY, seq); // queue full, the host sends it again later
+        frames_rejected++;
+        return;
+    }
+    memcpy(rx_queue[rx_queue_head], payload, len);
+    rx_queue[rx_queue_head][len] = '\0';
+    rx_queue_length[rx_queue_head] = len;
+    __dmb(); // the message is stored before the main loop can see it
+    rx_queue_head = next_head;
+    expected_seq++;
+    frames_accepted++;
+    send_frame_reply(FRAME_ACK, seq);
+}
+
+// returns 1 if the character was part of a frame
+// frames start with SOH or STX, which never occur in the '\r' terminated messages, so
+// either one also drops a partial message, and ends the dropping of a bad frame
+uint8_t
+handle_frame_char(uint8_t c) {
+    uint8_t crc;
+    if (frame_index == 0) {
+        if ((c != FRAME_SOH) && (c != FRAME_STX)) {
+            return frame_discard;
+        }
+        if (uart_buffer_index > 0) {
+            messages_bad++;
+        }
+        uart_buffer_index = 0;
+        frame_discard = 0;
+        frame_buffer[frame_index++] = c;
+        return 1;
+    }
+    frame_buffer[frame_index++] = c;
+    if ((frame_index == 3) && (c > FRAME_MAX_PAYLOAD)) {
+        frames_bad++;
+        frame_index = 0;
+        frame_discard = 1; // its payload and CRC must not end up in a message
+    } else if ((frame_index >= 4) && (frame_index == frame_buffer[2] + 4)) {
+        crc = 0;
+        for (int i = 0; i < frame_index - 1; i++) {
+            crc = crc8_update(crc, frame_buffer[i]);
+        }
+        if (crc == c) {
+            frame_complete(frame_buffer[0] == FRAME_SOH, frame_buffer[1], &frame_buffer[3], frame_buffer[2]);
+        } else {
+            frames_bad++;
+            frame_discard = 1; // bytes may have been lost, the next frame may have started in it
+        }
+        frame_index = 0;
+    }
+    return 1;
+}
+
+// called from the main loop only
+int
+uart_queue_pop(uint8_t* buf) {
+    uint8_t len;
+    if (rx_queue_tail == rx_queue_head) {
+        return -1;
+    }
+    __dmb(); // read the message after seeing the head move
+    len = rx_queue_length[rx_queue_tail];
+    memcpy(buf, rx_queue[rx_queue_tail], len + 1);
+    __dmb(); // the message is copied before the interrupt handler can reuse the slot
+    rx_queue_tail = (rx_queue_tail + 1) % RX_QUEUE_LEN;
+    if (credit_blocked) {
+        // the host is waiting for a free slot, tell it with an ACK of the last frame accepted
+        // (interrupts are off so that the reply is not mixed with one from the interrupt handler)
+        uint32_t irq_state = save_and_disable_interrupts();
+        if (credit_blocked) {
+            send_frame_reply(FRAME_ACK, (uint8_t)(expected_seq - 1));
+        }
+        restore_interrupts(irq_state);
+    }
+    return len;
 }
 
 void
 handle_uart_char(uint8_t c) {
     uint16_t num_bytes = 0;
+    uint32_t now = time_us_32();
+    // after a pause a partial frame will not be completed, e.g. a frame whose length byte
+    // was lost would otherwise take in the retransmissions after it
+    // ('\r' terminated messages can be typed, so they have no such timeout)
+    if ((now - last_char_time) > FRAME_INTERBYTE_TIMEOUT_US) {
+        frame_index = 0;
+        frame_discard = 0;
+    }
+    last_char_time = now;
+    if (handle_frame_char(c)) {
+        return;
+    }
     if (rx_complete_length > 0) {
         // if we already have a complete message, do not read more
         return;
@@ -13,8 +13,23 @@
 #define UART_TX_PIN 8
 #define UART_RX_PIN 9
 
+// framed mode, see serial_comms_interface/FramedComms.py
+// frame: SOH or STX, sequence number, payload length, payload, CRC-8 (polynomial 0x07)
+// reply: ACK, NAK or BSY, sequence number, free receive queue slots, CRC-8
+#define FRAME_SOH 0x01 // start of a frame that also sets the expected sequence number
+#define FRAME_STX 0x02 // start of a frame
+#define FRAME_ACK 0x06
+#define FRAME_NAK 0x15
+#define FRAME_BSY 0x13 // receive queue full
+#define FRAME_MAX_PAYLOAD (UART_IN_BUF_SIZE-1)
+#define RX_QUEUE_LEN 8 // holds RX_QUEUE_LEN-1 messages
+
 extern uint16_t rx_complete_length;
 extern uint8_t uart_buffer[UART_IN_BUF_SIZE+5];
+extern uint32_t frames_accepted;
+extern uint32_t frames_rejected;
+extern uint32_t frames_bad;
+extern uint32_t messages_bad; // partial '\r' terminated messages dropped by a SOH/STX, see handle_frame_char()
 
 void init_uart(void);
 
@@ -26,4 +41,9 @@ void uart_int_stop(void);
 // used to resume UART input handling after a complete message was received
 void uart_clear_rx_buffer(void);
 
+// copies the oldest message received in framed mode into buf (null-terminated,
+// at least UART_IN_BUF_SIZE bytes) and removes it from the receive queue
+// returns the message length, or -1 if the queue is empty
+int uart_queue_pop(uint8_t* buf);
+
 
@@ -0,0 +1,182 @@
+# asyncio version of SerialComms
+# requirement: pip install pyserial
+# rev 1 - shabaz - August 2025
+
+# For asyncio programs, where the blocking SerialComms.send() would stall the
+# event loop. The port is opened and configured with pyserial, then its file
+# descriptor (which pyserial opens non-blocking) is read and written directly
+# from the event loop with add_reader()/add_writer(), no threads are used.
+#
+# send() puts the message on a bounded queue and returns, a writer task sends
+# the queued messages in order, with the same pacing as SerialComms (the pacing
+# settings of SerialComms.py are used). When the queue is full send() waits, so
+# a fast producer is slowed down to the rate of the link (backpressure).
+# Replies from the port are split into lines, readline() returns the next one,
+# or 'async for line in comms.lines()' can be used.
+#
+#   async with AsyncSerialComms() as comms:
+#       await comms.send("HELLO")
+#       await comms.drain()  # wait until everything queued has been written
+
+import asyncio
+import os
+import time
+import SerialComms
+
+
+class AsyncSerialComms:
+    # queue_size is the number of messages that can wait to be written
+    # line_queue_size is the number of received lines kept, the oldest are dropped when full
+    def __init__(self, port=None, queue_size=16, line_queue_size=256):
+        self.port = port or SerialComms.find_port(monitor=True)
+        if not self.port:
+            raise RuntimeError(f"No serial port /dev/tty{SerialComms.port_search_term} exists.")
+        self.queue = asyncio.Queue(queue_size)
+        self.lines_queue = asyncio.Queue(line_queue_size)
+        self.ser = None
+        self.fd = None
+        self.loop = None
+        self.writer_task = None
+        self.rx_buffer = b""
+        self.last_end = 0.0
+        self.closed = False
+        # counters
+        self.sent = 0
+        self.errors = 0
+        self.lines_received = 0
+        self.lines_dropped = 0
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        await self.close()
+
+    async def open(self):
+        self.loop = asyncio.get_running_loop()
+        self.ser = SerialComms.open_port(self.port, timeout=0)
+        self.fd = self.ser.fileno()
+        os.set_blocking(self.fd, False)
+        self.loop.add_reader(self.fd, self._on_readable)
+        self.writer_task = asyncio.create_task(self._writer())
+
+    # queue a message, waits only if the queue is full
+    async def send(self, message):
+        if self.closed:
+            raise RuntimeError("send error: port is closed")
+        await self.queue.put(message)
+
+    # wait until all queued messages have been written
+    async def drain(self):
+        await self.queue.join()
+
+    # the next line received (without the line ending), None once closed
+    async def readline(self):
+        return await self.lines_queue.get()
+
+    async def lines(self):
+        while True:
+            line = await self.readline()
+            if line is None:
+                return
+            yield line
+
+    def stats(self):
+        return {"sent": self.sent, "errors": self.errors, "queued": self.queue.qsize(),
+                "lines_received": self.lines_received, "lines_dropped": self.lines_dropped}
+
+    # by default the queued messages are written first
+    async def close(self, drain=True):
+        if self.closed:
+            return
+        self.closed = True
+        if drain and self.writer_task and not self.writer_task.done():
+            await self.queue.join()
+        if self.writer_task:
+            self.writer_task.cancel()
+            try:
+                await self.writer_task
+            except asyncio.CancelledError:
+                pass
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+        if self.ser:
+            self.ser.close()
+        self._put_line(None)  # wakes up readline()
+
+    async def _writer(self):
+        while True:
+            message = await self.queue.get()
+            try:
+                await self._write(message)
+                self.sent += 1
+            except OSError as e:
+                self.errors += 1
+                print(f"send error: {e}")
+            finally:
+                self.queue.task_done()
+
+    # send message with '\r' at the end, paced as SerialComms._write()
+    async def _write(self, message):
+        wait = self.last_end + SerialComms.message_gap - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        data = message.encode('utf-8') + b'\r'
+        by_char = SerialComms.pacing == 'char'
+        chunk_size = 1 if by_char else SerialComms.rx_buffer_size
+        char_time = SerialComms.bits_per_char / (self.ser.baudrate or SerialComms.baudrate)
+        for i in range(0, len(data), chunk_size):
+            chunk = data[i:i + chunk_size]
+            await self._write_all(chunk)
+            await asyncio.sleep(SerialComms.char_delay if by_char else len(chunk) * char_time)
+        self.last_end = time.monotonic()
+
+    async def _write_all(self, data):
+        view = memoryview(data)
+        while view:
+            try:
+                n = os.write(self.fd, view)
+                view = view[n:]
+            except BlockingIOError:
+                await self._writable()
+
+    # wait until the fd can be written
+    async def _writable(self):
+        ready = self.loop.create_future()
+        self.loop.add_writer(self.fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            self.loop.remove_writer(self.fd)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.errors += 1
+            print(f"receive error: {e}")
+            self.loop.remove_reader(self.fd)
+            self._put_line(None)
+            return
+        if not data:
+            # end of file, e.g. the USB adapter was unplugged, the fd would stay readable
+            self.errors += 1
+            print("receive error: the port was closed")
+            self.loop.remove_reader(self.fd)
+            self._put_line(None)
+            return
+        self.rx_buffer += data.replace(b'\r', b'\n')
+        *lines, self.rx_buffer = self.rx_buffer.split(b'\n')
+        for line in lines:
+            if line:
+                self.lines_received += 1
+                self._put_line(line.decode('utf-8', 'replace'))
+
+    def _put_line(self, line):
+        if self.lines_queue.full():
+            self.lines_queue.get_nowait()  # nobody is reading, lose the oldest line
+            self.lines_dropped += 1
+        self.lines_queue.put_nowait(line)
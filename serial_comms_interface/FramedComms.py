@@ -0,0 +1,310 @@
+# Framed command protocol with acknowledgements, for the Pico firmware
+# requirement: pip install pyserial
+# rev 1 - shabaz - August 2025
+# rev 2 - shabaz - August 2025 - credit based flow control, the replies carry the free queue slots
+
+# In the legacy mode (SerialComms.py) a message is text ending with '\r', and
+# the firmware discards anything that arrives before its main loop has taken
+# the previous message, so the host has to leave a conservative gap between
+# messages. In the framed mode each message is sent as a frame:
+#   STX (0x02) or SOH (0x01), sequence number, payload length, payload, CRC-8
+# The firmware puts the frames it accepts in a small receive queue, and replies
+# with a 4 byte ACK (0x06, seq, free, CRC-8) for each one, free being the number
+# of free slots left in the queue. A frame that arrives out of order (because an
+# earlier frame was lost) gets a NAK (0x15, expected seq, free, CRC-8) with the
+# sequence number it expects, and a frame that arrives when the queue is full
+# gets a BSY (0x13, seq, free, CRC-8). Frames are only accepted in order, so each
+# of these replies also acknowledges every earlier frame. SOH instead of STX tells the firmware to take the frame's sequence
+# number as the expected one, this is used for the first frame after opening
+# the port, and after a frame has been given up.
+#
+# Up to window frames are in flight at a time, but only as many of them are
+# transmitted as the last reply had free slots (the credit), so the host never
+# sends into a full queue. When the main loop of the firmware takes a message
+# from a queue that had no free slots left, it sends an ACK of the last frame
+# it accepted, with the new number of free slots. If that is lost, a frame is
+# sent anyway after probe_interval seconds without credit. When the oldest frame
+# is not acknowledged in time, or a NAK is received, the unacknowledged frames
+# are sent again from the oldest one (go-back-N), so nothing is retransmitted
+# unless something was lost. A BSY only happens if the credit was wrong (e.g.
+# the firmware restarted), the refused frames are then sent again once there is
+# credit, this does not count as a retry.
+#
+#   with FramedSerialComms(window=4) as comms:
+#       comms.send("HELLO")
+#       comms.flush()  # wait until everything sent has been acknowledged
+
+import threading
+import time
+from collections import OrderedDict
+import serial  # Note: this is the pyserial module, NOT the serial module
+import SerialComms
+
+SOH = 0x01  # start of a frame that also sets the expected sequence number
+STX = 0x02  # start of a frame
+ACK = 0x06
+NAK = 0x15
+BSY = 0x13  # the receive queue is full
+MAX_PAYLOAD = 127  # UART_IN_BUF_SIZE - 1 in the firmware
+
+
+def _crc8_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xff if crc & 0x80 else (crc << 1) & 0xff
+        table.append(crc)
+    return table
+
+
+CRC8_TABLE = _crc8_table()
+
+
+# CRC-8, polynomial 0x07, the same as crc8_update() in the firmware
+def crc8(data, crc=0):
+    for b in data:
+        crc = CRC8_TABLE[crc ^ b]
+    return crc
+
+
+def encode_frame(seq, payload, sync=False):
+    body = bytes((SOH if sync else STX, seq & 0xff, len(payload))) + payload
+    return body + bytes((crc8(body),))
+
+
+def encode_reply(kind, seq, free):
+    body = bytes((kind, seq, free))
+    return body + bytes((crc8(body),))
+
+
+# splits the received bytes into (kind, seq, free) replies, returns them and the unused bytes
+def parse_replies(buf):
+    replies = []
+    i = 0
+    while i + 4 <= len(buf):
+        if buf[i] in (ACK, NAK, BSY) and buf[i + 3] == crc8(buf[i:i + 3]):
+            replies.append((buf[i], buf[i + 1], buf[i + 2]))
+            i += 4
+        else:
+            i += 1  # not a reply (e.g. echo or noise), resynchronize
+    return replies, buf[i:]
+
+
+class FramedSerialComms:
+    # window is the number of frames in flight, at most RX_QUEUE_LEN - 1 of the firmware is useful
+    # a frame is sent again if it is not acknowledged ack_timeout seconds after it was transmitted
+    # retries is the number of times a lost frame is sent again before it is given up
+    def __init__(self, port=None, window=4, ack_timeout=0.05, nak_delay=0.005, probe_interval=0.1, retries=5):
+        self.port = port or SerialComms.find_port(monitor=True)
+        if not self.port:
+            raise RuntimeError(f"No serial port /dev/tty{SerialComms.port_search_term} exists.")
+        self.window = max(1, min(window, 127))
+        self.ack_timeout = ack_timeout
+        self.nak_delay = nak_delay
+        self.probe_interval = probe_interval
+        self.retries = retries
+        self.ser = SerialComms.open_port(self.port, timeout=0.005)
+        self.char_time = SerialComms.bits_per_char / self.ser.baudrate
+        self.cond = threading.Condition()
+        self.seq = 0
+        self.sync = True  # the next frame sent (or re-sent) first sets the expected sequence number
+        self.in_flight = OrderedDict()  # seq -> [frame, deadline or None if not transmitted, attempts, transmissions]
+        self.credit = 1  # free queue slots for the frames in flight, known after the first reply
+        self.credit_time = time.monotonic()
+        self.resend_at = None  # time of a go-back-N requested by a NAK
+        self.holdoff = 0.0  # NAKs before this time are replies to frames sent before the last go-back-N
+        self.tx_done = 0.0  # time when the last byte written will have been transmitted
+        self.running = True
+        self.error = None  # why the link was lost, e.g. the adapter was unplugged
+        # counters
+        self.sent = 0
+        self.acked = 0
+        self.retransmits = 0
+        self.naks = 0
+        self.busy = 0
+        self.timeouts = 0
+        self.lost = 0
+        self.thread = threading.Thread(target=self._run, name="FramedComms", daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    # sends a message, waits while window frames are already in flight
+    def send(self, message):
+        payload = message.encode('utf-8')
+        if len(payload) > MAX_PAYLOAD:
+            raise ValueError(f"message longer than {MAX_PAYLOAD} bytes")
+        with self.cond:
+            while self.running and len(self.in_flight) >= self.window:
+                self.cond.wait()
+            self._check_link()
+            seq = self.seq
+            self.seq = (seq + 1) & 0xff
+            frame = encode_frame(seq, payload, self.sync)
+            self.sync = False
+            self.in_flight[seq] = [frame, None, 0, 0]
+            self.sent += 1
+            try:
+                self._pump()
+            except serial.SerialException as e:
+                self._link_lost(e)
+                self._check_link()
+        return seq
+
+    # waits until every frame has been acknowledged (or given up), returns False on timeout
+    # raises RuntimeError if the link is lost before that
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while self.in_flight:
+                self._check_link()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def stats(self):
+        with self.cond:
+            return {"sent": self.sent, "acked": self.acked, "retransmits": self.retransmits, "naks": self.naks,
+                    "busy": self.busy, "timeouts": self.timeouts, "lost": self.lost, "in_flight": len(self.in_flight)}
+
+    def close(self, timeout=2.0):
+        if self.error is None:
+            self.flush(timeout)
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join(timeout)
+        self.ser.close()
+
+    # raises RuntimeError if the port was closed or the link was lost (called with self.cond held)
+    def _check_link(self):
+        if self.error is not None:
+            raise RuntimeError(f"send error: link lost ({self.error})")
+        if not self.running:
+            raise RuntimeError("send error: port is closed")
+
+    # the port failed, send() and flush() raise instead of waiting forever (called with self.cond held)
+    def _link_lost(self, error):
+        print(f"serial error: {error}")
+        self.error = error
+        self.running = False
+        self.cond.notify_all()
+
+    # write the frames that have not been transmitted and fit in the credit (called with self.cond held),
+    # each deadline allows for the bytes queued ahead of it
+    def _pump(self):
+        now = time.monotonic()
+        queued = max(0.0, self.tx_done - now)
+        for i, entry in enumerate(self.in_flight.values()):
+            if i >= self.credit:
+                break
+            if entry[1] is not None:
+                continue
+            if entry[3] > 0:
+                self.retransmits += 1
+            self.ser.write(entry[0])
+            entry[3] += 1
+            queued += len(entry[0]) * self.char_time
+            entry[1] = now + queued + self.ack_timeout
+            if i == 0:
+                self.holdoff = now + queued  # NAKs before this are replies to what was sent before
+        self.tx_done = now + queued
+
+    # go-back-N from the oldest frame in flight, called with self.cond held
+    def _resend(self):
+        self.resend_at = None
+        seq, entry = next(iter(self.in_flight.items()))
+        entry[2] += 1
+        if entry[2] > self.retries:
+            del self.in_flight[seq]  # give up, the next frame re-synchronizes the firmware
+            self.lost += 1
+            self.sync = True
+            self.cond.notify_all()
+        self._restart()
+
+    # the frames in flight are all sent again, from the oldest one, as the credit allows
+    def _restart(self):
+        if not self.in_flight:
+            return
+        if self.sync:
+            seq, entry = next(iter(self.in_flight.items()))
+            entry[0] = encode_frame(seq, entry[0][3:-1], sync=True)
+            self.sync = False
+        for entry in self.in_flight.values():
+            entry[1] = None
+        self._pump()
+
+    def _on_reply(self, kind, seq, free):
+        self.credit = free
+        self.credit_time = time.monotonic()
+        if kind == ACK:
+            if seq in self.in_flight:  # else a duplicate, or the firmware telling it has free slots again
+                while self.in_flight:
+                    first, _ = self.in_flight.popitem(last=False)
+                    self.acked += 1
+                    if first == seq:
+                        break
+                self.cond.notify_all()
+            return
+        if kind == NAK:
+            self.naks += 1
+        else:
+            self.busy += 1
+        if seq not in self.in_flight:
+            return  # not for a frame in flight (e.g. from before a re-sync)
+        # everything before this frame has been accepted
+        while next(iter(self.in_flight)) != seq:
+            self.in_flight.popitem(last=False)
+            self.acked += 1
+        self.cond.notify_all()
+        if kind == BSY:
+            # refused, so were the frames after it, they are sent again once there is credit
+            self.resend_at = None
+            for entry in self.in_flight.values():
+                entry[1] = None
+            self.holdoff = float("inf")  # the NAKs of the frames after it are expected
+            return
+        now = time.monotonic()
+        if self.resend_at is None and now >= self.holdoff:
+            self.resend_at = now + self.nak_delay
+
+    def _run(self):
+        buf = b""
+        while self.running:
+            try:
+                data = self.ser.read(256)
+            except serial.SerialException as e:
+                with self.cond:
+                    self._link_lost(e)
+                return
+            replies, buf = parse_replies(buf + data)
+            with self.cond:
+                try:
+                    self._handle(replies)
+                except serial.SerialException as e:
+                    self._link_lost(e)
+                    return
+
+    # the replies received, and the timers (called with self.cond held)
+    def _handle(self, replies):
+        for kind, seq, free in replies:
+            self._on_reply(kind, seq, free)
+        if self.in_flight:
+            now = time.monotonic()
+            deadline = next(iter(self.in_flight.values()))[1]
+            if self.resend_at is not None:
+                if now >= self.resend_at:
+                    self._resend()
+            elif deadline is not None and now >= deadline:
+                self.timeouts += 1
+                self._resend()
+            elif deadline is None and self.credit == 0 and now >= self.credit_time + self.probe_interval:
+                self.credit = 1  # the reply telling of free slots may have been lost
+            self._pump()
@@ -0,0 +1,260 @@
+# Cached serial port discovery with udev hotplug monitoring
+# requirement: pip install pyserial pyudev (pyudev is optional, see below)
+# rev 1 - shabaz - August 2025
+# rev 2 - shabaz - August 2025 - the hotplug monitoring is started only for long-lived users
+
+# Scanning list_ports.comports() on every SerialComms construction is slow, and
+# picking the last match means that after a USB re-enumeration (ttyUSB0 coming
+# back as ttyUSB1) the port name is stale. The registry keeps the serial ports
+# in a cache, keyed by a stable attribute of the device: its /dev/serial/by-id
+# link, else its USB serial number, else its physical path. Once monitor() has
+# been called (e.g. by a persistent connection, which reconnects over hours), a
+# background thread follows the udev add and remove events, so resolving a port
+# is a dictionary lookup. Without it (e.g. for a one-shot send) the ports are
+# scanned again when a lookup fails. Once a search term has resolved to a
+# device, it stays pinned to that device's key, so it follows the device across
+# renumbering.
+#
+# The devices come from a source object with list_devices(), and monitor() if
+# its supports_hotplug is True: UdevSource (pyudev), ListPortsSource (pyserial
+# only, no hotplug events) or MockUdevSource for testing. The same ports are
+# listed as by pyserial's list_ports.comports().
+#
+#   python PortRegistry.py           lists the serial ports
+#   python PortRegistry.py --watch   also prints the add and remove events
+
+import argparse
+import threading
+import time
+
+try:
+    import pyudev
+except ImportError:
+    pyudev = None
+
+
+# a port is a dict: device (e.g. /dev/ttyUSB0), key, description, serial, by_id, path
+def port_info(device, description="", serial=None, by_id=None, path=None):
+    key = by_id or (f"serial:{serial}" if serial else None) or (f"path:{path}" if path else None) or device
+    return {"device": device, "key": key, "description": description or "", "serial": serial,
+            "by_id": by_id, "path": path}
+
+
+# the same test as the original SerialComms search, plus the stable attributes
+def matches(info, search_term):
+    if search_term in info["description"] or f"tty{search_term}" in info["device"]:
+        return True
+    return any(search_term in (info[k] or "") for k in ("key", "serial"))
+
+
+class UdevSource:
+    supports_hotplug = True
+
+    def __init__(self):
+        self.context = pyudev.Context()
+
+    def list_devices(self):
+        ports = []
+        for dev in self.context.list_devices(subsystem="tty"):
+            info = self._info(dev)
+            if info:
+                ports.append(info)
+        return ports
+
+    # calls on_event(action, info) from a background thread for each tty add/remove
+    def monitor(self, on_event):
+        monitor = pyudev.Monitor.from_netlink(self.context)
+        monitor.filter_by("tty")
+        monitor.start()
+
+        def run():
+            while True:
+                dev = monitor.poll(timeout=None)
+                if dev is None:
+                    continue
+                info = self._info(dev)
+                if info and dev.action in ("add", "remove"):
+                    on_event(dev.action, info)
+
+        threading.Thread(target=run, name="PortMonitor", daemon=True).start()
+
+    # as pyserial, a tty without a hardware device (virtual terminals, ptys) or whose device is
+    # a platform device (on-board UARTs that are not present) is not a serial port, others such
+    # as the /dev/ttyAMA* UARTs of the Raspberry Pi are
+    def _info(self, dev):
+        props = dev.properties
+        parent = dev.parent
+        if not dev.device_node or parent is None or parent.subsystem == "platform":
+            return None
+        links = (props.get("DEVLINKS") or "").split()
+        by_id = next((link for link in links if link.startswith("/dev/serial/by-id/")), None)
+        description = (props.get("ID_MODEL_FROM_DATABASE") or props.get("ID_MODEL") or "").replace("_", " ")
+        return port_info(dev.device_node, description, props.get("ID_SERIAL_SHORT"), by_id, props.get("ID_PATH"))
+
+
+class ListPortsSource:
+    supports_hotplug = False  # no hotplug events without pyudev
+
+    def list_devices(self):
+        from serial.tools import list_ports
+        return [port_info(p.device, p.description, p.serial_number, path=p.location)
+                for p in list_ports.comports()]
+
+
+# a stand-in for udev, devices are added and removed by calling add() and remove()
+class MockUdevSource:
+    supports_hotplug = True
+
+    def __init__(self, devices=()):
+        self.devices = {d["device"]: d for d in devices}
+        self.on_event = None
+
+    def list_devices(self):
+        return list(self.devices.values())
+
+    def monitor(self, on_event):
+        self.on_event = on_event
+
+    def add(self, info):
+        self.devices[info["device"]] = info
+        if self.on_event:
+            self.on_event("add", info)
+
+    def remove(self, device):
+        info = self.devices.pop(device)
+        if self.on_event:
+            self.on_event("remove", info)
+
+
+class PortRegistry:
+    # source defaults to UdevSource if pyudev is installed, else ListPortsSource
+    # with monitor=True the hotplug monitoring is started now, else when monitor() is called
+    def __init__(self, source=None, monitor=True):
+        if source is None:
+            source = UdevSource() if pyudev else ListPortsSource()
+        self.source = source
+        self.ports = {}  # key -> port info
+        self.pinned = {}  # search term -> key
+        self.cond = threading.Condition()
+        self.events = 0
+        self.scans = 0
+        self.hotplug = False  # True once the hotplug events keep the cache up to date
+        self.lock = threading.Lock()
+        if not (monitor and self.monitor()):
+            self.rescan()
+
+    # starts the hotplug monitoring, if the source supports it and it is not running yet
+    # returns True if the monitoring is running
+    def monitor(self):
+        with self.lock:
+            if self.hotplug or not getattr(self.source, "supports_hotplug", False):
+                return self.hotplug
+            try:
+                self.source.monitor(self._on_event)  # before the scan, so that no event is missed
+            except Exception as e:
+                print(f"Port registry: no hotplug monitoring ({e})")
+                return False
+            self.rescan()
+            with self.cond:
+                self.hotplug = True
+            return True
+
+    def rescan(self):
+        ports = {info["key"]: info for info in self.source.list_devices()}
+        with self.cond:
+            self.ports = ports
+            self.scans += 1
+            self.cond.notify_all()
+
+    # the device of the port that matches search_term, or None
+    # waits up to timeout seconds for a matching port to be added
+    def resolve(self, search_term, timeout=0.0):
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            info = self._lookup(search_term)
+            while info is None and self.hotplug:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+                info = self._lookup(search_term)
+        while info is None:
+            # without hotplug events the cache can be out of date, so scan again
+            self.rescan()
+            with self.cond:
+                info = self._lookup(search_term)
+            remaining = deadline - time.monotonic()
+            if info is None:
+                if remaining <= 0:
+                    return None
+                time.sleep(min(0.5, remaining))
+        return info["device"]
+
+    def list_ports(self):
+        with self.cond:
+            return sorted(self.ports.values(), key=lambda info: info["device"])
+
+    # called with self.cond held
+    # a pinned device is kept while it is present, else the first match in key order is pinned
+    def _lookup(self, search_term):
+        key = self.pinned.get(search_term)
+        if key in self.ports:
+            return self.ports[key]
+        for key in sorted(self.ports):
+            if matches(self.ports[key], search_term):
+                self.pinned[search_term] = key
+                return self.ports[key]
+        return None
+
+    def _on_event(self, action, info):
+        with self.cond:
+            self.events += 1
+            if action == "add":
+                self.ports[info["key"]] = info
+            else:
+                for key, port in list(self.ports.items()):
+                    if port["device"] == info["device"]:
+                        del self.ports[key]
+            self.cond.notify_all()
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+# the registry shared by the SerialComms instances of this process
+# the hotplug monitoring is only started for a long-lived user, with monitor=True
+def default_registry(monitor=False):
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = PortRegistry(monitor=False)
+    if monitor:
+        _default.monitor()
+    return _default
+
+
+def PortRegistryMain():
+    parser = argparse.ArgumentParser(description='List the serial ports, and optionally watch for changes.')
+    parser.add_argument('--watch', action='store_true', help='print the ports whenever one is added or removed')
+    args = parser.parse_args()
+    registry = PortRegistry()
+    last = None
+    while True:
+        ports = registry.list_ports()
+        if ports != last:
+            if last is not None:
+                print()
+            for info in ports:
+                print(f"{info['device']:<16} {info['key']:<60} {info['description']}")
+            if not ports:
+                print("no serial ports")
+            last = ports
+        if not args.watch:
+            break
+        with registry.cond:
+            registry.cond.wait(1.0)
+
+
+if __name__ == '__main__':
+    PortRegistryMain()
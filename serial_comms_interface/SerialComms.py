@@ -1,44 +1,310 @@
 # Python module for sending messages to a serial port
 # requirement: pip install pyserial
 # rev 1 - shabaz - July 2025
+# rev 2 - shabaz - August 2025 - persistent connection mode with reconnect
+# rev 3 - shabaz - August 2025 - paced bulk writes
+# rev 4 - shabaz - August 2025 - cached port lookup (PortRegistry.py, if present)
+# rev 5 - shabaz - August 2025 - send timings and a benchmark mode (--bench)
 
 import serial  # Note: this is the pyserial module, NOT the serial module
 import sys
 import time
 import argparse
+import json
+import threading
+from collections import deque
 from serial.tools import list_ports
+try:
+    import PortRegistry  # optional, SerialComms.py can also be used on its own
+except ImportError:
+    PortRegistry = None
 
 port_search_term = 'USB0'  # example: USB0 represents /dev/ttyUSB0
 baudrate = 115200
+parity = serial.PARITY_ODD  # the Pico UART is 8O1 (PARITY in the firmware uart_handler.h)
 
+# Pacing of the writes. The Pico firmware reads the UART one character at a time
+# from an interrupt, into a buffer of UART_IN_BUF_SIZE characters, and once a '\r'
+# has been received it ignores any input until its main loop (polled every 10 ms)
+# has shown the message on the LCD. So the characters of a message can be sent at
+# the full baud rate, but there must be a gap between messages.
+# 'chunk' pacing writes up to rx_buffer_size bytes at a time, and waits for each
+# chunk to be transmitted before the next one, either for the time the chunk takes
+# at the baud rate, or with drain=True until the OS reports it sent (flush()).
+# 'char' pacing is the original one character every char_delay seconds.
+pacing = 'chunk'
+rx_buffer_size = 128  # UART_IN_BUF_SIZE in the Pico firmware uart_handler.h
+bits_per_char = 11  # start bit, 8 data bits, parity bit, stop bit (10 if parity is PARITY_NONE)
+drain = False
+message_gap = 0.05  # seconds from the end of one message to the start of the next
+char_delay = 0.01  # seconds between characters, with 'char' pacing
+timing_samples = 10000  # open and write times kept for timings(), the oldest are dropped
+
+# returns the device of the port that matches port_search_term, or None
+# with PortRegistry.py the lookup is cached and follows the device when it is renumbered,
+# else the ports are scanned and the last match is used
+# monitor=True (for a connection that is kept open) also starts the registry's hotplug monitoring
+def find_port(monitor=False):
+    if PortRegistry:
+        return PortRegistry.default_registry(monitor).resolve(port_search_term)
+    port = None
+    ports = list_ports.comports()
+    for port_candidate in ports:
+        if port_search_term in port_candidate.description or f'tty{port_search_term}' in port_candidate.device:
+            port = port_candidate.device
+    return port
+
+# opens the port with the line settings of the firmware
+def open_port(port, timeout=1):
+    return serial.Serial(port, baudrate=baudrate, parity=parity, timeout=timeout)
+
+# called by the pty stand-ins for the Pico (PtyLoopback, pico_loopback.py): a pty has no
+# parity bit (Linux drops PARENB, and then refuses to configure the pty again), so ports
+# are opened without parity from then on, the pacing still uses bits_per_char as on the real link
+def use_pty():
+    global parity
+    parity = serial.PARITY_NONE
+
+# By default each send() opens the port and closes it again afterwards.
+# With persistent=True the port is opened once and kept open across sends (opening
+# a USB-serial port toggles DTR, which is slow and can reset the attached board).
+# In that mode sends from several threads are serialized, and if the connection
+# fails with a SerialException, it is re-opened with an exponential backoff of
+# backoff .. max_backoff seconds, up to retries times per send().
+# It can be used as a context manager, or close() can be called when done:
+#   with SerialComms(persistent=True) as comms:
+#       comms.send("HELLO")
 class SerialComms:
-    def __init__(self):
-        self.port = None
-        ports = list_ports.comports()
-        for port_candidate in ports:
-            if port_search_term in port_candidate.description or f'tty{port_search_term}' in port_candidate.device:
-                self.port = port_candidate.device
+    def __init__(self, port=None, persistent=False, retries=3, backoff=0.1, max_backoff=2.0):
+        self.fixed_port = port is not None  # otherwise the port is searched again on reconnect
+        self.port = port or find_port(monitor=persistent)
         if not self.port:
             raise RuntimeError(f"No serial port /dev/tty{port_search_term} exists.")
+        self.persistent = persistent
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.ser = None
+        self.lock = threading.Lock()
+        self.last_end = 0.0  # time.monotonic() at the end of the last message
+        # counters
+        self.sent = 0
+        self.errors = 0
+        self.reconnects = 0
+        self.bytes_sent = 0
+        self.write_seconds = 0.0  # total time spent writing, without the message gaps
+        self.open_times = deque(maxlen=timing_samples)
+        self.write_times = deque(maxlen=timing_samples)
+
+    def __enter__(self):
+        if self.persistent:
+            self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    # open the port now rather than on the first send (persistent mode)
+    def open(self):
+        with self.lock:
+            self._open()
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    def stats(self):
+        with self.lock:
+            return {"sent": self.sent, "errors": self.errors, "reconnects": self.reconnects, "bytes": self.bytes_sent}
 
+    # port open and message write times in ms (p50, p99 and max), and the bytes per
+    # second while writing, also as a fraction of what the baud rate allows
+    def timings(self):
+        with self.lock:
+            opens, writes = list(self.open_times), list(self.write_times)
+            bytes_per_sec = self.bytes_sent / self.write_seconds if self.write_seconds else 0.0
+        result = {"opens": len(opens)}
+        for name, times in (("open", opens), ("write", writes)):
+            result[f"{name}_p50_ms"] = round(percentile(times, 0.5) * 1000, 3)
+            result[f"{name}_p99_ms"] = round(percentile(times, 0.99) * 1000, 3)
+            result[f"{name}_max_ms"] = round(max(times, default=0.0) * 1000, 3)
+        result["bytes_per_sec"] = round(bytes_per_sec, 1)
+        result["line_utilization"] = round(bytes_per_sec / (baudrate / bits_per_char), 3)
+        return result
 
     def send(self, message):
-        try:
-            with serial.Serial(self.port, baudrate=baudrate, timeout=1) as ser:
-                # send message with '\r' at the end
-                for char in message:
-                    ser.write(char.encode('utf-8'))
-                    time.sleep(0.01)
-                ser.write(b'\r')
-        except serial.SerialException as e:
-            raise RuntimeError(f"send error: {e}")
+        if not self.persistent:
+            try:
+                start = time.perf_counter()
+                with open_port(self.port) as ser:
+                    self.open_times.append(time.perf_counter() - start)
+                    self._write(ser, message)
+                self.sent += 1
+            except serial.SerialException as e:
+                self.errors += 1
+                raise RuntimeError(f"send error: {e}")
+            return
+        with self.lock:
+            delay = self.backoff
+            for attempt in range(self.retries + 1):
+                try:
+                    if attempt > 0:
+                        self.reconnects += 1
+                    self._open()
+                    self._write(self.ser, message)
+                    self.sent += 1
+                    return
+                except serial.SerialException as e:
+                    self.errors += 1
+                    error = e
+                    self._close()  # the connection is re-opened on the next attempt
+                    if attempt < self.retries:
+                        time.sleep(delay)
+                        delay = min(delay * 2, self.max_backoff)
+            raise RuntimeError(f"send error: {error}")
+
+    # called with self.lock held
+    def _open(self):
+        if self.ser is None:
+            if not self.fixed_port:
+                self.port = find_port(monitor=True) or self.port  # the adapter may have come back under a new name
+            start = time.perf_counter()
+            self.ser = open_port(self.port)
+            self.open_times.append(time.perf_counter() - start)
+
+    # called with self.lock held
+    def _close(self):
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            except serial.SerialException:
+                pass
+            self.ser = None
+
+    # send message with '\r' at the end
+    def _write(self, ser, message):
+        wait = self.last_end + message_gap - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)  # the firmware is still handling the previous message
+        start = time.perf_counter()
+        data = message.encode('utf-8') + b'\r'
+        if pacing == 'char':
+            for char in message:
+                ser.write(char.encode('utf-8'))
+                if char_delay:
+                    time.sleep(char_delay)
+            ser.write(b'\r')
+        else:
+            char_time = bits_per_char / (ser.baudrate or baudrate)
+            for i in range(0, len(data), rx_buffer_size):
+                chunk = data[i:i + rx_buffer_size]
+                ser.write(chunk)
+                if drain:
+                    ser.flush()  # returns once the chunk has been transmitted
+                else:
+                    time.sleep(len(chunk) * char_time)
+        elapsed = time.perf_counter() - start
+        self.write_times.append(elapsed)
+        self.write_seconds += elapsed
+        self.bytes_sent += len(data)
+        self.last_end = time.monotonic()
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+# A pseudo-terminal stand-in for the serial port, to benchmark without hardware.
+# SerialComms writes to the port (the slave side), and a thread collects the
+# '\r' terminated messages from the master side. Unlike the Pico it reads as fast
+# as it can (pico_loopback.py has an emulation of the firmware).
+class PtyLoopback:
+    def __init__(self):
+        import os
+        import tty
+        self.os = os
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        use_pty()
+        self.messages = []
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="PtyLoopback", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        buf = b""
+        while self.running:
+            try:
+                data = self.os.read(self.master, 4096)
+            except OSError:
+                return
+            buf += data
+            *lines, buf = buf.split(b"\r")
+            self.messages.extend(line.decode("utf-8", "replace") for line in lines)
+
+    # waits until count messages have been received, returns the number received
+    def wait_for(self, count, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while len(self.messages) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return len(self.messages)
+
+    def close(self):
+        self.running = False
+        self.os.close(self.slave)
+        self.os.close(self.master)
+
+# sends count messages to port, and returns the settings, counters and timings
+# a send that still fails after the retries is counted in "failed", and the benchmark carries on
+def benchmark(port, count, persistent=True, loopback=None):
+    start = time.perf_counter()
+    comms = SerialComms(port=port, persistent=persistent)
+    failed = 0
+    with comms:
+        for i in range(count):
+            try:
+                comms.send(f"Plate s{i % 4} t{i:06d}")
+            except RuntimeError as e:
+                failed += 1
+                print(e, file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    result = {"port": "loopback" if loopback else port, "persistent": persistent, "pacing": pacing,
+              "baudrate": baudrate, "message_gap": message_gap, "messages": count, "failed": failed,
+              "seconds": round(elapsed, 3), "per_sec": round(count / elapsed, 1) if elapsed else 0.0}
+    result.update(comms.stats())
+    result.update(comms.timings())
+    if loopback:
+        result["received"] = loopback.wait_for(count)
+    return result
 
 def SerialCommsMain():
     parser = argparse.ArgumentParser(description='Send a message to a serial port.')
-    parser.add_argument('message', type=str, help='The message to send')
+    parser.add_argument('message', type=str, nargs='?', help='The message to send')
+    parser.add_argument('--port', help='serial port device (default: the port matching port_search_term)')
+    parser.add_argument('--bench', type=int, metavar='N', help='send N messages and report the timings')
+    parser.add_argument('--loopback', action='store_true', help='benchmark against a pty stand-in, no hardware needed')
+    parser.add_argument('--open-per-send', action='store_true', help='benchmark without the persistent connection')
+    parser.add_argument('--json', action='store_true', help='print the benchmark result as JSON')
     args = parser.parse_args()
-    serial_comms = SerialComms()
-    serial_comms.send(args.message)
+    if not args.bench:
+        if args.message is None:
+            parser.error('a message, or --bench N, is required')
+        serial_comms = SerialComms(port=args.port)
+        serial_comms.send(args.message)
+        return
+    loopback = PtyLoopback() if args.loopback else None
+    try:
+        result = benchmark(loopback.port if loopback else args.port, args.bench,
+                           persistent=not args.open_per_send, loopback=loopback)
+    finally:
+        if loopback:
+            loopback.close()
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for key, value in result.items():
+            print(f"{key:<18} {value}")
+    sys.exit(1 if result["failed"] else 0)
 
 if __name__ == '__main__':
     SerialCommsMain()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# Loopback test of AsyncSerialComms against the emulated Pico firmware
+# rev 1 - shabaz - August 2025
+
+# Sends messages with AsyncSerialComms to the PicoEmulator of pico_loopback.py
+# (with echo on, so there are replies to read), while a heartbeat task measures
+# how late the event loop runs it. For comparison the same is done with the
+# blocking SerialComms.send() called from a coroutine. Reports the messages
+# sent, the echoed lines read back, and the worst event loop stall.
+# example:
+#   python async_loopback.py --messages 20
+
+import argparse
+import asyncio
+import json
+import time
+import SerialComms
+from AsyncSerialComms import AsyncSerialComms
+from pico_loopback import PicoEmulator
+
+
+# records the worst lateness of a periodic wake-up, until stopped
+async def heartbeat(period, result, stop):
+    worst = 0.0
+    while not stop.is_set():
+        t = time.monotonic()
+        await asyncio.sleep(period)
+        worst = max(worst, time.monotonic() - t - period)
+    result["max_stall_ms"] = round(worst * 1000, 1)
+
+
+async def run_async(pico, messages, queue_size):
+    result = {"mode": "AsyncSerialComms"}
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(0.005, result, stop))
+    echoed = []
+    start = time.perf_counter()
+    async with AsyncSerialComms(pico.port, queue_size=queue_size) as comms:
+        async def reader():
+            async for line in comms.lines():
+                echoed.append(line)
+        read_task = asyncio.create_task(reader())
+        for message in messages:
+            await comms.send(message)  # waits while the queue is full
+        await comms.drain()
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        deadline = time.monotonic() + 2.0
+        while len(echoed) < len(messages) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        stats = comms.stats()
+    await read_task
+    stop.set()
+    await beat
+    result.update(sent=stats["sent"], echoed=len(echoed), intact=echoed == messages)
+    return result
+
+
+async def run_blocking(pico, messages):
+    result = {"mode": "SerialComms (blocking)"}
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(0.005, result, stop))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    with SerialComms.SerialComms(port=pico.port, persistent=True) as comms:
+        for message in messages:
+            comms.send(message)  # the event loop cannot run meanwhile
+            await asyncio.sleep(0)
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    stop.set()
+    await beat
+    result.update(sent=comms.stats()["sent"], echoed=None, intact=None)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AsyncSerialComms against an emulated Pico firmware")
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--queue", type=int, default=4, help="AsyncSerialComms queue size")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+    messages = [f"Plate s{i % 4} t{i}" for i in range(args.messages)]
+    pico = PicoEmulator(echo=True)
+    try:
+        results = [asyncio.run(run_async(pico, messages, args.queue))]
+        pico.wait_for(len(messages))
+        results.append(asyncio.run(run_blocking(pico, messages)))
+    finally:
+        pico.close()
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        echoed = "" if r["echoed"] is None else \
+            f", {r['echoed']} echoed lines read {'intact' if r['intact'] else 'CORRUPTED'}"
+        print(f"{r['mode']:<24} {r['sent']} sent in {r['seconds']} s{echoed}, "
+              f"worst event loop stall {r['max_stall_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
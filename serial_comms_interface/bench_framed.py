@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# Benchmark of the framed protocol against the legacy '\r' mode
+# rev 1 - shabaz - August 2025
+
+# Sends the same commands to the PicoEmulator of pico_loopback.py (a simulation
+# of the firmware receive path, including the framed mode and its receive
+# queue) over a pty, in the legacy mode with SerialComms and in the framed mode
+# with FramedSerialComms at several window sizes, optionally losing a fraction
+# of the bytes on the line. Reports the commands per second (until the last
+# command has been handled by the emulated main loop), the commands delivered
+# intact and in order, the retransmissions, and the garbage messages (received
+# but never sent, e.g. made of the bytes of a broken frame).
+# example:
+#   python bench_framed.py --commands 100 --loss 0.002
+
+import argparse
+import json
+import time
+import FramedComms
+import SerialComms
+from pico_loopback import PicoEmulator
+
+
+# number of the sent commands that were received intact and in order
+def delivered(sent, received):
+    count = 0
+    position = {message: i for i, message in enumerate(sent)}
+    last = -1
+    for message in received:
+        i = position.get(message, -1)
+        if i > last:
+            count += 1
+            last = i
+    return count
+
+
+def run(commands, handle_time, loss, window=None):
+    pico = PicoEmulator(handle_time=handle_time, loss=loss)
+    try:
+        start = time.perf_counter()
+        if window is None:
+            with SerialComms.SerialComms(port=pico.port, persistent=True) as comms:
+                for command in commands:
+                    comms.send(command)
+            stats = comms.stats()
+        else:
+            with FramedComms.FramedSerialComms(pico.port, window=window) as comms:
+                for command in commands:
+                    comms.send(command)
+                comms.flush(10.0)
+            stats = comms.stats()
+        pico.wait_for(len(commands), timeout=2.0)
+        elapsed = (pico.last_message_time or time.perf_counter()) - start
+        received = list(pico.messages)
+        pico_stats = pico.stats()
+    finally:
+        pico.close()
+    return {
+        "mode": "legacy" if window is None else f"framed window {window}",
+        "commands": len(commands),
+        "seconds": round(elapsed, 3),
+        "per_sec": round(len(commands) / elapsed, 1),
+        "delivered": delivered(commands, received),
+        "received": len(received),
+        "garbage": sum(1 for message in received if message not in set(commands)),
+        "retransmits": stats.get("retransmits", 0),
+        "timeouts": stats.get("timeouts", 0),
+        "busy": stats.get("busy", 0),
+        "lost": stats.get("lost", 0),
+        "line_bytes_lost": pico_stats["lost_chars"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Framed protocol vs legacy mode against a simulated Pico")
+    parser.add_argument("--commands", type=int, default=100)
+    parser.add_argument("--handle-time", type=float, default=0.03, help="seconds the firmware takes per command")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of the bytes lost on the line")
+    parser.add_argument("--windows", default="1,4,7", help="window sizes of the framed mode")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+    commands = [f"Plate s{i % 4} t{i}" for i in range(args.commands)]
+    results = [run(commands, args.handle_time, args.loss)]
+    for window in (int(w) for w in args.windows.split(",")):
+        results.append(run(commands, args.handle_time, args.loss, window))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"{r['mode']:<16} {r['per_sec']:7.1f} cmd/s  delivered {r['delivered']}/{r['commands']}  "
+              f"retransmits {r['retransmits']} (timeouts {r['timeouts']}, busy {r['busy']})  given up {r['lost']}  garbage {r['garbage']}  "
+              f"({r['line_bytes_lost']} bytes lost on the line)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# Benchmark of SerialComms.send() against a pseudo-terminal stand-in for the Pico
+# rev 1 - shabaz - August 2025
+
+# SerialComms writes to a pseudo-terminal (SerialComms.PtyLoopback), so no
+# hardware is needed. Messages per second are reported for a new connection per send (the
+# original behaviour) and for the persistent connection, with the original
+# 'char' pacing and with 'chunk' pacing without a message gap (the reader is not
+# the firmware, so this shows the connection overhead by itself, see
+# pico_loopback.py for the pacing against an emulation of the firmware).
+# The persistent connection is also checked with several sending threads, and
+# with the port closed under it part way through, to exercise the reconnect.
+# example:
+#   python bench_serial.py --messages 50
+
+import argparse
+import json
+import threading
+import time
+import SerialComms
+
+
+def run(port, reader, messages, persistent, threads=1, drop_at=None):
+    start_count = len(reader.messages)
+    comms = SerialComms.SerialComms(port=port, persistent=persistent, backoff=0.01)
+    expected = [f"Plate s{i % 4} t{i}" for i in range(messages)]
+    per_thread = [expected[i::threads] for i in range(threads)]
+
+    def sender(batch):
+        for n, message in enumerate(batch):
+            if drop_at is not None and n == drop_at and comms.ser is not None:
+                comms.ser.close()  # as if the adapter went away, the next send must reconnect
+            comms.send(message)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=sender, args=(batch,)) for batch in per_thread]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    comms.close()
+    reader.wait_for(start_count + messages)
+    received = reader.messages[start_count:]
+    return {
+        "messages": messages,
+        "seconds": round(elapsed, 3),
+        "per_sec": round(messages / elapsed, 1),
+        "received": len(received),
+        "intact": sorted(received) == sorted(expected),
+        **comms.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Messages per second of SerialComms over a pty")
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=4, help="sending threads for the concurrency check")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+    reader = SerialComms.PtyLoopback()
+    default_pacing, default_gap = SerialComms.pacing, SerialComms.message_gap
+    results = {}
+    try:
+        for pacing, gap in (("char", default_gap), ("chunk", 0.0)):
+            SerialComms.pacing, SerialComms.message_gap = pacing, gap
+            for persistent in (False, True):
+                name = f"{'persistent' if persistent else 'open_per_send'}_{pacing}"
+                results[name] = run(reader.port, reader, args.messages, persistent)
+        results[f"persistent_{args.threads}_threads"] = run(reader.port, reader, args.messages * 4, True,
+                                                             threads=args.threads)
+        results["persistent_reconnect"] = run(reader.port, reader, args.messages, True, drop_at=args.messages // 2)
+    finally:
+        SerialComms.pacing, SerialComms.message_gap = default_pacing, default_gap
+        reader.close()
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, r in results.items():
+        print(f"{name:<32} {r['per_sec']:>9.1f} msg/s  received {r['received']}/{r['messages']}"
+              f"{'' if r['intact'] else ' CORRUPTED'}  reconnects {r['reconnects']}")
+
+
+if __name__ == "__main__":
+    main()
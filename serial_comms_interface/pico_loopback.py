@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# Loopback test of the SerialComms pacing against an emulation of the Pico firmware
+# rev 1 - shabaz - August 2025
+
+# PicoEmulator sits on the master side of a pty, and handles the received bytes
+# the way the firmware (pi_pico_microcontroller_code/uart_handler.cpp and main.cpp)
+# does:
+#   - characters arrive no faster than the baud rate allows, and are handled one
+#     at a time, as by the UART interrupt
+#   - backspace removes a character, '\r' completes the message, and the buffer
+#     index wraps at UART_IN_BUF_SIZE
+#   - SOH or STX drops a partial message, the rest of a bad frame is dropped
+#     until the next SOH/STX, and a partial frame is dropped after a pause of
+#     FRAME_INTERBYTE_TIMEOUT
+#   - while a complete message is waiting, any further characters are discarded
+#   - the main loop polls every 10 ms, and it takes handle_time to print the
+#     message to the LCD, before the buffer is cleared
+#   - with echo=True (do_echo in the firmware) the characters are echoed back,
+#     and "\n\r" at the end of each message
+#   - frames of the framed mode (see FramedComms.py) are checked, acknowledged
+#     and put in a receive queue of RX_QUEUE_LEN - 1 messages, the main loop
+#     takes them from the queue without waiting for the next poll, and replies
+#     with the free slots when it takes one from a queue that had none left
+#   - with loss > 0, that fraction of the received bytes is lost, as on a noisy line
+# Each dropped character is counted, so the harness can check that the pacing
+# loses nothing. It sends the same messages with the original 'char' pacing and
+# with 'chunk' pacing, and reports the time taken and the speedup.
+# example:
+#   python pico_loopback.py --messages 40
+
+import argparse
+import json
+import os
+import threading
+import time
+import random
+import tty
+from collections import deque
+import FramedComms
+import SerialComms
+
+UART_IN_BUF_SIZE = 128
+FRAME_INTERBYTE_TIMEOUT = 0.01  # FRAME_INTERBYTE_TIMEOUT_US
+RX_QUEUE_LEN = 8
+
+
+class PicoEmulator:
+    def __init__(self, baudrate=SerialComms.baudrate, bits_per_char=SerialComms.bits_per_char, poll_interval=0.01, handle_time=0.03,
+                 buf_size=UART_IN_BUF_SIZE, echo=False, queue_len=RX_QUEUE_LEN, loss=0.0, seed=1):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        SerialComms.use_pty()
+        self.char_time = bits_per_char / baudrate
+        self.poll_interval = poll_interval
+        self.handle_time = handle_time
+        self.buf_size = buf_size
+        self.echo = echo
+        self.loss = loss
+        self.random = random.Random(seed)
+        # framed mode
+        self.frame = None  # the frame being received, from its SOH/STX byte
+        self.frame_discard = False  # the rest of a bad frame is dropped, until the next SOH/STX
+        self.expected_seq = 0
+        self.queue = deque()
+        self.queue_len = queue_len
+        self.credit_blocked = False  # the last reply had no free slots
+        self.frames_accepted = 0
+        self.frames_rejected = 0
+        self.frames_bad = 0
+        self.lost_chars = 0
+        self.buffer = bytearray(buf_size + 5)
+        self.index = 0
+        self.messages_bad = 0
+        self.last_char_time = 0.0
+        self.complete = None  # the complete message, until the main loop has handled it
+        self.messages = []
+        self.last_message_time = None  # time.perf_counter() when the last message was handled
+        self.received_chars = 0
+        self.dropped_chars = 0
+        self.wraps = 0
+        self.lock = threading.Lock()
+        self.running = True
+        self.threads = [threading.Thread(target=self._rx, name="PicoRx", daemon=True),
+                        threading.Thread(target=self._main_loop, name="PicoMain", daemon=True)]
+        for t in self.threads:
+            t.start()
+
+    # as handle_uart_char() of the firmware, called with self.lock held
+    def handle_char(self, c):
+        self.received_chars += 1
+        now = time.monotonic()
+        # after a pause a partial frame will not be completed, messages have no timeout
+        if now - self.last_char_time > FRAME_INTERBYTE_TIMEOUT:
+            self.frame = None
+            self.frame_discard = False
+        self.last_char_time = now
+        if self.handle_frame_char(c):
+            return
+        if self.complete is not None:
+            self.dropped_chars += 1  # a complete message is waiting, do not read more
+            return
+        if c in (8, 127):
+            if self.index > 0:
+                self.index -= 1
+                self._echo(b"\x08 \x08")
+            return
+        if c == 13:
+            self.complete = bytes(self.buffer[:self.index])
+            self.index = 0
+            self._echo(b"\n\r")
+            return
+        self.buffer[self.index] = c
+        self._echo(bytes((c,)))
+        self.index += 1
+        if self.index >= self.buf_size:
+            self.index = 0
+            self.wraps += 1
+
+    # as handle_frame_char() of the firmware, returns True if the character was part of a frame
+    def handle_frame_char(self, c):
+        if self.frame is None:
+            if c not in (FramedComms.SOH, FramedComms.STX):
+                return self.frame_discard
+            if self.index > 0:
+                self.messages_bad += 1  # SOH and STX never occur in a message
+            self.index = 0
+            self.frame_discard = False
+            self.frame = bytearray((c,))
+            return True
+        self.frame.append(c)
+        if len(self.frame) == 3 and c > FramedComms.MAX_PAYLOAD:
+            self.frames_bad += 1
+            self.frame = None
+            self.frame_discard = True
+        elif len(self.frame) >= 4 and len(self.frame) == self.frame[2] + 4:
+            frame, self.frame = bytes(self.frame), None
+            if FramedComms.crc8(frame[:-1]) != frame[-1]:
+                self.frames_bad += 1
+                self.frame_discard = True
+            else:
+                self._frame_complete(frame[0] == FramedComms.SOH, frame[1], frame[3:-1])
+        return True
+
+    def _frame_complete(self, sync, seq, payload):
+        if sync:
+            self.expected_seq = seq
+        if seq != self.expected_seq:
+            behind = (self.expected_seq - seq) & 0xff
+            if behind <= 2 * self.queue_len:
+                self._reply(FramedComms.ACK, seq)  # a retransmit, its ack was lost
+            else:
+                self._reply(FramedComms.NAK, self.expected_seq)  # an earlier frame was lost
+            self.frames_rejected += 1
+            return
+        if len(self.queue) >= self.queue_len - 1:
+            self._reply(FramedComms.BSY, seq)  # queue full
+            self.frames_rejected += 1
+            return
+        self.queue.append(payload)
+        self.expected_seq = (self.expected_seq + 1) & 0xff
+        self.frames_accepted += 1
+        self._reply(FramedComms.ACK, seq)
+
+    def _reply(self, kind, seq):
+        free = self.queue_len - 1 - len(self.queue)
+        self.credit_blocked = free == 0
+        os.write(self.master, FramedComms.encode_reply(kind, seq, free))
+
+    def _echo(self, data):
+        if self.echo:
+            os.write(self.master, data)
+
+    def wait_for(self, count, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if len(self.messages) >= count and self.complete is None:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def stats(self):
+        with self.lock:
+            return {"messages": len(self.messages), "received_chars": self.received_chars,
+                    "dropped_chars": self.dropped_chars, "wraps": self.wraps, "lost_chars": self.lost_chars,
+                    "frames_accepted": self.frames_accepted, "frames_rejected": self.frames_rejected,
+                    "frames_bad": self.frames_bad, "messages_bad": self.messages_bad}
+
+    def close(self):
+        self.running = False
+        os.close(self.slave)
+        os.close(self.master)
+
+    # the UART, one character per char_time at most
+    def _rx(self):
+        next_time = 0.0
+        while self.running:
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                return
+            next_time = max(next_time, time.monotonic())
+            for c in data:
+                next_time += self.char_time
+                ahead = next_time - time.monotonic()
+                if ahead > 0.001:
+                    time.sleep(ahead)
+                with self.lock:
+                    if self.loss and self.random.random() < self.loss:
+                        self.lost_chars += 1
+                        continue
+                    self.handle_char(c)
+
+    # the main loop of main.cpp
+    def _main_loop(self):
+        while self.running:
+            with self.lock:
+                message = self.complete
+            if message is not None:
+                time.sleep(self.handle_time)  # printf and the LCD update, input is still blocked
+                with self.lock:
+                    self.messages.append(message.decode("utf-8", "replace"))
+                    self.last_message_time = time.perf_counter()
+                    self.complete = None
+            with self.lock:
+                message = self.queue.popleft() if self.queue else None
+                if message is not None and self.credit_blocked:
+                    self._reply(FramedComms.ACK, (self.expected_seq - 1) & 0xff)  # there is a free slot now
+            if message is not None:
+                time.sleep(self.handle_time)  # the queue keeps taking frames meanwhile
+                with self.lock:
+                    self.messages.append(message.decode("utf-8", "replace"))
+                    self.last_message_time = time.perf_counter()
+                continue  # more may be queued
+            time.sleep(self.poll_interval)
+
+
+def run(pico, messages, pacing, drain=False):
+    SerialComms.pacing = pacing
+    SerialComms.drain = drain
+    start_stats = pico.stats()
+    start_count = len(pico.messages)
+    comms = SerialComms.SerialComms(port=pico.port, persistent=True)
+    start = time.perf_counter()
+    for message in messages:
+        comms.send(message)
+    elapsed = time.perf_counter() - start
+    comms.close()
+    pico.wait_for(start_count + len(messages))
+    received = pico.messages[start_count:]
+    stats = pico.stats()
+    chars = sum(len(m) + 1 for m in messages)
+    return {
+        "pacing": pacing + (" + drain" if drain else ""),
+        "messages": len(messages),
+        "seconds": round(elapsed, 3),
+        "msg_per_sec": round(len(messages) / elapsed, 1),
+        "chars_per_sec": round(chars / elapsed, 1),
+        "received": len(received),
+        "intact": received == messages,
+        "dropped_chars": stats["dropped_chars"] - start_stats["dropped_chars"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SerialComms pacing against an emulated Pico firmware")
+    parser.add_argument("--messages", type=int, default=40)
+    parser.add_argument("--length", type=int, default=100, help="length of the long messages (below UART_IN_BUF_SIZE)")
+    parser.add_argument("--handle-time", type=float, default=0.03, help="seconds the firmware takes per message (LCD)")
+    parser.add_argument("--gap", type=float, default=SerialComms.message_gap, help="SerialComms.message_gap")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+    SerialComms.message_gap = args.gap
+    # LCD sized messages and long ones, alternating
+    messages = [f"Plate s{i % 4} t{i}" if i % 2 == 0 else (f"{i:04d} " * 40)[:args.length]
+                for i in range(args.messages)]
+    pico = PicoEmulator(handle_time=args.handle_time)
+    try:
+        results = [run(pico, messages, "char"), run(pico, messages, "chunk"), run(pico, messages, "chunk", drain=True)]
+    finally:
+        pico.close()
+    base = results[0]["seconds"]
+    for r in results:
+        r["speedup"] = round(base / r["seconds"], 1) if r["seconds"] else 0.0
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"{r['pacing']:<14} {r['seconds']:8.3f} s  {r['msg_per_sec']:7.1f} msg/s  {r['chars_per_sec']:8.1f} char/s  "
+              f"received {r['received']}/{r['messages']} {'intact' if r['intact'] else 'CORRUPTED'}, "
+              f"{r['dropped_chars']} chars dropped, speedup x{r['speedup']}")
+
+
+if __name__ == "__main__":
+    main()